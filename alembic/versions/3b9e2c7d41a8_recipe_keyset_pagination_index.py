@@ -0,0 +1,32 @@
+"""recipe keyset pagination index
+
+Revision ID: 3b9e2c7d41a8
+Revises: dfa93adcffbe
+Create Date: 2025-05-12 10:14:22.418310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9e2c7d41a8'
+down_revision: Union[str, None] = 'dfa93adcffbe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_recipe_date_of_publish_recipe_id', 'recipe',
+                    ['date_of_publish', 'recipe_id'], unique=False)
+    op.create_index('ix_recipe_cusine_date_of_publish_recipe_id', 'recipe',
+                    ['cusine', 'date_of_publish', 'recipe_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipe_cusine_date_of_publish_recipe_id', table_name='recipe')
+    op.drop_index('ix_recipe_date_of_publish_recipe_id', table_name='recipe')
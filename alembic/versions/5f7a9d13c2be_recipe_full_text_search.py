@@ -0,0 +1,36 @@
+"""recipe full text search
+
+Revision ID: 5f7a9d13c2be
+Revises: 8c41f0a2d6e3
+Create Date: 2025-05-16 14:21:05.118472
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f7a9d13c2be'
+down_revision: Union[str, None] = '8c41f0a2d6e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        "CREATE VIRTUAL TABLE recipe_fts USING fts5("
+        "recipe_id UNINDEXED, name, ingredients, cooking_instructions, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "INSERT INTO recipe_fts(recipe_id, name, ingredients, cooking_instructions) "
+        "SELECT recipe_id, name, ingredients, cooking_instructions FROM recipe"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TABLE recipe_fts")
@@ -0,0 +1,61 @@
+"""recipe review aggregates
+
+Revision ID: 8c41f0a2d6e3
+Revises: 3b9e2c7d41a8
+Create Date: 2025-05-14 09:02:47.731904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41f0a2d6e3'
+down_revision: Union[str, None] = '3b9e2c7d41a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COUNTERS = {
+    'total_likes': "vote_type = 'Like'",
+    'total_dislikes': "vote_type = 'Dislike'",
+    'ratings_excellent': "ratings = 'Excellent'",
+    'ratings_very_good': "ratings = 'Very Good'",
+    'ratings_satisfactory': "ratings = 'Satisfactory'",
+    'ratings_disappointing': "ratings = 'Disappointing'",
+    'ratings_unpalatable': "ratings = 'Unpalatable'",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('recipe') as batch_op:
+        for column in COUNTERS:
+            batch_op.add_column(sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('average_rating', sa.Float(), server_default='0', nullable=False))
+
+    # backfill from the existing reviews
+    for column, condition in COUNTERS.items():
+        op.execute(
+            f"UPDATE recipe SET {column} = (SELECT count(*) FROM recipe_review "
+            f"WHERE recipe_review.recipe_id = recipe.recipe_id AND {condition})"
+        )
+    op.execute(
+        "UPDATE recipe SET average_rating = "
+        "(5.0 * ratings_excellent + 4 * ratings_very_good + 3 * ratings_satisfactory "
+        "+ 2 * ratings_disappointing + ratings_unpalatable) / "
+        "(ratings_excellent + ratings_very_good + ratings_satisfactory "
+        "+ ratings_disappointing + ratings_unpalatable) "
+        "WHERE ratings_excellent + ratings_very_good + ratings_satisfactory "
+        "+ ratings_disappointing + ratings_unpalatable > 0"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('recipe') as batch_op:
+        batch_op.drop_column('average_rating')
+        for column in reversed(list(COUNTERS)):
+            batch_op.drop_column(column)
@@ -0,0 +1,29 @@
+"""recipe review keyset index
+
+Revision ID: a4e0c6b19d73
+Revises: 5f7a9d13c2be
+Create Date: 2025-05-19 09:41:07.215634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e0c6b19d73'
+down_revision: Union[str, None] = '5f7a9d13c2be'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_recipe_review_recipe_id_date_of_publish_review_id', 'recipe_review',
+                    ['recipe_id', 'date_of_publish', 'review_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipe_review_recipe_id_date_of_publish_review_id', table_name='recipe_review')
@@ -0,0 +1,42 @@
+"""recipe and chef updated_at
+
+Revision ID: b93f1e7c2d48
+Revises: e4b8d2f6a051
+Create Date: 2025-05-29 11:05:37.214860
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b93f1e7c2d48'
+down_revision: Union[str, None] = 'e4b8d2f6a051'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ('recipe', 'chef')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # when the existing rows last changed is unknown, they start at the
+    # time of the migration
+    now = datetime.now()
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.get_bind().execute(sa.text(f'UPDATE {table} SET updated_at = :now'), {'now': now})
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
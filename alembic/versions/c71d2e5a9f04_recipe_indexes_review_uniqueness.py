@@ -0,0 +1,79 @@
+"""recipe indexes and review uniqueness
+
+Revision ID: c71d2e5a9f04
+Revises: a4e0c6b19d73
+Create Date: 2025-05-22 10:12:44.903518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c71d2e5a9f04'
+down_revision: Union[str, None] = 'a4e0c6b19d73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# recipe_review as the batch rebuild should create it, with the per column
+# UNIQUE(chef_id) and UNIQUE(recipe_id) of dfa93adcffbe when old=True.
+# Those are unnamed, SQLite can only drop them by rebuilding the table
+def _recipe_review(old:bool) -> sa.Table:
+    metadata = sa.MetaData()
+    sa.Table('chef', metadata, sa.Column('chef_id', sa.Uuid(), primary_key=True))
+    sa.Table('recipe', metadata, sa.Column('recipe_id', sa.Uuid(), primary_key=True))
+    return sa.Table('recipe_review', metadata,
+        sa.Column('review_id', sa.Uuid(), nullable=False),
+        sa.Column('recipe_id', sa.Uuid(), nullable=False),
+        sa.Column('chef_id', sa.Uuid(), nullable=False),
+        sa.Column('comment_description', sa.String(length=300), nullable=False),
+        sa.Column('date_of_publish', sa.DateTime(), nullable=False),
+        sa.Column('ratings', sa.String(), nullable=False),
+        sa.Column('vote_type', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['chef_id'], ['chef.chef_id'], ),
+        sa.ForeignKeyConstraint(['recipe_id'], ['recipe.recipe_id'], ),
+        sa.PrimaryKeyConstraint('review_id'),
+        sa.UniqueConstraint('review_id'),
+        *((sa.UniqueConstraint('chef_id'), sa.UniqueConstraint('recipe_id')) if old else ()),
+        sa.Index('ix_recipe_review_recipe_id_date_of_publish_review_id',
+                 'recipe_id', 'date_of_publish', 'review_id'),
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # dfa93adcffbe never created recipe.chef_id, databases created from
+    # the models have it. Rows from before it can not be attributed
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('recipe')}
+    if 'chef_id' not in columns:
+        with op.batch_alter_table('recipe') as batch_op:
+            batch_op.add_column(sa.Column('chef_id', sa.Uuid(), nullable=True))
+            batch_op.create_foreign_key('fk_recipe_chef_id_chef', 'chef', ['chef_id'], ['chef_id'])
+
+    # /chef_recipes, account removal and the export's chef filter, newest first
+    op.create_index('ix_recipe_chef_id_date_of_publish_recipe_id', 'recipe',
+                    ['chef_id', 'date_of_publish', 'recipe_id'], unique=False)
+    # loading and deleting a recipe's images
+    op.create_index('ix_recipe_image_recipe_id', 'recipe_image', ['recipe_id'], unique=False)
+
+    # one review per chef and recipe. The index also serves the lookups of
+    # a chef's reviews, a recipe's reviews already have the keyset index
+    with op.batch_alter_table('recipe_review', recreate='always',
+                              copy_from=_recipe_review(old=False)):
+        pass
+    op.create_index('ix_recipe_review_chef_id_recipe_id', 'recipe_review',
+                    ['chef_id', 'recipe_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipe_review_chef_id_recipe_id', table_name='recipe_review')
+    # fails when a chef or a recipe has more than one review
+    with op.batch_alter_table('recipe_review', recreate='always',
+                              copy_from=_recipe_review(old=True)):
+        pass
+    op.drop_index('ix_recipe_image_recipe_id', table_name='recipe_image')
+    op.drop_index('ix_recipe_chef_id_date_of_publish_recipe_id', table_name='recipe')
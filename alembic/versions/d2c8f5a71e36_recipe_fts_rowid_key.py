@@ -0,0 +1,36 @@
+"""recipe fts rowid key
+
+Revision ID: d2c8f5a71e36
+Revises: b93f1e7c2d48
+Create Date: 2025-06-03 09:42:18.530127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2c8f5a71e36'
+down_revision: Union[str, None] = 'b93f1e7c2d48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        "CREATE TABLE recipe_fts_key("
+        "fts_rowid INTEGER PRIMARY KEY, recipe_id CHAR(32) NOT NULL UNIQUE)"
+    )
+    # the existing index entries keep their rowids, only the key is recorded
+    op.execute(
+        "INSERT INTO recipe_fts_key(fts_rowid, recipe_id) "
+        "SELECT rowid, recipe_id FROM recipe_fts"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TABLE recipe_fts_key")
@@ -0,0 +1,100 @@
+"""coded enum columns
+
+Revision ID: e4b8d2f6a051
+Revises: c71d2e5a9f04
+Create Date: 2025-05-26 16:40:12.557201
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8d2f6a051'
+down_revision: Union[str, None] = 'c71d2e5a9f04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# label -> code, models.ENUM_CODES as of this revision. The enum member
+# names (VERY_GOOD) are accepted too, older rows may hold those
+CODES = {
+    ('recipe', 'cusine'): {'Italian': 1, 'Chinese': 2, 'Indian': 3, 'Mexican': 4, 'French': 5},
+    ('recipe_review', 'ratings'): {'Excellent': 5, 'Very Good': 4, 'Satisfactory': 3,
+                                   'Disappointing': 2, 'Unpalatable': 1},
+    ('recipe_review', 'vote_type'): {'Like': 1, 'Dislike': 0},
+}
+
+# rows converted per UPDATE, so a large table is not rewritten in one
+# statement
+BATCH_SIZE = 10000
+
+CUISINE_INDEX = 'ix_recipe_cusine_date_of_publish_recipe_id'
+
+
+def _batches(table: str):
+    bind = op.get_bind()
+    low, high = bind.execute(sa.text(f'SELECT min(rowid), max(rowid) FROM {table}')).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE
+
+
+# fills target from column in rowid ranges, labels to codes or back.
+# Fails on values that have no mapping
+def _convert(table: str, column: str, target: str, mapping: dict, source_is_label: bool):
+    bind = op.get_bind()
+    if source_is_label:
+        whens = []
+        for label, code in mapping.items():
+            names = {label.lower(), label.upper().replace(' ', '_').lower()}
+            whens += [f"WHEN '{name}' THEN {code}" for name in sorted(names)]
+        expression = f"CASE lower(trim({column})) {' '.join(whens)} END"
+    else:
+        whens = [f"WHEN {code} THEN '{label}'" for label, code in mapping.items()]
+        expression = f"CASE {column} {' '.join(whens)} END"
+    for start, stop in _batches(table):
+        bind.execute(sa.text(f'UPDATE {table} SET {target} = {expression} '
+                             f'WHERE rowid >= :start AND rowid < :stop'),
+                     {'start': start, 'stop': stop})
+    unmapped = bind.execute(sa.text(f'SELECT DISTINCT {column} FROM {table} '
+                                    f'WHERE {target} IS NULL')).scalars().all()
+    if unmapped:
+        raise RuntimeError(f'{table}.{column} has values without a mapping: {unmapped}')
+
+
+# replaces each column by its converted copy
+def _swap(table: str, columns: list[str], new_type):
+    with op.batch_alter_table(table) as batch_op:
+        for column in columns:
+            batch_op.drop_column(column)
+            batch_op.alter_column(f'{column}_new', new_column_name=column,
+                                  existing_type=new_type, nullable=False)
+
+
+def _migrate(new_type, source_is_label: bool):
+    op.drop_index(CUISINE_INDEX, table_name='recipe')
+    for table in ('recipe', 'recipe_review'):
+        columns = [column for (name, column) in CODES if name == table]
+        with op.batch_alter_table(table) as batch_op:
+            for column in columns:
+                batch_op.add_column(sa.Column(f'{column}_new', new_type, nullable=True))
+        for column in columns:
+            _convert(table, column, f'{column}_new', CODES[table, column], source_is_label)
+        _swap(table, columns, new_type)
+    op.create_index(CUISINE_INDEX, 'recipe', ['cusine', 'date_of_publish', 'recipe_id'], unique=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # cusine, ratings and vote_type as SmallInteger codes instead of their
+    # labels, see models.CodedEnum
+    _migrate(sa.SmallInteger(), source_is_label=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _migrate(sa.String(), source_is_label=False)
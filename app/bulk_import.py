@@ -0,0 +1,330 @@
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import AsyncIterator, Callable
+from models import Chef, Recipe, Recipe_Image, Recipe_Review
+from schemas import Cuisine, ImportRow, ImportRecipe, ImportReview
+from routes.recipe_logic import protection_against_xss, recount_review_aggregates
+import argparse, asyncio, json, logging, sys, uuid
+import search
+import cache
+import trending
+
+
+logger = logging.getLogger(__name__)
+
+# NDJSON import of recipes and reviews. Every line is validated on its own,
+# a bad line is reported and skipped, the good ones are inserted with one
+# executemany INSERT per table and committed every BATCH_SIZE rows. The
+# report says up to which line everything is committed, an interrupted
+# import is resumed by sending the same file again with start_line set to
+# the line after it. Recipes have to come before the reviews of them
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 256 * 1024
+MAX_LINE = 1024 * 1024
+# errors beyond this are only counted, the cli writes all of them to a file
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass(slots=True)
+class ImportReport:
+    start_line:int = 1
+    lines:int = 0
+    recipes:int = 0
+    reviews:int = 0
+    skipped:int = 0
+    error_count:int = 0
+    errors:list = field(default_factory=list)
+    last_committed_line:int = 0
+    aborted:str|None = None
+
+
+# split a stream of byte chunks into numbered lines without holding more
+# than one line in memory. A line longer than MAX_LINE comes out as None
+async def read_lines(chunks:AsyncIterator[bytes])->AsyncIterator[tuple[int,bytes|None]]:
+    buffer = bytearray()
+    line_no = 0
+    too_long = False
+    async for chunk in chunks:
+        buffer += chunk
+        while (end := buffer.find(b'\n')) >= 0:
+            line_no += 1
+            yield line_no, None if too_long else bytes(buffer[:end])
+            del buffer[:end + 1]
+            too_long = False
+        if len(buffer) > MAX_LINE:
+            buffer.clear()
+            too_long = True
+    if buffer or too_long:
+        yield line_no + 1, None if too_long else bytes(buffer)
+
+
+async def file_chunks(path:str)->AsyncIterator[bytes]:
+    with open(path,'rb') as file:
+        while chunk := await asyncio.to_thread(file.read, CHUNK_SIZE):
+            yield chunk
+
+
+def _describe(error:ValidationError)->str:
+    return '; '.join(f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}"
+                     for e in error.errors(include_url=False))
+
+
+def _parse(line:bytes|None)->ImportRecipe|ImportReview:
+    if line is None:
+        raise ValueError(f'line longer than {MAX_LINE} bytes')
+    try:
+        row = ImportRow.validate_json(line)
+    except ValidationError as e:
+        raise ValueError(_describe(e))
+    texts = ([row.name,row.ingredients,row.cooking_instructions]
+             if isinstance(row,ImportRecipe) else [row.comment_description])
+    try:
+        for value in texts:
+            protection_against_xss(value)
+    except HTTPException as e:
+        raise ValueError(e.detail)
+    return row
+
+
+class _Importer:
+    def __init__(self,
+                 session:AsyncSession,
+                 report:ImportReport,
+                 owner:tuple[uuid.UUID,str]|None,
+                 on_error:Callable[[dict],None]|None):
+        self.session = session
+        self.report = report
+        self.owner = owner
+        self.on_error = on_error
+        self.recipes:list[tuple[int,ImportRecipe]] = []
+        self.reviews:list[tuple[int,ImportReview]] = []
+
+    def error(self,line_no:int,message:str):
+        entry = {'line':line_no,'error':message}
+        self.report.error_count += 1
+        if len(self.report.errors) < MAX_REPORTED_ERRORS:
+            self.report.errors.append(entry)
+        if self.on_error:
+            self.on_error(entry)
+
+    def add(self,line_no:int,row:ImportRecipe|ImportReview):
+        # over http a row can neither point its images at arbitrary files
+        # nor backdate itself, only the cli sets these
+        if self.owner:
+            cli_only = [name for name in ('images','date_of_publish') if getattr(row,name,None)]
+            if cli_only:
+                self.error(line_no,f"{', '.join(cli_only)} can only be set by the command line import")
+                return
+        (self.recipes if isinstance(row,ImportRecipe) else self.reviews).append((line_no,row))
+
+    def __len__(self):
+        return len(self.recipes) + len(self.reviews)
+
+    # over http every row belongs to the authenticated chef, the cli looks
+    # the chef up by username
+    async def _chef_ids(self,rows)->dict[int,uuid.UUID]:
+        if self.owner:
+            owner_id,owner_name = self.owner
+            chef_ids = {}
+            for line_no,row in rows:
+                if row.chef not in (None,owner_name):
+                    self.error(line_no,'chef can only be set by the command line import')
+                else:
+                    chef_ids[line_no] = owner_id
+            return chef_ids
+
+        names = {row.chef for _,row in rows if row.chef}
+        found = {}
+        if names:
+            result = await self.session.execute(select(Chef.username,Chef.chef_id)
+                                                .where(Chef.username.in_(names)))
+            found = dict(result.all())
+        chef_ids = {}
+        for line_no,row in rows:
+            if not row.chef:
+                self.error(line_no,'chef: field required')
+            elif row.chef not in found:
+                self.error(line_no,f'chef: no chef with the username {row.chef}')
+            else:
+                chef_ids[line_no] = found[row.chef]
+        return chef_ids
+
+    # recipe_id -> cuisine of the recipes inserted
+    async def _insert_recipes(self)->dict[uuid.UUID,Cuisine]:
+        chef_ids = await self._chef_ids(self.recipes)
+        rows = [(line_no,row,row.recipe_id or uuid.uuid4())
+                for line_no,row in self.recipes if line_no in chef_ids]
+        given = [recipe_id for _,row,recipe_id in rows if row.recipe_id]
+        existing = set()
+        if given:
+            existing = set((await self.session.execute(
+                select(Recipe.recipe_id).where(Recipe.recipe_id.in_(given)))).scalars())
+
+        # every row of an executemany needs the same keys
+        now = datetime.now()
+        recipe_values,image_values,index_values = [],[],[]
+        for line_no,row,recipe_id in rows:
+            # imported before, e.g. by the run that is being resumed
+            if recipe_id in existing:
+                self.report.skipped += 1
+                continue
+            existing.add(recipe_id)
+            values = {'recipe_id':recipe_id,
+                      'name':row.name,
+                      'cusine':row.cusine,
+                      'ingredients':row.ingredients,
+                      'cooking_instructions':row.cooking_instructions,
+                      'chef_id':chef_ids[line_no],
+                      'date_of_publish':row.date_of_publish or now}
+            recipe_values.append(values)
+            image_values.extend({'image_id':uuid.uuid4(),'image_url':url,'recipe_id':recipe_id}
+                                for url in row.images)
+            index_values.append({'recipe_id':recipe_id,
+                                 'name':row.name,
+                                 'ingredients':row.ingredients,
+                                 'cooking_instructions':row.cooking_instructions})
+
+        if recipe_values:
+            await self.session.execute(insert(Recipe.__table__),recipe_values)
+        if image_values:
+            await self.session.execute(insert(Recipe_Image.__table__),image_values)
+        await search.index_recipes(self.session,index_values)
+        self.report.recipes += len(recipe_values)
+        return {values['recipe_id']:values['cusine'] for values in recipe_values}
+
+    # the reviews actually inserted, as trending.record_reviews takes them
+    async def _insert_reviews(self,new_recipes:dict[uuid.UUID,Cuisine])->list[tuple]:
+        chef_ids = await self._chef_ids(self.reviews)
+        rows = [(line_no,row) for line_no,row in self.reviews if line_no in chef_ids]
+        wanted = {row.recipe_id for _,row in rows} - new_recipes.keys()
+        known = dict(new_recipes)
+        if wanted:
+            known.update((await self.session.execute(
+                select(Recipe.recipe_id,Recipe.cusine).where(Recipe.recipe_id.in_(wanted)))).all())
+
+        now = datetime.now()
+        review_values = []
+        for line_no,row in rows:
+            if row.recipe_id not in known:
+                self.error(line_no,f'recipe_id: no recipe with the id {row.recipe_id} found')
+                continue
+            values = {'review_id':row.review_id or uuid.uuid4(),
+                      'recipe_id':row.recipe_id,
+                      'chef_id':chef_ids[line_no],
+                      'comment_description':row.comment_description,
+                      'ratings':row.ratings,
+                      'vote_type':row.vote_type,
+                      'date_of_publish':row.date_of_publish or now}
+            review_values.append(values)
+        if not review_values:
+            return []
+
+        # reviews that already exist, by review_id or by chef and recipe, are
+        # left alone and not returned, the aggregates of every touched recipe
+        # are then recounted so they are right either way
+        table = Recipe_Review.__table__
+        result = await self.session.execute(
+            sqlite_insert(table).on_conflict_do_nothing()
+            .returning(table.c.review_id,table.c.recipe_id,table.c.ratings,
+                       table.c.vote_type,table.c.date_of_publish),
+            review_values)
+        inserted = [(review_id,recipe_id,known[recipe_id],ratings,vote_type,published)
+                    for review_id,recipe_id,ratings,vote_type,published in result.all()]
+        self.report.reviews += len(inserted)
+        self.report.skipped += len(review_values) - len(inserted)
+        await self.session.execute(recount_review_aggregates({values['recipe_id'] for values in review_values}))
+        return inserted
+
+    async def flush(self,last_line:int):
+        try:
+            new_recipes = await self._insert_recipes()
+            reviews = await self._insert_reviews(new_recipes)
+            await self.session.commit()
+        except SQLAlchemyError:
+            await self.session.rollback()
+            raise
+        finally:
+            self.recipes.clear()
+            self.reviews.clear()
+        self.report.last_committed_line = last_line
+        if new_recipes or reviews:
+            await cache.invalidate_recipes(*{review[1] for review in reviews})
+            await cache.invalidate_lists()
+        await trending.record_reviews(reviews)
+
+
+async def run_import(session:AsyncSession,
+                     chunks:AsyncIterator[bytes],
+                     owner:tuple[uuid.UUID,str]|None=None,
+                     start_line:int=1,
+                     batch_size:int=BATCH_SIZE,
+                     on_error:Callable[[dict],None]|None=None)->ImportReport:
+    report = ImportReport(start_line=start_line,last_committed_line=start_line - 1)
+    importer = _Importer(session,report,owner,on_error)
+    line_no = start_line - 1
+    try:
+        async for line_no,line in read_lines(chunks):
+            if line_no < start_line:
+                continue
+            report.lines += 1
+            if line is not None and not line.strip():
+                continue
+            try:
+                importer.add(line_no,_parse(line))
+            except ValueError as e:
+                importer.error(line_no,str(e))
+            if len(importer) >= batch_size:
+                await importer.flush(line_no)
+        await importer.flush(line_no)
+    except SQLAlchemyError as e:
+        # everything up to last_committed_line is stored, the rest can be
+        # sent again from there
+        logger.exception('bulk import aborted after line %s',report.last_committed_line)
+        report.aborted = f'database error: {e.__class__.__name__}'
+    # a batch checks its recipes before its reviews
+    report.errors.sort(key=lambda entry: entry['line'])
+    return report
+
+
+# python bulk_import.py catalogue.ndjson --errors errors.ndjson
+# run from the app directory, rows name their chef by username
+async def _main(args):
+    from db import db_connection
+    import redis_client
+    await redis_client.open_redis()
+    errors = open(args.errors,'w') if args.errors else None
+    try:
+        async with db_connection.WriteSessionLocal() as session:
+            report = await run_import(session,
+                                      file_chunks(args.path),
+                                      start_line=args.start_line,
+                                      batch_size=args.batch_size,
+                                      on_error=(lambda entry: errors.write(json.dumps(entry) + '\n'))
+                                               if errors else None)
+    finally:
+        if errors:
+            errors.close()
+        await redis_client.close_redis()
+    summary = asdict(report)
+    summary.pop('errors')
+    print(json.dumps(summary,indent=2))
+    if report.aborted:
+        print(f'resume with --start-line {report.last_committed_line + 1}',file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk import recipes and reviews from NDJSON')
+    parser.add_argument('path')
+    parser.add_argument('--start-line',type=int,default=1)
+    parser.add_argument('--batch-size',type=int,default=BATCH_SIZE)
+    parser.add_argument('--errors',help='write every rejected line to this NDJSON file')
+    sys.exit(asyncio.run(_main(parser.parse_args())))
@@ -0,0 +1,160 @@
+from redis_client import get_redis, Script
+from config import settings
+from responses import dumps
+import metrics
+import redis
+import hashlib, json, logging, uuid
+
+logger = logging.getLogger(__name__)
+
+# key layout
+#   recipe:one:<id>:<n>          cached /recipe/one payload with its n latest reviews,
+#                                stored as "<etag> <json>"
+#   recipe:list:<gen>:<digest>   cached /recipe/all page for one normalized filter set,
+#                                stored as "<etag> <json>"
+#   recipe:in_lists:<id>         list keys whose payload contains the recipe
+#   recipe:epoch:<id>            write sequence number of the last change to the recipe
+#   recipe:writes                global write sequence
+#   recipe:list_gen              bumped when a recipe is created, it can show up in any list
+#
+# a reader notes recipe:writes before going to the database and only fills
+# the cache if none of the recipes it loaded changed after that point, so
+# a read racing a delete can never put the deleted recipe back in the cache.
+# A cached body is never older than the etag sent with it: both keep the
+# etag they were loaded with next to them, so a hit answers (or 304s)
+# without touching the database
+#
+# the payloads are stored encoded and the getters return the encoded json
+# (bytes), hit or miss, for the route to send as it is. Lookups are
+# counted in recipe_cache_lookups_total by cache (one, list) and result
+# (hit, miss, error)
+
+_fill = Script("""
+local seq = tonumber(ARGV[1])
+for i = 4, #ARGV do
+    local epoch = redis.call('GET', 'recipe:epoch:' .. ARGV[i])
+    if epoch and tonumber(epoch) > seq then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+for i = 4, #ARGV do
+    local members = 'recipe:in_lists:' .. ARGV[i]
+    redis.call('SADD', members, KEYS[1])
+    redis.call('EXPIRE', members, ARGV[3])
+end
+return 1
+""")
+
+# a recipe:one key left behind when recipe:in_lists:<id> expired before
+# it is unreachable anyway, the next read asks for the new version
+_invalidate = Script("""
+local seq = redis.call('INCR', 'recipe:writes')
+for i = 1, #ARGV do
+    local id = ARGV[i]
+    redis.call('SET', 'recipe:epoch:' .. id, seq, 'EX', 3600)
+    local members = 'recipe:in_lists:' .. id
+    local keys = redis.call('SMEMBERS', members)
+    for j = 1, #keys do
+        redis.call('DEL', keys[j])
+    end
+    redis.call('DEL', members)
+end
+return seq
+""")
+
+
+async def _write_seq()->int:
+    return int(await get_redis().get('recipe:writes') or 0)
+
+
+async def _read_through(name:str, key:str, seq:int, load, recipe_ids_of, ttl:int, encode=dumps)->bytes:
+    try:
+        cached = await get_redis().get(key)
+    except redis.RedisError:
+        logger.warning('recipe cache unavailable, reading from the database', exc_info=True)
+        metrics.CACHE_LOOKUPS.labels(name, 'error').inc()
+        return encode(await load())
+    if cached is not None:
+        metrics.CACHE_LOOKUPS.labels(name, 'hit').inc()
+        return cached.encode()
+
+    metrics.CACHE_LOOKUPS.labels(name, 'miss').inc()
+    payload = await load()
+    body = encode(payload)
+    try:
+        ids = [str(recipe_id) for recipe_id in recipe_ids_of(payload)]
+        await _fill(keys=[key], args=[seq, body, ttl, *ids])
+    except redis.RedisError:
+        metrics.CACHE_LOOKUPS.labels(name, 'error').inc()
+    return body
+
+
+def _tagged(loaded)->bytes:
+    etag, payload = loaded
+    return etag.encode() + b' ' + dumps(payload)
+
+
+def _untagged(tagged:bytes)->tuple[str, bytes]:
+    etag, body = tagged.split(b' ', 1)
+    return etag.decode(), body
+
+
+# load returns (etag, recipe), the result is the etag and the encoded recipe
+async def get_recipe(recipe_id:uuid.UUID, latest_reviews:int, load)->tuple[str, bytes]:
+    return _untagged(await _get_recipe(recipe_id, latest_reviews, load))
+
+
+async def _get_recipe(recipe_id:uuid.UUID, latest_reviews:int, load)->bytes:
+    if not settings.CACHE_ENABLED:
+        return _tagged(await load())
+    try:
+        seq = await _write_seq()
+    except redis.RedisError:
+        metrics.CACHE_LOOKUPS.labels('one', 'error').inc()
+        return _tagged(await load())
+    key = f'recipe:one:{recipe_id}:{latest_reviews}'
+    return await _read_through('one', key, seq, load,
+                               lambda loaded: [loaded[1].recipe_id],
+                               settings.CACHE_RECIPE_TTL, encode=_tagged)
+
+
+# filters must already be in the form the query uses, so that equivalent
+# requests share one key. load returns (etag, page), the result is the
+# etag and the encoded page
+async def get_recipe_list(filters:dict, load)->tuple[str, bytes]:
+    return _untagged(await _get_recipe_list(filters, load))
+
+
+async def _get_recipe_list(filters:dict, load)->bytes:
+    if not settings.CACHE_ENABLED:
+        return _tagged(await load())
+    try:
+        seq, gen = await get_redis().mget('recipe:writes', 'recipe:list_gen')
+    except redis.RedisError:
+        metrics.CACHE_LOOKUPS.labels('list', 'error').inc()
+        return _tagged(await load())
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    key = f'recipe:list:{int(gen or 0)}:{digest}'
+    return await _read_through('list', key, int(seq or 0), load,
+                               lambda loaded: [recipe.recipe_id for recipe in loaded[1].recipes],
+                               settings.CACHE_LIST_TTL, encode=_tagged)
+
+
+# called after the transaction that changed the recipes has committed
+async def invalidate_recipes(*recipe_ids:uuid.UUID):
+    if not settings.CACHE_ENABLED or not recipe_ids:
+        return
+    try:
+        await _invalidate(keys=[], args=[*(str(recipe_id) for recipe_id in recipe_ids)])
+    except redis.RedisError:
+        logger.error('could not invalidate cached recipes %s', recipe_ids, exc_info=True)
+
+
+async def invalidate_lists():
+    if not settings.CACHE_ENABLED:
+        return
+    try:
+        await get_redis().incr('recipe:list_gen')
+    except redis.RedisError:
+        logger.error('could not invalidate cached recipe lists', exc_info=True)
@@ -2,12 +2,82 @@ from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
-    ALGORITHM : str  
+    ALGORITHM : str
     SECRET: str
     REFRESH_SECRET:str
+    ACCESS_TOKEN_MINUTES: int = 30
+    REFRESH_TOKEN_MINUTES: int = 2
+
+    # database
+    # DB_MODE='async' runs every query on the AsyncEngine, DB_MODE='sync'
+    # keeps the old blocking Session so both can be benchmarked side by side
+    DB_MODE: str = 'async'
+    DB_URL: str = 'sqlite:///../database.db'
+    ASYNC_DB_URL: str = 'sqlite+aiosqlite:///../database.db'
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_ECHO: bool = False
+    # WAL, pragmas and a single writer connection, see db/db_connection.py
+    SQLITE_TUNED: bool = True
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    # KiB of page cache per connection
+    SQLITE_CACHE_SIZE: int = 64 * 1024
+    # seconds a write waits for the writer connection
+    DB_WRITE_TIMEOUT: int = 30
+    # read replicas as a JSON list of async urls, each with its own pool.
+    # Empty keeps every read on the primary, see db/replicas.py
+    DB_REPLICA_URLS: list[str] = []
+    DB_REPLICA_POOL_SIZE: int = 10
+    DB_REPLICA_MAX_OVERFLOW: int = 10
+    REPLICA_CHECK_INTERVAL: float = 5
+    REPLICA_CHECK_TIMEOUT: float = 1
+    READ_YOUR_WRITES_SECONDS: float = 5
+
+    # password hashing
+    BCRYPT_ROUNDS: int = 12
+    HASH_POOL_KIND: str = 'thread'
+    HASH_POOL_WORKERS: int = 4
+
+    # redis, see redis_client.py for what happens when it is slow or down
+    REDIS_URL: str = 'redis://localhost:6379/1'
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 0.5
+    REDIS_SOCKET_TIMEOUT: float = 0.25
+    REDIS_CONNECT_TIMEOUT: float = 0.25
+    REDIS_FAIL_OPEN: bool = False
+
+    # recipe read cache (seconds)
+    CACHE_ENABLED: bool = True
+    CACHE_RECIPE_TTL: int = 300
+    CACHE_LIST_TTL: int = 60
+
+    # trending feed, see trending.py
+    TRENDING_HALF_LIFE_HOURS: float = 24
+    TRENDING_MAX: int = 100
+
+    # authenticated principal cache of get_current_user
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: int = 60
+
+    # uploads (bytes)
+    MAX_IMAGE_SIZE: int = int(3.5 * 1024 * 1024)
+    MAX_RECIPE_IMAGES: int = 6
+
+    # per request profiling, off unless a token is set, see profiling.py
+    PROFILE_TOKEN: str | None = None
+    PROFILE_DIR: str = 'profiles'
+    PROFILE_KEEP: int = 50
+
+    # most reviews a recipe payload can embed, the rest are paged through
+    # /recipe/{recipe_id}/reviews
+    MAX_LATEST_REVIEWS: int = 10
+    # latest reviews per recipe of include=reviews without latest_reviews
+    INCLUDED_REVIEWS: int = 3
 
 
     class Config:
         env_file='.env'
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -1,13 +1,121 @@
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from fastapi import Request
+from config import settings
+from . import replicas
+import metrics
+import profiling
 
 
 
-DB_URL= 'sqlite:///../database.db'
+DB_URL= settings.DB_URL
+ASYNC_DB_URL = settings.ASYNC_DB_URL
 
-engine = create_engine(DB_URL,echo=True)
+
+# SQLite tuned for concurrent use, set on every new connection:
+#   WAL               readers never block on the writer and vice versa
+#   synchronous       NORMAL is durable in WAL mode except for the last
+#                     transactions before a power loss
+#   busy_timeout      a writer waits for the lock instead of failing with
+#                     "database is locked"
+#   mmap/cache_size   reads come from memory instead of read() calls
+# pysqlite's own transaction handling is switched off so the begin event
+# decides how transactions start: BEGIN IMMEDIATE on the writer takes the
+# write lock up front, a deferred BEGIN that later writes could fail with
+# SQLITE_BUSY without waiting when another write committed in between
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}',
+    f'PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}',
+    f'PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE}',
+    'PRAGMA foreign_keys=ON',
+)
+
+
+def tune_sqlite(engine:Engine,begin:str):
+    if engine.dialect.name != 'sqlite' or not settings.SQLITE_TUNED:
+        return
+
+    @event.listens_for(engine,'connect')
+    def set_pragmas(dbapi_connection,connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine,'begin')
+    def begin_transaction(connection):
+        connection.exec_driver_sql(begin)
+
+
+def _instrument(engine:Engine,name:str,begin:str):
+    tune_sqlite(engine,begin)
+    metrics.instrument_engine(engine,name)
+    profiling.instrument_engine(engine)
+
+
+# statements are counted and timed by metrics instead of being echoed,
+# DB_ECHO=true brings the statement log back for debugging
+engine = create_engine(DB_URL,
+                       echo=settings.DB_ECHO,
+                       poolclass=metrics.TimedQueuePool,
+                       pool_logging_name='sync')
+_instrument(engine,'sync','BEGIN IMMEDIATE')
 Session = sessionmaker(bind=engine,autocommit=False,autoflush=False)
 
+# reads, a pool of connections that can all run at once
+async_engine = create_async_engine(ASYNC_DB_URL,
+                                   echo=settings.DB_ECHO,
+                                   poolclass=metrics.TimedAsyncQueuePool,
+                                   pool_logging_name='read',
+                                   pool_size=settings.DB_POOL_SIZE,
+                                   max_overflow=settings.DB_MAX_OVERFLOW,
+                                   pool_timeout=settings.DB_POOL_TIMEOUT,
+                                   pool_pre_ping=True)
+_instrument(async_engine.sync_engine,'read','BEGIN')
+AsyncSessionLocal = async_sessionmaker(bind=async_engine,
+                                       autoflush=False,
+                                       expire_on_commit=False)
+
+# writes, SQLite has one writer at a time anyway so they queue for a single
+# connection in the pool instead of fighting over the lock. Any other
+# database writes through the read pool
+if async_engine.dialect.name == 'sqlite' and settings.SQLITE_TUNED:
+    write_engine = create_async_engine(ASYNC_DB_URL,
+                                       echo=settings.DB_ECHO,
+                                       poolclass=metrics.TimedAsyncQueuePool,
+                                       pool_logging_name='write',
+                                       pool_size=1,
+                                       max_overflow=0,
+                                       pool_timeout=settings.DB_WRITE_TIMEOUT,
+                                       pool_pre_ping=True)
+    _instrument(write_engine.sync_engine,'write','BEGIN IMMEDIATE')
+else:
+    write_engine = async_engine
+WriteSessionLocal = async_sessionmaker(bind=write_engine,
+                                       autoflush=False,
+                                       expire_on_commit=False)
+
+# read replicas, sized on their own since they take most of the reads
+def _replica_engine(url:str,name:str):
+    replica = create_async_engine(url,
+                                  echo=settings.DB_ECHO,
+                                  poolclass=metrics.TimedAsyncQueuePool,
+                                  pool_logging_name=name,
+                                  pool_size=settings.DB_REPLICA_POOL_SIZE,
+                                  max_overflow=settings.DB_REPLICA_MAX_OVERFLOW,
+                                  pool_timeout=settings.DB_POOL_TIMEOUT,
+                                  pool_pre_ping=True)
+    _instrument(replica.sync_engine,name,'BEGIN')
+    return replica
+
+replica_set = replicas.ReplicaSet({f'replica-{number}':_replica_engine(url,f'replica-{number}')
+                                   for number,url in enumerate(settings.DB_REPLICA_URLS)})
+
 def get_db():
     db_connection = Session()
     try:
@@ -15,3 +123,96 @@ def get_db():
     finally:
         db_connection.close()
 
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db_connection:
+        yield db_connection
+
+
+async def get_async_write_db():
+    async with WriteSessionLocal() as db_connection:
+        yield db_connection
+
+
+# reads on a healthy replica, or on the primary for a chef who just wrote
+# or when no replica is up
+async def get_routed_read_db(request:Request):
+    picked = None
+    if not await replicas.wrote_recently(replicas.requesting_chef(request)):
+        picked = replica_set.pick()
+    name,bind = picked or ('primary',async_engine)
+    metrics.READ_SESSIONS.labels(name).inc()
+    async with AsyncSessionLocal(bind=bind) as db_connection:
+        yield db_connection
+
+
+# runs before the response is sent, so the chef's next read already goes
+# to the primary
+async def get_routed_write_db(request:Request):
+    async with WriteSessionLocal() as db_connection:
+        yield db_connection
+    await replicas.mark_write(replicas.requesting_chef(request))
+
+
+# awaitable facade over the sync Session. Every call runs inline on the
+# event loop exactly like the code did before the async engine existed,
+# it is only kept so DB_MODE=sync can be benchmarked against DB_MODE=async
+class BlockingSession:
+    def __init__(self, sync_session:Session):
+        self.sync_session = sync_session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, *args, **kwargs):
+        return self.sync_session.execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return self.sync_session.scalar(*args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return self.sync_session.scalars(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return self.sync_session.get(*args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        self.sync_session.flush(*args, **kwargs)
+
+    async def refresh(self, *args, **kwargs):
+        self.sync_session.refresh(*args, **kwargs)
+
+    async def delete(self, instance):
+        self.sync_session.delete(instance)
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def close(self):
+        self.sync_session.close()
+
+
+async def get_blocking_db():
+    db_connection = BlockingSession(Session())
+    try:
+        yield db_connection
+    finally:
+        await db_connection.close()
+
+
+# the dependencies used by the routes, picked once from the settings.
+# Routes that change data take get_write_db, everything else get_read_db.
+# get_primary_db is for reads that must see every committed write, such as
+# signing in right after signing up
+if settings.DB_MODE != 'async':
+    get_read_db = get_write_db = get_primary_db = get_blocking_db
+elif replica_set:
+    get_read_db, get_write_db, get_primary_db = get_routed_read_db, get_routed_write_db, get_async_db
+else:
+    get_read_db, get_write_db, get_primary_db = get_async_db, get_async_write_db, get_async_db
@@ -0,0 +1,186 @@
+from sqlalchemy import event, make_url, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from fastapi import Request
+from jwt.exceptions import InvalidTokenError
+from config import settings
+from redis_client import get_redis
+import redis
+import asyncio, itertools, jwt, logging, time
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Read replicas. Read-only routes get a session on one of the healthy
+# replicas (round robin), writes always go to the primary.
+#
+# read-your-writes  a chef whose write went through in the last
+#                   READ_YOUR_WRITES_SECONDS reads from the primary, so
+#                   replication lag never hides their own changes. The
+#                   chef is the sub of the bearer token; the mark is kept
+#                   locally and in Redis (recent_write:<username>) for the
+#                   other workers. Without Redis such reads go to the
+#                   primary. Anonymous reads always use a replica.
+# health            every REPLICA_CHECK_INTERVAL each replica runs SELECT 1
+#                   within REPLICA_CHECK_TIMEOUT. A replica failing the
+#                   check, or a disconnect or OperationalError on one of
+#                   its connections, is ejected until a check passes again.
+#                   With no healthy replica reads fall back to the primary.
+
+KEY_PREFIX = 'recent_write:'
+
+
+class ReplicaSet:
+    def __init__(self, engines:dict[str, AsyncEngine]):
+        self.engines = engines
+        self.healthy:set[str] = set(engines)
+        self._turn = itertools.count()
+        self._checker:asyncio.Task|None = None
+        for name, engine in engines.items():
+            self._watch(name, engine)
+            metrics.REPLICA_HEALTHY.labels(name).set(1)
+
+    def __bool__(self):
+        return bool(self.engines)
+
+    def _watch(self, name:str, engine:AsyncEngine):
+        @event.listens_for(engine.sync_engine, 'handle_error')
+        def handle_error(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+                self.eject(name, context.original_exception)
+
+    def pick(self)->tuple[str, AsyncEngine]|None:
+        healthy = [name for name in self.engines if name in self.healthy]
+        if not healthy:
+            return None
+        name = healthy[next(self._turn) % len(healthy)]
+        return name, self.engines[name]
+
+    def eject(self, name:str, reason):
+        if name in self.healthy:
+            self.healthy.discard(name)
+            metrics.REPLICA_HEALTHY.labels(name).set(0)
+            logger.error('replica %s ejected: %s', name, reason)
+
+    def admit(self, name:str):
+        if name not in self.healthy:
+            self.healthy.add(name)
+            metrics.REPLICA_HEALTHY.labels(name).set(1)
+            logger.info('replica %s back in rotation', name)
+
+    async def _check_one(self, engine:AsyncEngine):
+        async with engine.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+
+    async def check(self):
+        for name, engine in self.engines.items():
+            try:
+                await asyncio.wait_for(self._check_one(engine), settings.REPLICA_CHECK_TIMEOUT)
+                self.admit(name)
+            except (DBAPIError, OSError, asyncio.TimeoutError) as e:
+                self.eject(name, str(e) or 'health check timed out')
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.REPLICA_CHECK_INTERVAL)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception('replica health check failed')
+
+    # started and stopped by the app lifespan
+    async def start(self):
+        if self.engines and self._checker is None:
+            await self.check()
+            self._checker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._checker is None:
+            return
+        self._checker.cancel()
+        try:
+            await self._checker
+        except asyncio.CancelledError:
+            pass
+        self._checker = None
+
+
+# username -> monotonic time until which their reads stay on the primary
+_recent_writes:dict[str, float] = {}
+
+
+# the username of the request's bearer token, None for anonymous or
+# invalid tokens
+def requesting_chef(request:Request)->str|None:
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.SECRET, algorithms=settings.ALGORITHM).get('sub')
+    except InvalidTokenError:
+        return None
+
+
+async def mark_write(username:str|None):
+    if username is None:
+        return
+    now = time.monotonic()
+    _recent_writes[username] = now + settings.READ_YOUR_WRITES_SECONDS
+    if len(_recent_writes) > 10000:
+        for key in [key for key, until in _recent_writes.items() if until <= now]:
+            del _recent_writes[key]
+    try:
+        await get_redis().set(f'{KEY_PREFIX}{username}', 1,
+                              px=int(settings.READ_YOUR_WRITES_SECONDS * 1000))
+    except redis.RedisError:
+        logger.warning('could not share the read-your-writes mark of %s', username, exc_info=True)
+
+
+async def wrote_recently(username:str|None)->bool:
+    if username is None:
+        return False
+    if _recent_writes.get(username, 0) > time.monotonic():
+        return True
+    try:
+        return bool(await get_redis().exists(f'{KEY_PREFIX}{username}'))
+    except redis.RedisError:
+        return True
+
+
+# Stand-in replication for trying replicas locally with SQLite files:
+# copies the primary into every replica file with the SQLite backup api,
+# once or every --every seconds.
+#
+#   cd app && DB_REPLICA_URLS='["sqlite+aiosqlite:///../replica.db"]' python -m db.replicas --every 2
+def copy_sqlite(primary_url:str, replica_urls:list[str]):
+    import sqlite3
+    source = sqlite3.connect(make_url(primary_url).database)
+    try:
+        for url in replica_urls:
+            target = sqlite3.connect(make_url(url).database)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+    finally:
+        source.close()
+
+
+def _main():
+    import argparse
+    parser = argparse.ArgumentParser(description='copy the SQLite primary into the replica files')
+    parser.add_argument('--every', type=float, default=0, help='seconds between copies, 0 copies once')
+    args = parser.parse_args()
+    if not settings.DB_REPLICA_URLS:
+        parser.error('DB_REPLICA_URLS is empty')
+    while True:
+        copy_sqlite(settings.DB_URL, settings.DB_REPLICA_URLS)
+        logger.info('copied %s to %s', settings.DB_URL, ', '.join(settings.DB_REPLICA_URLS))
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    _main()
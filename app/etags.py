@@ -0,0 +1,29 @@
+from fastapi.responses import Response
+import hashlib, json
+
+
+# Conditional GET. The etags are made from the updated_at of what a route
+# returns (plus the query that selected it) rather than from the body.
+# The chef routes answer If-None-Match with a 304 after one small version
+# query, before anything is loaded. /recipe/one and /recipe/all take
+# their etag from the rows they are loaded from and the cache keeps the
+# two together, see cache.py. They are weak: two responses with the same
+# etag show the same data, not necessarily the same bytes.
+def make_etag(*parts)->str:
+    raw = json.dumps(parts, default=str, separators=(',', ':'), sort_keys=True)
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+# weak comparison, If-None-Match can list several etags or be *
+def matches(if_none_match:str|None, etag:str)->bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque
+               for candidate in if_none_match.split(','))
+
+
+def not_modified(etag:str)->Response:
+    return Response(status_code=304, headers={'ETag': etag})
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from passlib.context import CryptContext
+from config import settings
+import asyncio
+
+
+# bcrypt__min_rounds makes needs_update() flag every hash made with a
+# lower cost than BCRYPT_ROUNDS, so raising the setting upgrades hashes
+# as chefs log in
+pwd_context=CryptContext(schemes=['bcrypt'],
+                         deprecated='auto',
+                         bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+                         bcrypt__min_rounds=settings.BCRYPT_ROUNDS)
+
+_executor = None
+
+
+# bcrypt releases the GIL while hashing so threads already scale across
+# cores, HASH_POOL_KIND=process is there for interpreters where it does not
+def get_executor():
+    global _executor
+    if _executor is None:
+        if settings.HASH_POOL_KIND == 'process':
+            _executor = ProcessPoolExecutor(max_workers=settings.HASH_POOL_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=settings.HASH_POOL_WORKERS,
+                                           thread_name_prefix='bcrypt')
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# plain module level functions so they can be pickled for the process pool
+def _hash(password:str):
+    return pwd_context.hash(password)
+
+def _verify_and_update(password:str, hashed:str):
+    return pwd_context.verify_and_update(password, hashed)
+
+
+async def hash_password(password:str)->str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _hash, password)
+
+
+# returns (valid, new_hash), new_hash is None unless the stored hash is stale
+async def verify_and_update(password:str, hashed:str)->tuple[bool, str|None]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _verify_and_update, password, hashed)
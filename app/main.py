@@ -1,15 +1,51 @@
 from fastapi import FastAPI
-from routes.chef_apis import router as chef_router 
+from fastapi.responses import ORJSONResponse
+from contextlib import asynccontextmanager
+from routes.chef_apis import router as chef_router
 from routes.recipe_apis import router as recipe_router
- 
+from routes.image_apis import router as image_router
+from routes.profile_apis import router as profile_router
+import hashing
+import redis_client
+import revocation
+import metrics
+import profiling
+from db.db_connection import replica_set
+from config import settings
+from uploads import UploadLimitMiddleware, UPLOAD_LIMITS
 
 
 
 
- 
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    hashing.get_executor()
+    await redis_client.open_redis()
+    await revocation.start()
+    await replica_set.start()
+    yield
+    await replica_set.stop()
+    await revocation.stop()
+    await redis_client.close_redis()
+    hashing.shutdown_executor()
 
 
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan,default_response_class=ORJSONResponse)
+app.add_middleware(UploadLimitMiddleware, limits=UPLOAD_LIMITS)
+# without a token the profiler is not even in the middleware stack
+if settings.PROFILE_TOKEN:
+    app.add_middleware(profiling.ProfilerMiddleware)
+# added last so it is the outermost middleware and times everything
+app.add_middleware(metrics.MetricsMiddleware)
 app.include_router(chef_router)
-app.include_router(recipe_router)
\ No newline at end of file
+app.include_router(recipe_router)
+app.include_router(image_router)
+app.include_router(profile_router)
+
+
+# Prometheus text format, for the scraper
+@app.get('/metrics',include_in_schema=False)
+async def prometheus_metrics():
+    return metrics.render()
@@ -0,0 +1,179 @@
+from prometheus_client import (Counter,
+                               Gauge,
+                               Histogram,
+                               CollectorRegistry,
+                               REGISTRY,
+                               CONTENT_TYPE_LATEST,
+                               generate_latest,
+                               multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os, time
+
+
+# Prometheus metrics, scraped from GET /metrics. With several uvicorn
+# workers set PROMETHEUS_MULTIPROC_DIR so the workers' samples are summed,
+# the pool gauges are per process and left out in that mode
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests by route template and status',
+                   ['method', 'route', 'status'])
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency',
+                            ['method', 'route'])
+IN_PROGRESS = Gauge('http_requests_in_progress', 'HTTP requests being served',
+                    ['method'], multiprocess_mode='livesum')
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'SQL statements run by one request',
+                            ['route'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', 'Time one request spent in SQL',
+                            ['route'])
+
+QUERY_LATENCY = Histogram('db_query_duration_seconds', 'SQL statement latency',
+                          ['engine', 'operation'])
+QUERY_ERRORS = Counter('db_query_errors_total', 'SQL statements that raised', ['engine'])
+POOL_WAIT = Histogram('db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection',
+                      ['engine'], buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 5, 30))
+READ_SESSIONS = Counter('db_read_sessions_total', 'Read sessions by the engine they were routed to',
+                        ['engine'])
+REPLICA_HEALTHY = Gauge('db_replica_healthy', '1 while the replica is in rotation', ['engine'],
+                        multiprocess_mode='liveall')
+
+REDIS_LATENCY = Histogram('redis_command_duration_seconds', 'Redis command latency',
+                          ['command'], buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .1, 1))
+REDIS_ERRORS = Counter('redis_command_errors_total', 'Redis commands that raised', ['command'])
+CACHE_LOOKUPS = Counter('recipe_cache_lookups_total', 'Recipe read cache lookups by result',
+                        ['cache', 'result'])
+
+OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'BEGIN', 'COMMIT', 'ROLLBACK')
+UNMATCHED = '<unmatched>'
+
+# [statements, seconds] of the request being served, set by the middleware
+_request_queries:ContextVar[list|None] = ContextVar('request_queries', default=None)
+
+
+class MetricsMiddleware:
+    def __init__(self, app:ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope:Scope, receive:Receive, send:Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        method = scope['method']
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+        IN_PROGRESS.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_PROGRESS.labels(method).dec()
+            _request_queries.reset(token)
+            # the route template, never the raw path, keeps the number of
+            # label values bounded
+            route = getattr(scope.get('route'), 'path', UNMATCHED)
+            REQUESTS.labels(method, route, str(status_code)).inc()
+            REQUEST_LATENCY.labels(method, route).observe(elapsed)
+            REQUEST_QUERIES.labels(route).observe(queries[0])
+            REQUEST_DB_TIME.labels(route).observe(queries[1])
+
+
+# pools that time how long a checkout waited for a free connection. The
+# engine label is the pool_logging_name given to create_engine
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.labels(self.logging_name or 'default').observe(time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.labels(self.logging_name or 'default').observe(time.perf_counter() - start)
+
+
+class _PoolCollector:
+    def __init__(self):
+        self.engines:dict[str, Engine] = {}
+
+    def collect(self):
+        size = GaugeMetricFamily('db_pool_size', 'Configured pool size', labels=['engine'])
+        checked_out = GaugeMetricFamily('db_pool_checked_out', 'Connections in use', labels=['engine'])
+        overflow = GaugeMetricFamily('db_pool_overflow', 'Connections open beyond pool_size', labels=['engine'])
+        for name, engine in self.engines.items():
+            pool = engine.pool
+            if isinstance(pool, QueuePool):
+                size.add_metric([name], pool.size())
+                checked_out.add_metric([name], pool.checkedout())
+                overflow.add_metric([name], max(pool.overflow(), 0))
+        yield size
+        yield checked_out
+        yield overflow
+
+
+_pools = _PoolCollector()
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    REGISTRY.register(_pools)
+
+
+def instrument_engine(engine:Engine, name:str):
+    _pools.engines[name] = engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        operation = statement.lstrip()[:8].split(None, 1)[0].upper() if statement.strip() else ''
+        QUERY_LATENCY.labels(name, operation if operation in OPERATIONS else 'OTHER').observe(elapsed)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        QUERY_ERRORS.labels(name).inc()
+        if context.connection is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
+
+
+@contextmanager
+def redis_timer(command:str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        REDIS_ERRORS.labels(command).inc()
+        raise
+    finally:
+        REDIS_LATENCY.labels(command).observe(time.perf_counter() - start)
+
+
+def render()->Response:
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,5 +1,7 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped,mapped_column, Mapped, relationship
-from sqlalchemy import DateTime,String,Date,ForeignKey
+from sqlalchemy import DateTime,String,Date,ForeignKey,Index,Float,SmallInteger
+from sqlalchemy.types import TypeDecorator
+from schemas import Cuisine, Ratings, VoteType
 import uuid
 from datetime import datetime,date
 from typing import List
@@ -8,6 +10,50 @@ class Base(DeclarativeBase):
     ...
 
 
+# the SmallInteger stored for each enum member. The codes are the stored
+# data, a member can be added with a new code but never renumbered
+ENUM_CODES = {
+    Cuisine:{Cuisine.ITALIAN:1,
+             Cuisine.CHINESE:2,
+             Cuisine.INDIAN:3,
+             Cuisine.MEXICAN:4,
+             Cuisine.FRENCH:5},
+    # the code is the score, avg(ratings) is the average rating
+    Ratings:{Ratings.EXCELLENT:5,
+             Ratings.VERY_GOOD:4,
+             Ratings.SATISFACTORY:3,
+             Ratings.DISAPPOINTING:2,
+             Ratings.UNPALATABLE:1},
+    # sum(vote_type) counts the likes
+    VoteType:{VoteType.LIKE:1,
+              VoteType.DISLIKE:0},
+}
+
+
+# an enum column stored as its SmallInteger code. Binds take members or
+# their labels ('Very Good'), results come back as members
+class CodedEnum(TypeDecorator):
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self,enum_class):
+        super().__init__()
+        self.enum_class = enum_class
+        self._codes = ENUM_CODES[enum_class]
+        self._members = {code:member for member,code in self._codes.items()}
+
+    def process_bind_param(self,value,dialect):
+        if value is None:
+            return None
+        return self._codes[self.enum_class(value)]
+
+    def process_literal_param(self,value,dialect):
+        return str(self.process_bind_param(value,dialect))
+
+    def process_result_value(self,value,dialect):
+        return None if value is None else self._members[value]
+
+
 class Chef(Base):
     __tablename__ = 'chef'
     chef_id:Mapped[uuid.UUID]=mapped_column(primary_key=True,default=lambda:uuid.uuid4(),unique=True)
@@ -16,24 +62,36 @@ class Chef(Base):
     email:Mapped[str]=mapped_column(String(100),nullable=False)
     date_of_birth:Mapped[date]=mapped_column(Date,nullable=False)
     chef_photo:Mapped[str]=mapped_column(String(),nullable=True)
+    # bumped by every change /chef/all shows, the etags are made from it
+    updated_at:Mapped[datetime]=mapped_column(DateTime,nullable=False,default=datetime.now)
     recipes:Mapped[List['Recipe']]=relationship('Recipe',back_populates='chef',cascade='all,delete-orphan')
 
 
 
 class Recipe_Review(Base):
     __tablename__='recipe_review'
+    # /recipe/{recipe_id}/reviews pages through one recipe's reviews in
+    # (date_of_publish, review_id) order. A chef reviews a recipe once, the
+    # unique index also finds all the reviews of one chef
+    __table_args__ = (
+        Index('ix_recipe_review_recipe_id_date_of_publish_review_id','recipe_id','date_of_publish','review_id'),
+        Index('ix_recipe_review_chef_id_recipe_id','chef_id','recipe_id',unique=True),
+    )
 
     review_id:Mapped[uuid.UUID] =mapped_column( default=lambda:uuid.uuid4(),primary_key=True,unique=True)
     comment_description:Mapped[str]=mapped_column(String(300),nullable=False)
     date_of_publish:Mapped[datetime] = mapped_column(DateTime,nullable=False,default=datetime.now)
-    ratings:Mapped[str]=mapped_column(String(),nullable=False)
-    vote_type: Mapped[str] = mapped_column(String(), nullable=False)
+    ratings:Mapped[Ratings]=mapped_column(CodedEnum(Ratings),nullable=False)
+    vote_type: Mapped[VoteType] = mapped_column(CodedEnum(VoteType), nullable=False)
     chef_id:Mapped[uuid.UUID]=mapped_column(ForeignKey('chef.chef_id'))
     recipe_id:Mapped[uuid.UUID]= mapped_column(ForeignKey('recipe.recipe_id'))
     recipe:Mapped['Recipe']=relationship('Recipe',back_populates='recipe_review')
  
 class Recipe_Image(Base):
     __tablename__='recipe_image'
+    __table_args__ = (
+        Index('ix_recipe_image_recipe_id','recipe_id'),
+    )
     image_id:Mapped[uuid.UUID]=mapped_column(default=lambda:uuid.uuid4(),primary_key=True,unique=True)
     image_url:Mapped[str]=mapped_column(String,nullable=True)
     recipe_id:Mapped[uuid.UUID]=mapped_column(ForeignKey('recipe.recipe_id'),nullable=False)
@@ -41,12 +99,23 @@ class Recipe_Image(Base):
 
 class Recipe(Base):
     __tablename__ = 'recipe'
+    # keyset pagination of /recipe/all walks these in
+    # (date_of_publish, recipe_id) order
+    __table_args__ = (
+        Index('ix_recipe_date_of_publish_recipe_id','date_of_publish','recipe_id'),
+        Index('ix_recipe_cusine_date_of_publish_recipe_id','cusine','date_of_publish','recipe_id'),
+        # one chef's recipes, newest first
+        Index('ix_recipe_chef_id_date_of_publish_recipe_id','chef_id','date_of_publish','recipe_id'),
+    )
     recipe_id:Mapped[uuid.UUID]=mapped_column(default=lambda:uuid.uuid4(),primary_key=True,unique=True)
     name: Mapped[str] = mapped_column(String(100))
-    cusine:Mapped[str]= mapped_column(String(),nullable=False)
+    cusine:Mapped[Cuisine]= mapped_column(CodedEnum(Cuisine),nullable=False)
     ingredients:Mapped[str]= mapped_column(String(1000),nullable=False)
     cooking_instructions:Mapped[str]=mapped_column(String(2000),nullable=False)
     date_of_publish:Mapped[datetime] = mapped_column(DateTime,nullable=False,default=datetime.now)
+    # bumped by every change to the recipe, its aggregates or its latest
+    # reviews, the etags of the recipe routes are made from it
+    updated_at:Mapped[datetime]=mapped_column(DateTime,nullable=False,default=datetime.now)
     images:Mapped[list[Recipe_Image]]=relationship(
         'Recipe_Image',back_populates='recipe',cascade='all,delete-orphan')
 
@@ -54,4 +123,29 @@ class Recipe(Base):
     chef:Mapped['Chef']=relationship('Chef',back_populates='recipes')
     recipe_review:Mapped[list[Recipe_Review]]=relationship(
         'Recipe_Review',back_populates='recipe',cascade='all,delete-orphan')
+
+    # review aggregates, kept in step with recipe_review by recipe_logic in
+    # the same transaction so reads never have to load the reviews
+    total_likes:Mapped[int]=mapped_column(default=0,server_default='0',nullable=False)
+    total_dislikes:Mapped[int]=mapped_column(default=0,server_default='0',nullable=False)
+    ratings_excellent:Mapped[int]=mapped_column(default=0,server_default='0',nullable=False)
+    ratings_very_good:Mapped[int]=mapped_column(default=0,server_default='0',nullable=False)
+    ratings_satisfactory:Mapped[int]=mapped_column(default=0,server_default='0',nullable=False)
+    ratings_disappointing:Mapped[int]=mapped_column(default=0,server_default='0',nullable=False)
+    ratings_unpalatable:Mapped[int]=mapped_column(default=0,server_default='0',nullable=False)
+    average_rating:Mapped[float]=mapped_column(Float,default=0,server_default='0',nullable=False)
+
+    # the review summary of the responses, from the aggregates above
+    @property
+    def ratings_histogram(self)->dict[str,int]:
+        return {Ratings.EXCELLENT.value:self.ratings_excellent,
+                Ratings.VERY_GOOD.value:self.ratings_very_good,
+                Ratings.SATISFACTORY.value:self.ratings_satisfactory,
+                Ratings.DISAPPOINTING.value:self.ratings_disappointing,
+                Ratings.UNPALATABLE.value:self.ratings_unpalatable}
+
+    @property
+    def total_reviews(self)->int:
+        return (self.ratings_excellent + self.ratings_very_good + self.ratings_satisfactory
+                + self.ratings_disappointing + self.ratings_unpalatable)
  
\ No newline at end of file
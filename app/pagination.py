@@ -0,0 +1,21 @@
+from fastapi import HTTPException, status
+import base64, json
+
+
+# cursors are opaque to the clients, internally they are the sort key of
+# the last row of the previous page encoded as urlsafe base64 json
+def encode_cursor(values:list)->str:
+    raw = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor:str, size:int)->list:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail='Invalid cursor')
+    return values
@@ -0,0 +1,154 @@
+from fastapi import Header, HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+from contextvars import ContextVar
+from datetime import datetime
+from config import settings
+import anyio, asyncio, cProfile, hmac, io, os, pstats, re, time
+
+
+# Opt-in profiling of single requests. Only installed when PROFILE_TOKEN is
+# set, and then only a request carrying X-Profile-Token: <token> is run
+# under cProfile. Its SQL statements are recorded with their offset and
+# duration, and the report (pstats text plus the raw .prof for snakeviz
+# and friends) is written to PROFILE_DIR, which keeps the PROFILE_KEEP
+# newest. The response carries the report name in X-Profile.
+#
+# cProfile sees the whole event loop thread, one request is profiled at a
+# time and concurrent requests on the same worker show up in it too.
+# bcrypt runs in the hashing pool and appears only as the time waited for it
+
+HEADER = b'x-profile-token'
+REPORT_NAME = re.compile(r'^[\w.-]+\.(txt|prof)$')
+TOP_FUNCTIONS = 80
+MAX_STATEMENT = 500
+
+# (start, [(offset, duration, statement), ...]) of the profiled request
+_timeline:ContextVar[tuple|None] = ContextVar('profile_timeline', default=None)
+_running = asyncio.Lock()
+
+
+def _authorized(value:str|bytes|None)->bool:
+    if not settings.PROFILE_TOKEN or value is None:
+        return False
+    if isinstance(value, str):
+        value = value.encode()
+    return hmac.compare_digest(value, settings.PROFILE_TOKEN.encode())
+
+
+# dependency of the report listing routes
+def require_token(x_profile_token:str|None = Header(None)):
+    if not settings.PROFILE_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not Found')
+    if not _authorized(x_profile_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Invalid profile token')
+
+
+def instrument_engine(engine:Engine):
+    if not settings.PROFILE_TOKEN:
+        return
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _timeline.get() is not None:
+            conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timeline = _timeline.get()
+        if timeline is None or not conn.info.get('profile_start'):
+            return
+        started = conn.info['profile_start'].pop()
+        request_start, statements = timeline
+        statements.append((started - request_start,
+                           time.perf_counter() - started,
+                           ' '.join(statement.split())[:MAX_STATEMENT]))
+
+
+class ProfilerMiddleware:
+    def __init__(self, app:ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope:Scope, receive:Receive, send:Send):
+        # the report routes take the same header, fetching reports must
+        # not push them out of the ring
+        if (scope['type'] != 'http'
+                or scope['path'].startswith('/profiles')
+                or not _authorized(dict(scope['headers']).get(HEADER))):
+            return await self.app(scope, receive, send)
+        if _running.locked():
+            return await self.app(scope, receive, _with_header(send, b'busy', None))
+
+        async with _running:
+            name = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{scope['method']}"
+            response = {'status':500}
+            statements = []
+            start = time.perf_counter()
+            token = _timeline.set((start, statements))
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, _with_header(send, name.encode(), response))
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - start
+                _timeline.reset(token)
+                route = getattr(scope.get('route'), 'path', scope['path'])
+                header = (f"{scope['method']} {route} ({scope['path']}) -> {response['status']} "
+                          f"in {elapsed * 1000:.1f} ms, {len(statements)} SQL statements "
+                          f"taking {sum(s[1] for s in statements) * 1000:.1f} ms\n")
+                await anyio.to_thread.run_sync(_write_report, name, header, profiler, statements)
+
+
+def _with_header(send:Send, value:bytes, response:dict|None)->Send:
+    async def send_with_header(message):
+        if message['type'] == 'http.response.start':
+            message['headers'] = [*message.get('headers', []), (b'x-profile', value)]
+            if response is not None:
+                response['status'] = message['status']
+        await send(message)
+    return send_with_header
+
+
+def _write_report(name:str, header:str, profiler:cProfile.Profile, statements:list):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    report = io.StringIO()
+    report.write(header)
+    report.write('\nSQL timeline (offset ms, duration ms, statement)\n')
+    for offset, duration, statement in statements:
+        report.write(f'{offset * 1000:10.2f} {duration * 1000:10.2f}  {statement}\n')
+    report.write('\n')
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+    path = os.path.join(settings.PROFILE_DIR, name)
+    with open(f'{path}.txt', 'w') as file:
+        file.write(report.getvalue())
+    profiler.dump_stats(f'{path}.prof')
+
+    # the directory is a ring of the newest PROFILE_KEEP reports
+    reports = sorted(entry for entry in os.listdir(settings.PROFILE_DIR) if entry.endswith('.txt'))
+    for old in reports[:-settings.PROFILE_KEEP]:
+        for ext in ('.txt', '.prof'):
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, old[:-4] + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_reports()->list[dict]:
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    reports = []
+    for entry in sorted(os.listdir(settings.PROFILE_DIR), reverse=True):
+        if REPORT_NAME.match(entry):
+            stat_result = os.stat(os.path.join(settings.PROFILE_DIR, entry))
+            reports.append({'name':entry, 'size':stat_result.st_size, 'created':stat_result.st_mtime})
+    return reports
+
+
+def report_path(name:str)->str:
+    path = os.path.join(settings.PROFILE_DIR, name)
+    if not REPORT_NAME.match(name) or not os.path.isfile(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Profile not found')
+    return path
@@ -1,8 +1,72 @@
-import redis
-
-redis_client = redis.Redis(
-    host="localhost",  # or your Redis server
-    port=6379,
-    db=1,
-    decode_responses=True
-)
\ No newline at end of file
+import redis.asyncio as redis
+from config import settings
+import metrics
+
+
+# One asyncio client over a BlockingConnectionPool, opened and closed by
+# the app lifespan (the bulk import cli opens its own). Every command is
+# bounded by REDIS_SOCKET_TIMEOUT and waits at most REDIS_POOL_TIMEOUT for
+# a free connection, so a slow or unreachable Redis turns into a
+# redis.RedisError quickly instead of stalling requests. What happens then:
+#   recipe cache       reads go to the database, writes skip invalidation
+#                      (entries expire after their ttl)
+#   revocation checks  refused with 503, or let through when
+#                      REDIS_FAIL_OPEN=true
+#   logout             refused with 503, a token can not be revoked
+#                      without Redis
+#   trending feed      refused with 503, reviews are still saved and the
+#                      next rebuild counts them
+
+
+# every command is timed into the redis_command_duration_seconds histogram,
+# scripts show up as EVALSHA
+class InstrumentedRedis(redis.Redis):
+    async def execute_command(self, *args, **options):
+        with metrics.redis_timer(str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+
+_client:InstrumentedRedis|None = None
+
+
+async def open_redis():
+    global _client
+    if _client is not None:
+        return
+    pool = redis.BlockingConnectionPool.from_url(
+        settings.REDIS_URL,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=30,
+        decode_responses=True)
+    _client = InstrumentedRedis(connection_pool=pool)
+
+
+async def close_redis():
+    global _client
+    if _client is None:
+        return
+    client, _client = _client, None
+    await client.aclose(close_connection_pool=True)
+
+
+def get_redis()->InstrumentedRedis:
+    if _client is None:
+        raise RuntimeError('Redis is not open, call open_redis() first')
+    return _client
+
+
+# a Lua script registered on whichever client is open when it runs
+class Script:
+    def __init__(self, source:str):
+        self.source = source
+        self._client = None
+        self._script = None
+
+    async def __call__(self, keys:list, args:list):
+        client = get_redis()
+        if client is not self._client:
+            self._client, self._script = client, client.register_script(self.source)
+        return await self._script(keys=keys, args=args)
@@ -0,0 +1,22 @@
+from fastapi.responses import Response
+from pydantic import BaseModel
+import orjson
+
+
+# JSON encoding of the responses. The response models in schemas are
+# validated from the ORM rows and encoded here in one pass by orjson,
+# which handles the uuids, datetimes and enums itself, so the payload
+# never goes through FastAPI's jsonable_encoder:
+#   - the app's default response class is ORJSONResponse, routes with a
+#     response model get it after pydantic's own serialization
+#   - cached routes return the stored bytes as a JSONBytesResponse, a
+#     hit is sent without being decoded and encoded again
+# Unset fields are left out, see Recipe_Schema_Out.latest_reviews
+def dumps(payload)->bytes:
+    if isinstance(payload, BaseModel):
+        payload = payload.model_dump(exclude_unset=True)
+    return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+
+class JSONBytesResponse(Response):
+    media_type = 'application/json'
@@ -0,0 +1,196 @@
+from redis_client import get_redis
+from config import settings
+from ttl_cache import TTLCache
+import redis
+import asyncio, logging, time
+
+logger = logging.getLogger(__name__)
+
+# In-process copy of the Redis token blacklist so every authenticated
+# request can check revocation without a round trip. Redis stays the source
+# of truth: a worker loads every blacklist:<jti> key when it starts and
+# then follows the revocations channel, on which black_list_token publishes
+# "<jti> <expires_at>". After losing the subscription the worker loads the
+# keys again, so revocations published while it was away are not missed.
+#
+# Entries are kept until expires_at, after which the token they revoke
+# would be rejected as expired anyway.
+#
+# The same subscription keeps the principal cache of get_current_user in
+# step: renaming or removing an account publishes the old username on the
+# principals channel and every worker drops it. A worker that lost the
+# subscription clears the whole cache when it is back, evictions sent in
+# the meantime are gone.
+
+CHANNEL = 'revocations'
+PRINCIPAL_CHANNEL = 'principals'
+KEY_PREFIX = 'blacklist:'
+PURGE_INTERVAL = 60
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+
+class RevocationSet:
+    def __init__(self):
+        self._expires:dict[str,float] = {}
+        self._next_purge = 0.0
+
+    def add(self, jti:str, expires_at:float):
+        self._expires[jti] = max(expires_at, self._expires.get(jti, 0))
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + PURGE_INTERVAL
+            self._expires = {key:value for key, value in self._expires.items() if value > now}
+
+    def __contains__(self, jti:str)->bool:
+        expires_at = self._expires.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def __len__(self):
+        return len(self._expires)
+
+
+revoked = RevocationSet()
+_listener:asyncio.Task|None = None
+
+# username -> chef_logic.Principal, saves the Chef lookup on every
+# authenticated request
+principal_cache = TTLCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL)
+_principal_evictions = 0
+
+
+# access tokens carry their own jti and the jti of the refresh token they
+# came from as sid, revoking the refresh token (logout) revokes both
+def is_revoked(payload:dict)->bool:
+    return any(jti in revoked for jti in (payload.get('jti'), payload.get('sid')) if jti)
+
+
+async def publish(jti:str, expires_at:float):
+    revoked.add(jti, expires_at)
+    await get_redis().publish(CHANNEL, f'{jti} {expires_at}')
+
+
+# a reader notes principal_evictions() before going to the database and
+# only caches what it loaded if nothing was evicted since, so a lookup
+# racing a rename can not put the old username back
+def principal_evictions()->int:
+    return _principal_evictions
+
+
+def cache_principal(username:str, principal, seen:int):
+    if seen == _principal_evictions:
+        principal_cache.set(username, principal)
+
+
+def _evict_principal(username:str|None):
+    global _principal_evictions
+    _principal_evictions += 1
+    if username is None:
+        principal_cache.clear()
+    else:
+        principal_cache.pop(username)
+
+
+# called after the rename or removal has committed. When the publish fails
+# the other workers keep the username for at most PRINCIPAL_CACHE_TTL
+async def evict_principal(username:str):
+    _evict_principal(username)
+    try:
+        await get_redis().publish(PRINCIPAL_CHANNEL, username)
+    except redis.RedisError:
+        logger.error('could not publish the eviction of %s', username, exc_info=True)
+
+
+async def _load_all():
+    client = get_redis()
+    now = time.time()
+    count = 0
+    batch = []
+    async for key in client.scan_iter(match=f'{KEY_PREFIX}*', count=1000):
+        batch.append(key)
+        if len(batch) == 1000:
+            count += await _load_batch(client, batch, now)
+            batch = []
+    count += await _load_batch(client, batch, now)
+    logger.info('loaded %s revoked tokens', count)
+
+
+async def _load_batch(client, keys:list, now:float)->int:
+    if not keys:
+        return 0
+    async with client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.ttl(key)
+        ttls = await pipe.execute()
+    for key, ttl in zip(keys, ttls):
+        # -2 is gone already, -1 has no expiry and is kept for a day
+        if ttl != -2:
+            revoked.add(key[len(KEY_PREFIX):], now + (ttl if ttl >= 0 else 86400))
+    return len(keys)
+
+
+def _apply(data:str):
+    try:
+        jti, expires_at = data.rsplit(' ', 1)
+        revoked.add(jti, float(expires_at))
+    except ValueError:
+        logger.warning('ignoring malformed revocation %r', data)
+
+
+async def _follow(subscribed:asyncio.Event):
+    delay = RETRY_DELAY
+    while True:
+        pubsub = None
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            # subscribe before loading so nothing published in between is lost
+            await pubsub.subscribe(CHANNEL, PRINCIPAL_CHANNEL)
+            await _load_all()
+            _evict_principal(None)
+            subscribed.set()
+            delay = RETRY_DELAY
+            async for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                if message['channel'] == PRINCIPAL_CHANNEL:
+                    _evict_principal(message['data'])
+                else:
+                    _apply(message['data'])
+        except asyncio.CancelledError:
+            raise
+        except (redis.RedisError, OSError):
+            logger.error('revocation subscription lost, retrying in %.0fs', delay, exc_info=True)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except (redis.RedisError, OSError):
+                    pass
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+# called from the lifespan, waits (a bounded time) for the first load so a
+# fresh worker does not accept revoked tokens
+async def start(wait:float=5.0):
+    global _listener
+    if _listener is not None:
+        return
+    subscribed = asyncio.Event()
+    _listener = asyncio.create_task(_follow(subscribed))
+    try:
+        await asyncio.wait_for(subscribed.wait(), wait)
+    except asyncio.TimeoutError:
+        logger.error('revoked tokens not loaded after %.0fs, continuing in the background', wait)
+
+
+async def stop():
+    global _listener
+    if _listener is None:
+        return
+    _listener.cancel()
+    try:
+        await _listener
+    except asyncio.CancelledError:
+        pass
+    _listener = None
@@ -3,8 +3,9 @@ from fastapi import (APIRouter,
                     HTTPException,
                     status,
                     Header,
-                    Form)
-from sqlalchemy.orm import Session
+                    Form,
+                    Response)
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from schemas import (Chef_Schema_In,
                     Chef_Schema_Out,
@@ -14,21 +15,21 @@ from schemas import (Chef_Schema_In,
                     UpdateUserData,
                     UpdatePhoto)
 from . import chef_logic
-from db.db_connection import get_db
+from db.db_connection import get_read_db, get_write_db, get_primary_db
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Annotated
-from datetime import timedelta
+from typing import Annotated, Optional
 from jwt.exceptions import InvalidTokenError
-from models import Chef
+from .chef_logic import Principal
+import etags
 
 router = APIRouter(prefix='/chef',tags=['chefs routes'])
 
 
 # route for creating a chef account
 @router.post('/sign_up')
-async def sign_up(user_data:Chef_Schema_In,session:Session=Depends(get_db)) -> str:
+async def sign_up(user_data:Chef_Schema_In,session:AsyncSession=Depends(get_write_db)) -> str:
     try:
-        create_account=chef_logic.sign_up(user_data,session)
+        create_account=await chef_logic.sign_up(user_data,session)
         return create_account
     except IntegrityError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail=f'error: {e.orig}')
@@ -43,16 +44,16 @@ async def sign_up(user_data:Chef_Schema_In,session:Session=Depends(get_db)) -> s
 @router.post('/sign_in')
 async def get_tokens(
     form_data:Annotated[OAuth2PasswordRequestForm,Depends()],
-    session:Session=Depends(get_db))-> Token:
+    session:AsyncSession=Depends(get_primary_db),
+    write_session:AsyncSession=Depends(get_write_db))-> Token:
     unauthoriezed_exception=HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                         detail='Invalid username or password',
                     headers={"WWW-Authenticate": "Bearer"}) 
-    user = chef_logic.authenticate_user(form_data.username,form_data.password,session)
+    user = await chef_logic.authenticate_user(form_data.username,form_data.password,session,write_session)
     if not user:
         raise unauthoriezed_exception
-    access_token = chef_logic.create_access_token(timedelta(minutes=30),data={'sub':form_data.username})
-    refresh_token = chef_logic.create_refresh_token(timedelta(minutes=2),data={'sub':form_data.username})
-    return {'token_type':'bearer', 'access_token':access_token,'refresh_token':refresh_token}
+    tokens = chef_logic.create_token_pair(form_data.username)
+    return {'token_type':'bearer', **tokens}
      
 
 
@@ -61,7 +62,7 @@ async def get_tokens(
 @router.post('/logout')
 async def logout_user(token:Annotated[str,Header()])-> dict:
     try:
-        logout = chef_logic.logout(token)
+        logout = await chef_logic.logout(token)
         return logout
     except HTTPException:
         raise
@@ -72,9 +73,9 @@ async def logout_user(token:Annotated[str,Header()])-> dict:
 # sends a refesh token
 @router.post('/new_access_token')
 async def get_access_from_refresh(token:Annotated[str,Header()], 
-                    session:Session=Depends(get_db))-> NewAccessToken:
+                    session:AsyncSession=Depends(get_primary_db))-> NewAccessToken:
     try:
-        new_acess_token = chef_logic.return_access_from_refresh(token,session)
+        new_acess_token = await chef_logic.return_access_from_refresh(token,session)
         return new_acess_token
     except HTTPException:
         raise
@@ -87,12 +88,12 @@ async def get_access_from_refresh(token:Annotated[str,Header()],
 @router.patch('/chanage_password')
 async def update_password(
                             user_data:Annotated[UpdatePassword,Form()],
-                            session:Session=Depends(get_db),
-                            user:Chef=Depends(chef_logic.get_current_user),
+                            session:AsyncSession=Depends(get_write_db),
+                            user:Principal=Depends(chef_logic.get_current_user),
                             )-> dict:
 
     try:
-        result = chef_logic.update_password(user_data,session,user)
+        result = await chef_logic.update_password(user_data,session,user)
         return result
     except IntegrityError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail=f'error: {e.orig}')
@@ -109,12 +110,12 @@ async def update_password(
 @router.patch('/update_data')
 async def update_user_data(
                             user_data:UpdateUserData,
-                            session:Session=Depends(get_db),
-                            user:Chef=Depends(chef_logic.get_current_user),
+                            session:AsyncSession=Depends(get_write_db),
+                            user:Principal=Depends(chef_logic.get_current_user),
                             ) -> dict:
 
     try:
-        result = chef_logic.update_user_data(user_data,session,user)
+        result = await chef_logic.update_user_data(user_data,session,user)
         return result
     except IntegrityError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail=f'error: {e.orig}')
@@ -129,12 +130,12 @@ async def update_user_data(
 @router.patch('/update_photo')
 async def update_user_photo(
                             photo_file:UpdatePhoto = Depends(),
-                            session:Session=Depends(get_db),
-                            user:Chef=Depends(chef_logic.get_current_user),
+                            session:AsyncSession=Depends(get_write_db),
+                            user:Principal=Depends(chef_logic.get_current_user),
                             )-> dict:
 
     try:
-        result = chef_logic.upload_photo(photo_file,session,user)
+        result = await chef_logic.upload_photo(photo_file,session,user)
         return result
     except IntegrityError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail=f'error: {e.orig}')
@@ -147,12 +148,12 @@ async def update_user_photo(
 # remove account
 @router.delete('/remove_account')
 async def remove_user_account(
-                            session:Session=Depends(get_db),
-                            user:Chef=Depends(chef_logic.get_current_user),
+                            session:AsyncSession=Depends(get_write_db),
+                            user:Principal=Depends(chef_logic.get_current_user),
                             )-> dict:
 
     try:
-        result = chef_logic.remove_account(session,user)
+        result = await chef_logic.remove_account(session,user)
         return result
     except HTTPException:
         raise
@@ -167,11 +168,18 @@ async def remove_user_account(
 
 
 
+# the etag follows the newest updated_at and the number of chefs
 @router.get('/all')
-async def get_all_chefs(session:Session=Depends(get_db),
-                user:Chef=Depends(chef_logic.get_current_user))-> list[Chef_Schema_Out]:
+async def get_all_chefs(response:Response,
+                if_none_match:Annotated[Optional[str],Header()] = None,
+                session:AsyncSession=Depends(get_read_db),
+                user:Principal=Depends(chef_logic.get_current_user))-> list[Chef_Schema_Out]:
     try:
-        get_chefs=chef_logic.all_chefs(session)
+        etag = etags.make_etag('chefs',*await chef_logic.chefs_version(session))
+        if etags.matches(if_none_match,etag):
+            return etags.not_modified(etag)
+        response.headers['ETag'] = etag
+        get_chefs=await chef_logic.all_chefs(session)
         return get_chefs
     except HTTPException:
         raise
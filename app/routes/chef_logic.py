@@ -1,50 +1,80 @@
 from fastapi import status,HTTPException,Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from schemas import (Chef_Schema_In,
                     UpdatePassword,
                     UpdateUserData,
-                    UpdatePhoto)
-from models import Chef
-from sqlalchemy import insert, select, update, delete
-from passlib.context import CryptContext
+                    UpdatePhoto,
+                    Chef_Schema_Out)
+from models import Chef, Recipe, Recipe_Review
+from sqlalchemy import insert, select, update, delete, func
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from datetime import timedelta,datetime,timezone
 from config import settings
 import uuid
-from redis_client import redis_client
+from redis_client import get_redis
+import redis
+import logging
 from jwt.exceptions import InvalidTokenError
 from typing import Annotated
-from db.db_connection import get_db
+from db.db_connection import get_primary_db
+from dataclasses import dataclass
+import hashing
+import revocation
+import uploads
+import cache
+import trending
+from .recipe_logic import recount_review_aggregates, delete_recipes
 import os, shutil
 
+logger = logging.getLogger(__name__)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/chef/sign_in')
-pwd_context=CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 ALGORITHM= settings.ALGORITHM
 SECRET = settings.SECRET
 REFRESH_SECRET = settings.REFRESH_SECRET
 
 
+# the authenticated chef as seen by the routes
+@dataclass(frozen=True, slots=True)
+class Principal:
+    username:str
+    chef_id:uuid.UUID
+
+# username -> Principal, shared with the other workers' evictions
+principal_cache = revocation.principal_cache
+
+
 # logic for creating an account
-def sign_up(chef_data:Chef_Schema_In,session:Session):
+async def sign_up(chef_data:Chef_Schema_In,session:AsyncSession):
     stmt = insert(Chef).values(
         username=chef_data.username,
-        password=pwd_context.hash(chef_data.password),
+        password=await hashing.hash_password(chef_data.password),
         email=chef_data.email,
         date_of_birth=chef_data.date_of_birth
         )
-    session.execute(stmt)
-    session.commit()
+    await session.execute(stmt)
+    await session.commit()
     return 'account successfully saved'
 
 # authenticate the user 
-def authenticate_user(username:str,password:str,session:Session):
-    user = session.execute(select(Chef).where(Chef.username==username)).scalar()
+# the lookup and the bcrypt check run on the read session, only the rare
+# hash upgrade goes through the writer
+async def authenticate_user(username:str,password:str,session:AsyncSession,write_session:AsyncSession):
+    user = (await session.execute(select(Chef).where(Chef.username==username))).scalar()
     if not user:
         return False
-    if not pwd_context.verify(password,user.password):
+    valid, new_hash = await hashing.verify_and_update(password,user.password)
+    if not valid:
         return False
+    # the stored hash was made with an outdated cost, upgrade it
+    # now that we know the plain password
+    if new_hash:
+        await write_session.execute(update(Chef)
+                                    .where(Chef.chef_id==user.chef_id)
+                                    .values(password=new_hash))
+        await write_session.commit()
     return user
 
 
@@ -52,30 +82,68 @@ def authenticate_user(username:str,password:str,session:Session):
 def create_access_token(expires_delta:timedelta,data:dict):
     to_encode = data.copy()
     expires = datetime.now(timezone.utc) + expires_delta
-    to_encode.update({'exp': expires})
+    to_encode.update({'exp': expires,'jti':str(uuid.uuid4())})
     access_token = jwt.encode(to_encode,SECRET,algorithm=ALGORITHM)
     return access_token
 
 # create refresh token
-def create_refresh_token(expires_delta:timedelta,data:dict):
+def create_refresh_token(expires_delta:timedelta,data:dict,jti:str|None=None):
     to_encode = data.copy()
     expires = datetime.now(timezone.utc) + expires_delta
-    jti = str(uuid.uuid4())
+    jti = jti or str(uuid.uuid4())
     to_encode.update({'exp':expires,'jti':jti})
     refresh_token = jwt.encode(to_encode,REFRESH_SECRET,algorithm=ALGORITHM)
     return refresh_token
 
-#  black list the token
-def black_list_token(jti:str,ttl:int):
-    redis_client.setex(f'blacklist:{jti}',ttl,'true')
+# the refresh token's jti doubles as the session id (sid) of the access
+# tokens issued with and from it, so logging out revokes those as well
+def create_token_pair(username:str)->dict:
+    session_id = str(uuid.uuid4())
+    refresh_token = create_refresh_token(timedelta(minutes=settings.REFRESH_TOKEN_MINUTES),
+                                         data={'sub':username},
+                                         jti=session_id)
+    access_token = create_access_token(timedelta(minutes=settings.ACCESS_TOKEN_MINUTES),
+                                       data={'sub':username,'sid':session_id})
+    return {'access_token':access_token,'refresh_token':refresh_token}
+
+
+# revoked refresh tokens are kept as blacklist:<jti> until they, and the
+# access tokens issued from them, would have expired anyway. Returns False
+# when the token was already revoked
+async def black_list_token(jti:str,ttl:int)->bool:
+    ttl = max(ttl,settings.ACCESS_TOKEN_MINUTES * 60)
+    try:
+        # one atomic round trip, two concurrent logouts can not both win
+        if not await get_redis().set(f'blacklist:{jti}','true',ex=ttl,nx=True):
+            return False
+    except redis.RedisError:
+        logger.error('could not revoke token %s', jti, exc_info=True)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail='Token revocation is unavailable, try again later')
+    try:
+        await revocation.publish(jti,datetime.now(timezone.utc).timestamp() + ttl)
+    except redis.RedisError:
+        # the key is stored, other workers pick it up when they reload
+        logger.error('could not publish the revocation of %s', jti, exc_info=True)
+    return True
 
 # check to see if the token is blacklisted
-def is_token_blacklisted(jti:str)->bool:
-    return redis_client.exists(f'blacklist:{jti}') == 1
+async def is_token_blacklisted(jti:str)->bool:
+    if jti in revocation.revoked:
+        return True
+    try:
+        return await get_redis().exists(f'blacklist:{jti}') == 1
+    except redis.RedisError:
+        if settings.REDIS_FAIL_OPEN:
+            logger.warning('revocation check skipped for %s, redis unavailable', jti, exc_info=True)
+            return False
+        logger.error('revocation check failed for %s', jti, exc_info=True)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail='Token revocation check is unavailable, try again later')
 
 
 # logout the user
-def logout(token:str):
+async def logout(token:str):
     try:
         payload = jwt.decode(token,REFRESH_SECRET,algorithms=ALGORITHM)
         jti = payload.get('jti')
@@ -83,37 +151,38 @@ def logout(token:str):
         if not jti or not exp:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail='Invalid token')
-        if redis_client.exists(f'blacklist:{jti}')==1:
+        ttl = exp - int(datetime.now(timezone.utc).timestamp())
+        if not await black_list_token(jti,ttl):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail='Token already blacklisted')
-        ttl = exp - int(datetime.now(timezone.utc).timestamp())
-        black_list_token(jti,ttl)
         return {'success':'Logged out successfully'}
     except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid token")
 
 # get a new access token when the client provides a refesh token
-def return_access_from_refresh(token:str,session:Session):
+async def return_access_from_refresh(token:str,session:AsyncSession):
     try:
         payload = jwt.decode(token,REFRESH_SECRET,algorithms=ALGORITHM)
-        user = payload.get('sub')
+        username = payload.get('sub')
         jti = payload.get('jti')
-        username_in_db = session.execute(select(Chef.username).where(Chef.username==user)).scalar()
+        username_in_db = (await session.execute(select(Chef.username).where(Chef.username==username))).scalar()
         if not jti or not username_in_db:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail='Invalid Token')
-        if is_token_blacklisted(jti):
+        if await is_token_blacklisted(jti):
             raise HTTPException(status_code=401, detail="Token has been revoked")
 
-        access_token = create_access_token(timedelta(minutes=30),data={'sub':username_in_db})
+        access_token = create_access_token(timedelta(minutes=settings.ACCESS_TOKEN_MINUTES),
+                                           data={'sub':username_in_db,'sid':jti})
         return {'access_token':access_token}
 
     except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
  
-# extract the user from the token
-def get_current_user(token:Annotated[str,Depends(oauth2_scheme)],
-                    session: Session = Depends(get_db)):
+# extract the user from the token, looked up on the primary since a chef
+# who just signed up may not be on the replicas yet
+async def get_current_user(token:Annotated[str,Depends(oauth2_scheme)],
+                    session: AsyncSession = Depends(get_primary_db)):
         credentials_exception = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
     detail="Could not validate credentials",
@@ -127,101 +196,134 @@ def get_current_user(token:Annotated[str,Depends(oauth2_scheme)],
                 raise credentials_exception
         except InvalidTokenError:
             raise credentials_exception
-        username_from_db = session.execute(select(Chef.username).where(Chef.username==username)).scalar_one()
-        if username_from_db is None:
+        # local set kept in step with Redis, no round trip
+        if revocation.is_revoked(payload):
             raise credentials_exception
-        return username_from_db 
+        principal = principal_cache.get(username)
+        if principal is None:
+            seen = revocation.principal_evictions()
+            chef_id = (await session.execute(select(Chef.chef_id).where(Chef.username==username))).scalar()
+            if chef_id is None:
+                raise credentials_exception
+            principal = Principal(username=username, chef_id=chef_id)
+            revocation.cache_principal(username, principal, seen)
+        return principal
 
 
 # update the users' password
-def update_password(data:UpdatePassword,session:Session,user:Chef):
+async def update_password(data:UpdatePassword,session:AsyncSession,user:Principal):
+    new_hash = await hashing.hash_password(data.new_password)
     stmt = (update(Chef)
-            .where(Chef.username == user)
-            .values(password=pwd_context.hash(data.new_password)))
-    result = session.execute(stmt)
+            .where(Chef.chef_id == user.chef_id)
+            .values(password=new_hash))
+    result = await session.execute(stmt)
     if result.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f'no user with the username {user} found.')
-    session.commit()
+                            detail=f'no user with the username {user.username} found.')
+    await session.commit()
     return {'success':'password updated'}
 
 
 
-def update_user_data(data:UpdateUserData,session:Session,user:Chef):
+async def update_user_data(data:UpdateUserData,session:AsyncSession,user:Principal):
     stmt = (update(Chef)
-            .where(Chef.username==user)
+            .where(Chef.chef_id==user.chef_id)
             .values(username=data.username,
                     date_of_birth=data.date_of_birth,
-                    email=data.email))
-    result = session.execute(stmt)
+                    email=data.email,
+                    updated_at=datetime.now()))
+    result = await session.execute(stmt)
     if result.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
-    session.commit()
+    await session.commit()
+    await revocation.evict_principal(user.username)
     return {'success':'data updated'}
 
 
 # add a photo to the user account
 # in a production base app the photos will be uploaded in a 
 # cloud service and the url of the photo is still saved in the db
-def upload_photo(photo_file:UpdatePhoto,session:Session,user:Chef):
-    MAX_FILE_SIZE = 3.5 * 1024 * 1024 
-        # --- Check file size ---
-    photo_file.photo.file.seek(0, os.SEEK_END)
-    file_size = photo_file.photo.file.tell()
-    photo_file.photo.file.seek(0)  # Reset file pointer
-
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail="File size exceeds 3.5 MB limit"
-        )
-
+async def upload_photo(photo_file:UpdatePhoto,session:AsyncSession,user:Principal):
     DIR = 'uploads/chefs'
-    IMG_DIR = os.path.join(DIR,user)
-    os.makedirs(IMG_DIR,exist_ok=True)
+    IMG_DIR = os.path.join(DIR,str(user.chef_id))
+
+    # the size limit is enforced while the photo is streamed to disk and the
+    # file only replaces the old one once the new path is committed. The
+    # transaction only starts once the upload is on disk
+    async with uploads.ingest([photo_file.photo],IMG_DIR,settings.MAX_IMAGE_SIZE) as (file_path,):
+        old_photo = (await session.execute(select(Chef.chef_photo).where(Chef.chef_id==user.chef_id))).scalar()
+        stmt = (update(Chef)
+                .where(Chef.chef_id==user.chef_id)
+                .values(chef_photo=file_path,updated_at=datetime.now()))
+        result = await session.execute(stmt)
+        if result.rowcount == 0:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
+        await session.commit()
+
     # --- Delete old photo if it exists ---
-    chef_photo = session.execute(select(Chef.chef_photo).where(Chef.username==user)).scalar()
-    if chef_photo and os.path.exists(chef_photo):
+    if old_photo and old_photo != file_path and os.path.exists(old_photo):
             try:
-                os.remove(chef_photo)
+                os.remove(old_photo)
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Failed to remove old photo: {str(e)}")
-
-    file_path = os.path.join(IMG_DIR,photo_file.photo.filename)
-    with open(file_path,'wb') as buffer:
-        shutil.copyfileobj(photo_file.photo.file,buffer)
-
-    stmt = (update(Chef)
-            .where(Chef.username==user)
-            .values(chef_photo=file_path))
-    result = session.execute(stmt)
-    if result.rowcount == 0:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
-    session.commit()
     return {'success':'photo updated'}
 
 
 
-def remove_account(session:Session,user:Chef):
-    chef_photo = session.execute(select(Chef.chef_photo).where(Chef.username==user)).scalar()
-    stmt = delete(Chef).where(Chef.username==user)
-    result = session.execute(stmt)
+async def remove_account(session:AsyncSession,user:Principal):
+    chef_photo = (await session.execute(select(Chef.chef_photo).where(Chef.chef_id==user.chef_id))).scalar()
+    # remove the chef's reviews and recount the aggregates of the recipes
+    # they were on, all in the same transaction as the account delete
+    chef_id = user.chef_id
+    reviews = (await session.execute(delete(Recipe_Review)
+                                     .where(Recipe_Review.chef_id==chef_id)
+                                     .returning(Recipe_Review.review_id,
+                                                Recipe_Review.recipe_id,
+                                                Recipe_Review.ratings,
+                                                Recipe_Review.vote_type,
+                                                Recipe_Review.date_of_publish))).all()
+    reviewed = {review.recipe_id for review in reviews}
+    cuisines = {}
+    if reviewed:
+        await session.execute(recount_review_aggregates(reviewed))
+        cuisines = dict((await session.execute(select(Recipe.recipe_id,Recipe.cusine)
+                                               .where(Recipe.recipe_id.in_(reviewed)))).all())
+    # the chef's own recipes go with the account
+    recipe_ids = list((await session.execute(select(Recipe.recipe_id)
+                                             .where(Recipe.chef_id==chef_id))).scalars())
+    own = set(recipe_ids)
+    await delete_recipes(session,recipe_ids)
+    stmt = delete(Chef).where(Chef.chef_id==user.chef_id)
+    result = await session.execute(stmt)
     if result.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f'No user with the name {user} found.')
-    
-    user_folder = os.path.join('uploads', user)
-    if chef_photo and os.path.exists(user_folder):
-        try:
-            shutil.rmtree(user_folder)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to remove user folder: {str(e)}")
-
-    session.commit()
+                            detail=f'No user with the name {user.username} found.')
+
+    await session.commit()
+    # the files go only once the account is gone, a failed commit must
+    # not leave the row pointing at a deleted photo
+    user_folder = os.path.join('uploads/chefs', str(user.chef_id))
+    shutil.rmtree(user_folder, ignore_errors=True)
+    shutil.rmtree(os.path.join('uploads/recipes', str(user.chef_id)), ignore_errors=True)
+    if chef_photo and os.path.exists(chef_photo):
+        os.remove(chef_photo)
+    await revocation.evict_principal(user.username)
+    await cache.invalidate_recipes(*reviewed,*recipe_ids)
+    # the chef's reviews of their own recipes go with the recipes
+    await trending.remove_reviews([(review.review_id,review.recipe_id,cuisines[review.recipe_id],
+                                    review.ratings,review.vote_type,review.date_of_publish)
+                                   for review in reviews if review.recipe_id not in own])
+    await trending.remove_recipes(*recipe_ids)
     return {'success':'account removed'}
 
 
 
-def all_chefs(session:Session):
-    chefs = session.execute(select(Chef)).scalars().all()
-    return chefs
\ No newline at end of file
+# version of the chef list for its etag, the password is not part of
+# the response and does not count
+async def chefs_version(session:AsyncSession):
+    return (await session.execute(select(func.max(Chef.updated_at),func.count()))).one()
+
+
+async def all_chefs(session:AsyncSession)->list[Chef_Schema_Out]:
+    chefs = (await session.execute(select(Chef))).scalars().all()
+    return [Chef_Schema_Out.model_validate(chef) for chef in chefs]
\ No newline at end of file
@@ -0,0 +1,27 @@
+from fastapi import (APIRouter,
+                    Header,
+                    HTTPException)
+from typing import Annotated, Optional
+from . import image_logic
+
+
+router = APIRouter(prefix='/uploads',tags=['images routes'])
+
+
+# serves the files saved under uploads/, the image_url stored for recipe
+# images and chef photos is the path of this route. Never touches the db.
+# GET and HEAD are separate routes so each gets its own operation id
+@router.get('/{image_path:path}')
+@router.head('/{image_path:path}')
+async def get_image(
+    image_path:str,
+    if_none_match:Annotated[Optional[str],Header()] = None,
+    if_modified_since:Annotated[Optional[str],Header()] = None,
+    ):
+    try:
+        return await image_logic.serve_image(image_path,if_none_match,if_modified_since)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,
+                            detail=f"An error occurred: {str(e)}")
@@ -0,0 +1,74 @@
+from fastapi import HTTPException, status
+from starlette.responses import FileResponse, Response
+from email.utils import formatdate, parsedate_to_datetime
+import anyio, os, re, stat
+
+
+UPLOADS_DIR = os.path.realpath('uploads')
+ALLOWED_EXT = ('.jpg', '.jpeg', '.png')
+# files written by uploads.ingest are named after the sha256 of their content
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=300, must-revalidate'
+
+
+def resolve(image_path:str)->str:
+    full_path = os.path.realpath(os.path.join(UPLOADS_DIR, image_path))
+    name = os.path.basename(full_path)
+    if (os.path.commonpath([full_path, UPLOADS_DIR]) != UPLOADS_DIR
+            or name.startswith('.')
+            or not name.lower().endswith(ALLOWED_EXT)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Image not found')
+    return full_path
+
+
+# strong validators: a content addressed name is the hash of the bytes,
+# anything else changes its tag whenever the file is replaced
+def etag_for(full_path:str, stat_result:os.stat_result)->str:
+    stem = os.path.splitext(os.path.basename(full_path))[0]
+    if CONTENT_ADDRESSED.match(stem):
+        return f'"{stem}"'
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def _etag_matches(if_none_match:str, etag:str)->bool:
+    if if_none_match.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+def _not_modified_since(if_modified_since:str, stat_result:os.stat_result)->bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(stat_result.st_mtime) <= since
+
+
+async def serve_image(image_path:str, if_none_match:str|None, if_modified_since:str|None):
+    full_path = resolve(image_path)
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, full_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Image not found')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Image not found')
+
+    etag = etag_for(full_path, stat_result)
+    stem = os.path.splitext(os.path.basename(full_path))[0]
+    headers = {'etag':etag,
+               'last-modified':formatdate(stat_result.st_mtime, usegmt=True),
+               'cache-control':IMMUTABLE if CONTENT_ADDRESSED.match(stem) else REVALIDATE}
+
+    # If-Modified-Since is only looked at when there is no If-None-Match
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        not_modified = if_modified_since is not None and _not_modified_since(if_modified_since, stat_result)
+    if not_modified:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # FileResponse answers Range requests itself
+    return FileResponse(full_path, headers=headers, stat_result=stat_result)
@@ -0,0 +1,24 @@
+from fastapi import (APIRouter,
+                    Depends)
+from fastapi.responses import FileResponse
+import anyio
+import profiling
+
+
+router = APIRouter(prefix='/profiles',
+                   tags=['profiling routes'],
+                   dependencies=[Depends(profiling.require_token)])
+
+
+# reports written by profiling.ProfilerMiddleware, newest first. Both
+# routes need the X-Profile-Token header and 404 while profiling is off
+@router.get('/')
+async def list_profiles()->list:
+    return await anyio.to_thread.run_sync(profiling.list_reports)
+
+
+@router.get('/{name}')
+async def get_profile(name:str):
+    path = profiling.report_path(name)
+    media_type = 'text/plain' if name.endswith('.txt') else 'application/octet-stream'
+    return FileResponse(path,media_type=media_type,filename=name)
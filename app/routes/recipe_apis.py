@@ -7,14 +7,25 @@ from fastapi import (APIRouter,
                     File,
                     Path,
                     Body,
-                    Query)
-from sqlalchemy.orm import Session
-from db.db_connection import get_db
+                    Query,
+                    Header,
+                    Request,
+                    Response)
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db_connection import get_read_db, get_write_db
 from . import chef_logic,recipe_logic
+import cache
+from config import settings
+import bulk_import
+from dataclasses import asdict
 from sqlalchemy.exc import IntegrityError
-from models import Chef
+from .chef_logic import Principal
 import schemas
-from typing import List, Optional, Annotated
+from typing import List, Optional, Annotated, Literal
+from fastapi.responses import StreamingResponse
+from responses import JSONBytesResponse
+import etags
+from datetime import datetime
 import uuid
 
 
@@ -29,17 +40,17 @@ async def create_recipe(
                         ingrediensts: str = Form(...),
                         cooking_instructions: str = Form(...),
                         images: Optional[List[UploadFile]] = File(None), 
-                        session: Session = Depends(get_db),
-                        chef: Chef = Depends(chef_logic.get_current_user),
+                        session: AsyncSession = Depends(get_write_db),
+                        chef: Principal = Depends(chef_logic.get_current_user),
                         )-> dict:
     try:
-        data=recipe_logic.create_recipe(name,
+        data=await recipe_logic.create_recipe(name,
                                         cusine,
                                         ingrediensts,
                                         cooking_instructions,
                                         images,
                                         session,
-                                        chef)
+                                        chef.chef_id)
         return data
     except IntegrityError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail=f'error: {e.orig}')
@@ -62,16 +73,16 @@ async def create_review(
                         comment_description: str = Body(...),
                         ratings: schemas.Ratings = Body(...),
                         vote_type:schemas.VoteType=Body(...), 
-                        session: Session = Depends(get_db),
-                        chef: Chef = Depends(chef_logic.get_current_user),
+                        session: AsyncSession = Depends(get_write_db),
+                        chef: Principal = Depends(chef_logic.get_current_user),
                         )-> dict:
     try:
-        data=recipe_logic.recipe_review(recipe_id,
+        data=await recipe_logic.recipe_review(recipe_id,
                                         comment_description,
                                         ratings,
                                         vote_type,
                                         session,
-                                        chef)
+                                        chef.chef_id)
 
         return data
     except IntegrityError as e:
@@ -89,15 +100,77 @@ async def create_review(
 
 
 
-@router.get('/all')
+# NDJSON body, one recipe or review per line, see bulk_import. The rows are
+# read as they arrive and committed in batches, the report lists the
+# rejected lines and the last committed one to resume from
+@router.post('/import')
+async def import_recipes(
+                        request: Request,
+                        start_line: Annotated[int,Query(ge=1)] = 1,
+                        batch_size: Annotated[int,Query(ge=1,le=5000)] = bulk_import.BATCH_SIZE,
+                        session: AsyncSession = Depends(get_write_db),
+                        chef: Principal = Depends(chef_logic.get_current_user),
+                        )-> dict:
+    try:
+        report = await bulk_import.run_import(session,
+                                              request.stream(),
+                                              owner=(chef.chef_id,chef.username),
+                                              start_line=start_line,
+                                              batch_size=batch_size)
+        return asdict(report)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,
+                            detail=f"An error occurred: {str(e)}")
+
+
+
+
+
+# served as the json the cache holds (or the page it just encoded), see
+# cache.get_recipe_list. fields= (comma separated) limits the recipe
+# fields returned and loaded, include= the collections: images (the
+# default) and reviews. The etag is made of the page's recipe ids and
+# updated_at, an If-None-Match that still matches gets a 304
+@router.get('/all',response_model=schemas.Recipe_Page_Out,response_model_exclude_unset=True)
 async def list_all_recipes(
                            cusine:Annotated[Optional[str],Query()] = None,
                            ingredients:Annotated[Optional[str],Query()] = None,
-                           session:Session=Depends(get_db),
-                           )-> list[dict]:
+                           q:Annotated[Optional[str],Query(max_length=200)] = None,
+                           cursor:Annotated[Optional[str],Query()] = None,
+                           page_size:Annotated[int,Query(ge=1,le=100)] = 10,
+                           latest_reviews:Annotated[int,Query(ge=0,le=settings.MAX_LATEST_REVIEWS)] = 0,
+                           fields:Annotated[Optional[str],Query(max_length=300)] = None,
+                           include:Annotated[Optional[str],Query(max_length=50)] = None,
+                           if_none_match:Annotated[Optional[str],Header()] = None,
+                           session:AsyncSession=Depends(get_read_db),
+                           )-> JSONBytesResponse:
     try:
-        recipes = recipe_logic.list_all_recipes(cusine,ingredients,session)
-        return recipes
+        fieldset = recipe_logic.recipe_fieldset(fields,include,latest_reviews)
+        # normalized the same way the query uses them so equivalent
+        # requests share a cache entry
+        filters = {'cusine':cusine.strip().capitalize() if cusine else None,
+                   'ingredients':' '.join(ingredients.lower().split()) if ingredients else None,
+                   'q':' '.join(q.split()) if q else None,
+                   'cursor':cursor,
+                   'page_size':page_size,
+                   **asdict(fieldset)}
+        # the etag is made from the rows the page was loaded from and kept
+        # with it in the cache, a hit needs no query
+        async def load():
+            page,versions = await recipe_logic.recipe_page(filters['cusine'],
+                                                           filters['ingredients'],
+                                                           filters['q'],
+                                                           cursor,
+                                                           page_size,
+                                                           fieldset,
+                                                           session)
+            return etags.make_etag('recipes',filters,versions),page
+        etag,recipes = await cache.get_recipe_list(filters,load)
+        if etags.matches(if_none_match,etag):
+            return etags.not_modified(etag)
+        return JSONBytesResponse(recipes,headers={'ETag':etag})
     except HTTPException:
         raise
     except Exception as e:
@@ -106,11 +179,42 @@ async def list_all_recipes(
     
 
 
-@router.get('/one/{recipe_id}')
-async def list_all_recipes(recipe_id:uuid.UUID,session:Session=Depends(get_db))->dict:
+EXPORT_MEDIA_TYPES = {'ndjson':'application/x-ndjson','csv':'text/csv'}
+
+# the whole catalogue (or the filtered part of it) as NDJSON or CSV,
+# streamed with flat memory use. published_from is inclusive,
+# published_to exclusive
+@router.get('/export')
+async def export_recipes(
+                         export_format:Annotated[Literal['ndjson','csv'],Query(alias='format')] = 'ndjson',
+                         cusine:Annotated[Optional[str],Query()] = None,
+                         chef_id:Annotated[Optional[uuid.UUID],Query()] = None,
+                         published_from:Annotated[Optional[datetime],Query()] = None,
+                         published_to:Annotated[Optional[datetime],Query()] = None,
+                         chef:Principal = Depends(chef_logic.get_current_user),
+                         )->StreamingResponse:
+    return StreamingResponse(
+        recipe_logic.export_recipes(export_format,cusine,chef_id,published_from,published_to),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={'content-disposition':f'attachment; filename="recipes.{export_format}"'})
+
+
+
+# the etag follows the recipe's updated_at, which every review moves. It
+# is cached with the recipe, a hit answers (or 304s) without a query
+@router.get('/one/{recipe_id}',response_model=schemas.Recipe_Schema_Out)
+async def list_all_recipes(recipe_id:uuid.UUID,
+                           latest_reviews:Annotated[int,Query(ge=0,le=settings.MAX_LATEST_REVIEWS)] = 0,
+                           if_none_match:Annotated[Optional[str],Header()] = None,
+                           session:AsyncSession=Depends(get_read_db))->JSONBytesResponse:
     try:
-        recipe = recipe_logic.list_one_recipe(recipe_id,session)
-        return recipe
+        async def load():
+            recipe,version = await recipe_logic.list_one_recipe(recipe_id,latest_reviews,session)
+            return etags.make_etag('recipe',recipe_id,latest_reviews,version),recipe
+        etag,recipe = await cache.get_recipe(recipe_id,latest_reviews,load)
+        if etags.matches(if_none_match,etag):
+            return etags.not_modified(etag)
+        return JSONBytesResponse(recipe,headers={'ETag':etag})
     except HTTPException:
         raise
     except Exception as e:
@@ -119,12 +223,59 @@ async def list_all_recipes(recipe_id:uuid.UUID,session:Session=Depends(get_db))-
     
 
 
-@router.get('/chef_recipes')
+# the reviews of one recipe a page at a time, next_cursor is passed back
+# as cursor to get the following page
+@router.get('/{recipe_id}/reviews')
+async def list_recipe_reviews(recipe_id:uuid.UUID,
+                              sort:Annotated[Literal['newest','oldest','highest','lowest'],Query()] = 'newest',
+                              cursor:Annotated[Optional[str],Query()] = None,
+                              page_size:Annotated[int,Query(ge=1,le=100)] = 20,
+                              session:AsyncSession=Depends(get_read_db))->schemas.Review_Page_Out:
+    try:
+        return await recipe_logic.list_recipe_reviews(recipe_id,sort,cursor,page_size,session)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,
+                            detail=f"An error occurred: {str(e)}")
+
+
+
+# the recipes with the most (and best) recent reviews, overall or for one
+# cuisine. trending_score halves every TRENDING_HALF_LIFE_HOURS
+@router.get('/trending',response_model_exclude_unset=True)
+async def list_trending_recipes(
+                                cusine:Annotated[Optional[schemas.Cuisine],Query()] = None,
+                                limit:Annotated[int,Query(ge=1,le=settings.TRENDING_MAX)] = 10,
+                                session:AsyncSession=Depends(get_read_db))->list[schemas.Trending_Recipe_Schema_Out]:
+    try:
+        return await recipe_logic.trending_recipes(cusine.value if cusine else None,limit,session)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,
+                            detail=f"An error occurred: {str(e)}")
+
+
+
+# fields= and include= as for /recipe/all, the etag follows the newest
+# updated_at and the number of the chef's recipes
+@router.get('/chef_recipes',response_model_exclude_unset=True)
 async def list_all_chef_recipes(
-    session:Session=Depends(get_db),
-    chef:Chef = Depends(chef_logic.get_current_user))->dict:
+    response:Response,
+    fields:Annotated[Optional[str],Query(max_length=300)] = None,
+    include:Annotated[Optional[str],Query(max_length=50)] = None,
+    if_none_match:Annotated[Optional[str],Header()] = None,
+    session:AsyncSession=Depends(get_read_db),
+    chef:Principal = Depends(chef_logic.get_current_user))->list[schemas.Recipe_Schema_Out]:
     try:
-        recipes = recipe_logic.all_recipes_of_one_chef(session,chef)
+        fieldset = recipe_logic.recipe_fieldset(fields,include)
+        version = await recipe_logic.chef_recipes_version(session,chef.chef_id)
+        etag = etags.make_etag('chef_recipes',chef.chef_id,asdict(fieldset),*version)
+        if etags.matches(if_none_match,etag):
+            return etags.not_modified(etag)
+        response.headers['ETag'] = etag
+        recipes = await recipe_logic.all_recipes_of_one_chef(session,chef.chef_id,fieldset)
         return recipes
     except HTTPException:
         raise
@@ -139,11 +290,11 @@ async def list_all_chef_recipes(
 @router.delete('/remove')
 async def remove_recipe(
     recipe_id:uuid.UUID,
-    session:Session=Depends(get_db),
-    chef:Chef = Depends(chef_logic.get_current_user),
+    session:AsyncSession=Depends(get_write_db),
+    chef:Principal = Depends(chef_logic.get_current_user),
     )-> dict:
     try:
-        recipes = recipe_logic.remove_recipe(recipe_id,session,chef)
+        recipes = await recipe_logic.remove_recipe(recipe_id,session,chef.chef_id)
         return recipes
     except HTTPException:
         raise
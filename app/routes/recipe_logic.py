@@ -1,13 +1,20 @@
+import os, uuid, csv, io
+from dataclasses import dataclass
+from datetime import datetime
 from fastapi import HTTPException, status, UploadFile
-from sqlalchemy.orm import Session,joinedload
-from models import Chef,Recipe, Recipe_Image, Recipe_Review
-from sqlalchemy import select,insert, func,and_, delete
-import os, shutil,uuid
-from schemas import VoteType
-
-
-
-
+from sqlalchemy import (select, insert, update, delete, func, and_, or_, case, cast, false,
+                        type_coerce, Float, SmallInteger)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload, load_only, raiseload
+import redis
+from config import settings
+from db.db_connection import AsyncSessionLocal
+from models import Recipe, Recipe_Image, Recipe_Review, ENUM_CODES
+from pagination import encode_cursor, decode_cursor
+from schemas import (VoteType, Ratings, Cuisine, Recipe_Schema_Out, Review_Schema_Out,
+                     Image_Schema_Out, Trending_Recipe_Schema_Out, Recipe_Page_Out, Review_Page_Out)
+import cache, responses, search, trending, uploads
 
 
 def validate_photos(value: UploadFile):
@@ -29,6 +36,164 @@ def validate_photos(value: UploadFile):
         )
     return value
 
+# Recipe column holding the count of each rating and the score used for
+# the average rating, which is the rating's stored code
+RATING_COLUMNS = {
+    Ratings.EXCELLENT:(Recipe.ratings_excellent,ENUM_CODES[Ratings][Ratings.EXCELLENT]),
+    Ratings.VERY_GOOD:(Recipe.ratings_very_good,ENUM_CODES[Ratings][Ratings.VERY_GOOD]),
+    Ratings.SATISFACTORY:(Recipe.ratings_satisfactory,ENUM_CODES[Ratings][Ratings.SATISFACTORY]),
+    Ratings.DISAPPOINTING:(Recipe.ratings_disappointing,ENUM_CODES[Ratings][Ratings.DISAPPOINTING]),
+    Ratings.UNPALATABLE:(Recipe.ratings_unpalatable,ENUM_CODES[Ratings][Ratings.UNPALATABLE]),
+}
+
+# the stored codes as plain integers, for arithmetic and aggregates in SQL.
+# A rating code is its score, 5 for Excellent down to 1, so it also sorts
+RATING_CODE = type_coerce(Recipe_Review.ratings,SmallInteger)
+VOTE_CODE = type_coerce(Recipe_Review.vote_type,SmallInteger)
+
+# values for an UPDATE of Recipe that adds (delta=1) or removes (delta=-1)
+# one review from the stored aggregates. Everything is computed in SQL from
+# the current row so concurrent reviews can not lose updates
+def review_aggregate_values(ratings:Ratings,vote_type:VoteType,delta:int)->dict:
+    rating_column,score = RATING_COLUMNS[ratings]
+    values = {rating_column.key:rating_column + delta}
+    if vote_type == VoteType.LIKE:
+        values['total_likes'] = Recipe.total_likes + delta
+    else:
+        values['total_dislikes'] = Recipe.total_dislikes + delta
+    total = sum(column for column,_ in RATING_COLUMNS.values()) + delta
+    score_sum = sum(column * weight for column,weight in RATING_COLUMNS.values()) + delta * score
+    values['average_rating'] = case((total > 0, cast(score_sum,Float) / total),else_=0.0)
+    values['updated_at'] = datetime.now()
+    return values
+
+
+# UPDATE that recounts the aggregates of the given recipes from their
+# reviews, used by the bulk import where it is not known which of the
+# submitted reviews were actually inserted. The likes are the sum of the
+# vote codes and the average rating the average of the rating codes
+def recount_review_aggregates(recipe_ids)->update:
+    def aggregate(expression):
+        return func.coalesce(select(expression)
+                             .where(Recipe_Review.recipe_id==Recipe.recipe_id)
+                             .scalar_subquery(),0)
+    likes_code = ENUM_CODES[VoteType][VoteType.LIKE]
+    values = {'total_likes':aggregate(func.count(case((VOTE_CODE==likes_code,1)))),
+              'total_dislikes':aggregate(func.count(case((VOTE_CODE!=likes_code,1)))),
+              'average_rating':aggregate(func.avg(RATING_CODE)),
+              'updated_at':datetime.now()}
+    for column,code in RATING_COLUMNS.values():
+        values[column.key] = aggregate(func.count(case((RATING_CODE==code,1))))
+    return update(Recipe).where(Recipe.recipe_id.in_(recipe_ids)).values(**values)
+
+
+# the columns each field of Recipe_Schema_Out is read from
+RECIPE_FIELD_COLUMNS = {
+    'recipe_id':(Recipe.recipe_id,),
+    'name':(Recipe.name,),
+    'cusine':(Recipe.cusine,),
+    'cooking_instructions':(Recipe.cooking_instructions,),
+    'chef_id':(Recipe.chef_id,),
+    'ingredients':(Recipe.ingredients,),
+    'date_of_publish':(Recipe.date_of_publish,),
+    'total_likes':(Recipe.total_likes,),
+    'total_dislikes':(Recipe.total_dislikes,),
+    'total_reviews':tuple(column for column,_ in RATING_COLUMNS.values()),
+    'average_rating':(Recipe.average_rating,),
+    'ratings_histogram':tuple(column for column,_ in RATING_COLUMNS.values()),
+}
+RECIPE_INCLUDES = ('images','reviews')
+
+
+# what of a recipe a listing loads and returns. fields None is all of
+# them, reviews the number of latest reviews per recipe
+@dataclass(frozen=True)
+class Fieldset:
+    fields:tuple[str,...]|None = None
+    images:bool = True
+    reviews:int = 0
+
+
+# from the comma separated fields= and include= of a listing. Without
+# include the images come along as they always did, recipe_id is always
+# part of the fields. include=reviews without a latest_reviews count gets
+# INCLUDED_REVIEWS of them
+def recipe_fieldset(fields:str|None,include:str|None,latest_reviews:int=0)->Fieldset:
+    def names(value:str)->list[str]:
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    selected = None
+    if fields is not None:
+        unknown = [name for name in names(fields) if name not in RECIPE_FIELD_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"unknown fields: {', '.join(unknown)}; "
+                                       f"allowed: {', '.join(RECIPE_FIELD_COLUMNS)}")
+        # in the order of the schema, so equivalent requests match
+        requested = {'recipe_id',*names(fields)}
+        selected = tuple(name for name in RECIPE_FIELD_COLUMNS if name in requested)
+    included = {'images'} if include is None else set(names(include))
+    unknown = sorted(included - set(RECIPE_INCLUDES))
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"unknown include: {', '.join(unknown)}; "
+                                   f"allowed: {', '.join(RECIPE_INCLUDES)}")
+    reviews = latest_reviews or (settings.INCLUDED_REVIEWS if 'reviews' in included else 0)
+    return Fieldset(fields=selected,images='images' in included,reviews=reviews)
+
+
+# loader options fetching only what the fieldset returns, anything else
+# raises instead of being lazy loaded. The images come with one extra
+# SELECT ... IN rather than a join that repeats every recipe row per image
+def recipe_load_options(fieldset:Fieldset,*needed)->list:
+    options = [selectinload(Recipe.images) if fieldset.images else raiseload(Recipe.images)]
+    if fieldset.fields is not None:
+        columns = {column.key:column for field in fieldset.fields
+                   for column in RECIPE_FIELD_COLUMNS[field]}
+        columns.update((column.key,column) for column in needed)
+        options.append(load_only(*columns.values(),raiseload=True))
+    return options
+
+
+# the review summary always comes from the aggregates, latest_reviews (a
+# list of reviews, newest first) is only set when it was asked for. A
+# partial fieldset only sets (and so only outputs) its own fields
+def recipe_out(recipe:Recipe,latest_reviews:list[Recipe_Review]|None=None,
+               schema=Recipe_Schema_Out,fieldset:Fieldset=Fieldset())->Recipe_Schema_Out:
+    if fieldset.fields is None and fieldset.images:
+        data = schema.model_validate(recipe)
+    else:
+        values = {field:getattr(recipe,field) for field in fieldset.fields or RECIPE_FIELD_COLUMNS}
+        if fieldset.images:
+            values['images'] = [Image_Schema_Out.model_validate(image) for image in recipe.images]
+        data = schema.model_construct(**values)
+    if latest_reviews is not None:
+        data.latest_reviews = [Review_Schema_Out.model_validate(review) for review in latest_reviews]
+    return data
+
+
+# the newest `count` reviews of each recipe in one query, numbered per
+# recipe with a window function
+async def load_latest_reviews(session:AsyncSession,recipe_ids:list[uuid.UUID],count:int)->dict:
+    latest = {recipe_id:[] for recipe_id in recipe_ids}
+    if not recipe_ids or count <= 0:
+        return latest
+    position = (func.row_number()
+                .over(partition_by=Recipe_Review.recipe_id,
+                      order_by=(Recipe_Review.date_of_publish.desc(),Recipe_Review.review_id.desc()))
+                .label('position'))
+    numbered = (select(Recipe_Review.review_id,position)
+                .where(Recipe_Review.recipe_id.in_(recipe_ids))
+                .subquery())
+    stmt = (select(Recipe_Review)
+            .join(numbered,numbered.c.review_id==Recipe_Review.review_id)
+            .where(numbered.c.position <= count)
+            .order_by(numbered.c.position))
+    for review in (await session.execute(stmt)).scalars():
+        latest[review.recipe_id].append(review)
+    return latest
+
+
 def protection_against_xss(value):
     not_allowed_char=['script','<','>']
     for i in not_allowed_char:
@@ -36,13 +201,13 @@ def protection_against_xss(value):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='forbidden characters: script,>,<')
     return value
 
-def create_recipe(name,
+async def create_recipe(name,
                   cusine,
                   ingrediensts,
                   cooking_instructions,
                   images,
-                  session:Session,
-                  chef:Chef,
+                  session:AsyncSession,
+                  chef_id:uuid.UUID,
                   ):
 
     protection_against_xss(name)
@@ -50,65 +215,76 @@ def create_recipe(name,
     protection_against_xss(cooking_instructions)
 
 
-    chef_id_from_db=session.execute(select(Chef.chef_id).where(Chef.username==chef)).scalar()
-    if chef_id_from_db is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f'not user with the name {chef}')
     # allow chefs to upload no more than 6 pictures
-    if images and len(images) > 6:
+    images = images or []
+    if len(images) > settings.MAX_RECIPE_IMAGES:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail='You can only upload 6 images.')
+                            detail=f'You can only upload {settings.MAX_RECIPE_IMAGES} images.')
+    for image in images:
+        validate_photos(image)
     # in a production app the images are saved in a S3 bucket
     DIR = 'uploads/recipes'
-    IMG_DIR = os.path.join(DIR, chef)  
-    images_list= []
-
-    if images:
-        os.makedirs(IMG_DIR, exist_ok=True)  # Only make the directory once
-        for image in images:  
-            validate_photos(image)
-            file_path = os.path.join(IMG_DIR, image.filename)
-
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(image.file, buffer)
-
-            images_list.append(Recipe_Image(image_url=file_path))
-
-    new_recipe = Recipe(
-        name=name,
-        cusine=cusine.value,
-        ingredients=ingrediensts,
-        cooking_instructions=cooking_instructions,
-        chef_id=chef_id_from_db,
-        images=images_list  
-    )
+    IMG_DIR = os.path.join(DIR, str(chef_id))
+
+    # the images are written concurrently and only linked into place once
+    # all of them arrived, what a failed commit published is left to upload_gc
+    async with uploads.ingest(images, IMG_DIR, settings.MAX_IMAGE_SIZE) as image_paths:
+        new_recipe = Recipe(
+            name=name,
+            cusine=cusine,
+            ingredients=ingrediensts,
+            cooking_instructions=cooking_instructions,
+            chef_id=chef_id,
+            images=[Recipe_Image(image_url=path) for path in image_paths]
+        )
 
-    session.add(new_recipe)
-    session.commit()
-    session.refresh(new_recipe)
+        session.add(new_recipe)
+        await session.flush()
+        await search.index_recipe(session,
+                                  new_recipe.recipe_id,
+                                  new_recipe.name,
+                                  new_recipe.ingredients,
+                                  new_recipe.cooking_instructions)
+        await session.commit()
+    await cache.invalidate_lists()
 
 
     return {'success':'recipe saved'}
 
 
-def recipe_review(recipe_id,
+async def recipe_review(recipe_id,
                   comment_description,
                   ratings,
                   vote_type,
-                  session:Session,
-                  chef:Chef):
+                  session:AsyncSession,
+                  chef_id:uuid.UUID):
     
     protection_against_xss(comment_description)
-    chef_id = session.execute(select(Chef.chef_id).where(Chef.username==chef)).scalar()
+    # the aggregates and the review are committed together
+    cuisine = (await session.execute(update(Recipe)
+                                     .where(Recipe.recipe_id==recipe_id)
+                                     .values(**review_aggregate_values(ratings,vote_type,1))
+                                     .returning(Recipe.cusine))).scalar()
+    if cuisine is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f'no recipe with the id {recipe_id} found.')
     stmt = insert(Recipe_Review).values(
         recipe_id=recipe_id,
         comment_description=comment_description,
-        ratings=ratings.value,
-        vote_type=vote_type.value,
+        ratings=ratings,
+        vote_type=vote_type,
         chef_id=chef_id
         )
-    session.execute(stmt)
-    session.commit()
+    try:
+        review_id,published = (await session.execute(
+            stmt.returning(Recipe_Review.review_id,Recipe_Review.date_of_publish))).one()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail='you already reviewed this recipe.')
+    await session.commit()
+    await cache.invalidate_recipes(recipe_id)
+    await trending.record_review(review_id,recipe_id,cuisine,ratings,vote_type,published)
 
  
 
@@ -121,126 +297,317 @@ def recipe_review(recipe_id,
 
 
 
-def list_all_recipes(cusine:str,ingredients:str,session:Session):
-    stmt = (
-        select(Recipe)
-        .options(joinedload(Recipe.images))
-        .options(joinedload(Recipe.recipe_review))
-        .offset(0)
-        .limit(10)
-    )
+# a cuisine given by its label, a label that is no cuisine matches nothing
+def cuisine_filter(label:str):
+    try:
+        return Recipe.cusine == Cuisine(label.strip().capitalize())
+    except ValueError:
+        return false()
+
 
+def _decode_recipe_cursor(cursor:str,searching:bool):
+    first, last_id = decode_cursor(cursor, 2)
+    try:
+        first = float(first) if searching else datetime.fromisoformat(first)
+        return first, uuid.UUID(last_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail='Invalid cursor')
+
+
+# without a search query recipes come newest first, recipe_id breaks ties
+# between recipes published at the same instant so the order (and
+# therefore the cursor) is stable. With q they come by relevance.
+# Returns the page and the (recipe_id, updated_at) of every row it was
+# made of, the versions its etag is built from
+async def recipe_page(cusine:str,
+                      ingredients:str,
+                      q:str|None,
+                      cursor:str|None,
+                      page_size:int,
+                      fieldset:Fieldset,
+                      session:AsyncSession)->tuple[Recipe_Page_Out,list]:
+    searching = bool(q)
     filters = []
 
-    if cusine:
-        filters.append(Recipe.cusine == cusine.strip().capitalize())
+    if searching:
+        rank = search.rank.label('rank')
+        stmt = (
+            select(Recipe,rank)
+            .join(search.recipe_fts,search.recipe_fts.c.recipe_id==Recipe.recipe_id)
+            .order_by(rank,Recipe.recipe_id)
+        )
+        expression = search.build_match(q)
+        # the ingredients filter is folded into the same MATCH so a
+        # single index lookup answers both
+        if ingredients:
+            expression = f'({expression}) AND {search.build_column_match("ingredients",ingredients)}'
+        filters.append(search.match(expression))
+    else:
+        stmt = (
+            select(Recipe)
+            .order_by(Recipe.date_of_publish.desc(),Recipe.recipe_id.desc())
+        )
+        if ingredients:
+            filters.append(Recipe.recipe_id.in_(
+                select(search.recipe_fts.c.recipe_id)
+                .where(search.match(search.build_column_match('ingredients',ingredients)))))
+
+    # one extra row tells us whether there is a next page. date_of_publish
+    # is loaded for the cursor and updated_at for the etag even when they
+    # are not returned
+    stmt = (stmt.options(*recipe_load_options(fieldset,Recipe.recipe_id,Recipe.date_of_publish,
+                                              Recipe.updated_at))
+            .limit(page_size + 1))
+
+    if cursor:
+        last_key, last_id = _decode_recipe_cursor(cursor,searching)
+        if searching:
+            filters.append(or_(search.rank > last_key,
+                               and_(search.rank == last_key,
+                                    Recipe.recipe_id > last_id)))
+        else:
+            filters.append(or_(Recipe.date_of_publish < last_key,
+                               and_(Recipe.date_of_publish == last_key,
+                                    Recipe.recipe_id < last_id)))
 
-    if ingredients:
-        filters.append(func.lower(Recipe.ingredients).ilike(f"%{ingredients.strip().lower()}%"))
+    if cusine:
+        filters.append(cuisine_filter(cusine))
 
     if filters:
         stmt = stmt.where(and_(*filters))
 
-    recipes = session.execute(stmt).scalars().unique().all()
-
-
-
-    updated_recipes=[]
-    for recipe in recipes:
-        like_count = sum(1 for review in recipe.recipe_review if review.vote_type== "Like")
-        dislike_count = sum(1 for review in recipe.recipe_review if review.vote_type == 'Dislike')
-
-        recipe_fields = {
-            "name": recipe.name,
-            "cusine": recipe.cusine,
-            "cooking_instructions": recipe.cooking_instructions,
-            "chef_id": recipe.chef_id,
-            "recipe_id": recipe.recipe_id,
-            "ingredients": recipe.ingredients,
-            "date_of_publish": recipe.date_of_publish,
-            "images": [{"image_url": img.image_url} for img in recipe.images],
-            "recipe_review": [
-                {
-                    "review_id": review.review_id,
-                    "comment_description": review.comment_description,
-                    "vote_type": review.vote_type,
-                    "ratings": review.ratings,
-                    "date_of_publish": review.date_of_publish,
-                    "chef_id": review.chef_id,
-                    "recipe_id": review.recipe_id,
-                }
-                for review in recipe.recipe_review
-            ],
-            "total_likes": like_count,
-            "total_dislikes": dislike_count,
-        }
-        
-        updated_recipes.append(recipe_fields)
-    return updated_recipes
+    rows = (await session.execute(stmt)).all()
+    # the extra row counts too, it decides whether there is a next_cursor
+    versions = [(row.Recipe.recipe_id,row.Recipe.updated_at) for row in rows]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        first_key = last.rank if searching else last.Recipe.date_of_publish.isoformat()
+        next_cursor = encode_cursor([first_key, str(last.Recipe.recipe_id)])
+    recipes = [row.Recipe for row in rows]
+
+    # the counts come from the aggregates stored on the recipe, review
+    # rows are only loaded when the latest ones are asked for
+    if fieldset.reviews:
+        latest = await load_latest_reviews(session,[recipe.recipe_id for recipe in recipes],fieldset.reviews)
+        updated_recipes=[recipe_out(recipe,latest[recipe.recipe_id],fieldset=fieldset) for recipe in recipes]
+    else:
+        updated_recipes=[recipe_out(recipe,fieldset=fieldset) for recipe in recipes]
+    return Recipe_Page_Out(recipes=updated_recipes,next_cursor=next_cursor),versions
+
+
+async def list_all_recipes(cusine:str,
+                           ingredients:str,
+                           q:str|None,
+                           cursor:str|None,
+                           page_size:int,
+                           fieldset:Fieldset,
+                           session:AsyncSession)->Recipe_Page_Out:
+    page,_ = await recipe_page(cusine,ingredients,q,cursor,page_size,fieldset,session)
+    return page
 
  
 
-def list_one_recipe(recipe_id:uuid.UUID,session:Session):
+# max(updated_at) and count(*) of one chef's recipes, a change moves the
+# max and a deletion the count
+async def chef_recipes_version(session:AsyncSession,chef_id:uuid.UUID)->tuple:
+    stmt = select(func.max(Recipe.updated_at),func.count()).where(Recipe.chef_id==chef_id)
+    return tuple((await session.execute(stmt)).one())
+
+
+# the recipe and its updated_at, which the etag is made of
+async def list_one_recipe(recipe_id:uuid.UUID,latest_reviews:int,session:AsyncSession)->tuple:
     stmt=(select(Recipe)
           .where(Recipe.recipe_id==recipe_id)
-          .options(joinedload(Recipe.images))
-          .options(joinedload(Recipe.recipe_review)))
-
-    recipe = session.execute(stmt).scalars().unique().first()
-    like_count = sum(1 for review in recipe.recipe_review if review.vote_type== "Like")
-    dislike_count = sum(1 for review in recipe.recipe_review if review.vote_type == 'Dislike')
-
-    return {
-            "name": recipe.name,
-            "cusine": recipe.cusine,
-            "cooking_instructions": recipe.cooking_instructions,
-            "chef_id": recipe.chef_id,
-            "recipe_id": recipe.recipe_id,
-            "ingredients": recipe.ingredients,
-            "date_of_publish": recipe.date_of_publish,
-            "images": [{"image_url": img.image_url} for img in recipe.images],
-            "recipe_review": [
-                {
-                    "review_id": review.review_id,
-                    "comment_description": review.comment_description,
-                    "vote_type": review.vote_type,
-                    "ratings": review.ratings,
-                    "date_of_publish": review.date_of_publish,
-                    "chef_id": review.chef_id,
-                    "recipe_id": review.recipe_id,
-                }
-                for review in recipe.recipe_review
-            ],
-            "total_likes": like_count,
-            "total_dislikes": dislike_count,
-        }
-
+          .options(joinedload(Recipe.images)))
+
+    recipe = (await session.execute(stmt)).scalars().unique().first()
+    if recipe is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f'no recipe with the id {recipe_id} found.')
+    if latest_reviews:
+        latest = await load_latest_reviews(session,[recipe_id],latest_reviews)
+        return recipe_out(recipe,latest[recipe_id]),recipe.updated_at
+    return recipe_out(recipe),recipe.updated_at
+
+
+
+# sort key, direction and cursor decoder of each review order
+REVIEW_ORDERS = {
+    'newest':(Recipe_Review.date_of_publish,True,datetime.fromisoformat),
+    'oldest':(Recipe_Review.date_of_publish,False,datetime.fromisoformat),
+    'highest':(RATING_CODE,True,int),
+    'lowest':(RATING_CODE,False,int),
+}
+
+
+# keyset pagination over the reviews of one recipe, review_id breaks ties
+# so reviews with the same date or rating are never skipped or repeated
+async def list_recipe_reviews(recipe_id:uuid.UUID,
+                              sort:str,
+                              cursor:str|None,
+                              page_size:int,
+                              session:AsyncSession):
+    key,descending,parse_key = REVIEW_ORDERS[sort]
+    sort_key = key.label('sort_key')
+    stmt = (select(Recipe_Review,sort_key)
+            .where(Recipe_Review.recipe_id==recipe_id)
+            .order_by(*((key.desc(),Recipe_Review.review_id.desc()) if descending
+                        else (key,Recipe_Review.review_id)))
+            .limit(page_size + 1))
+    if cursor:
+        last_key,last_id = decode_cursor(cursor,2)
+        try:
+            last_key,last_id = parse_key(last_key),uuid.UUID(last_id)
+        except (TypeError,ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail='Invalid cursor')
+        if descending:
+            stmt = stmt.where(or_(key < last_key,and_(key == last_key,Recipe_Review.review_id < last_id)))
+        else:
+            stmt = stmt.where(or_(key > last_key,and_(key == last_key,Recipe_Review.review_id > last_id)))
+
+    rows = (await session.execute(stmt)).all()
+    if not rows and not cursor:
+        exists = await session.scalar(select(Recipe.recipe_id).where(Recipe.recipe_id==recipe_id))
+        if exists is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f'no recipe with the id {recipe_id} found.')
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        last_key = last.sort_key.isoformat() if isinstance(last.sort_key,datetime) else last.sort_key
+        next_cursor = encode_cursor([last_key,str(last.Recipe_Review.review_id)])
+    return Review_Page_Out(reviews=[Review_Schema_Out.model_validate(row.Recipe_Review) for row in rows],
+                           next_cursor=next_cursor)
 
 
 # get all the recipes of one chef
-def all_recipes_of_one_chef(session:Session,chef:Chef):
-    chef_id = session.execute(select(Chef.chef_id).where(Chef.username==chef)).scalar()
+async def all_recipes_of_one_chef(session:AsyncSession,chef_id:uuid.UUID,fieldset:Fieldset=Fieldset()):
     stmt = (select(Recipe)
-            .options(joinedload(Recipe.recipe_review))
-            .options(joinedload(Recipe.images))
+            .options(*recipe_load_options(fieldset,Recipe.recipe_id))
             .where(Recipe.chef_id==chef_id))
-    recipes = session.execute(stmt).scalars().unique().all()
-    return recipes
+    recipes = (await session.execute(stmt)).scalars().all()
+    if fieldset.reviews:
+        latest = await load_latest_reviews(session,[recipe.recipe_id for recipe in recipes],fieldset.reviews)
+        return [recipe_out(recipe,latest[recipe.recipe_id],fieldset=fieldset) for recipe in recipes]
+    return [recipe_out(recipe,fieldset=fieldset) for recipe in recipes]
+
+
+# removes recipes with their images, reviews and search entries. With
+# foreign keys enforced the children have to go first
+async def delete_recipes(session:AsyncSession,recipe_ids:list[uuid.UUID]):
+    if not recipe_ids:
+        return
+    await session.execute(delete(Recipe_Review).where(Recipe_Review.recipe_id.in_(recipe_ids)))
+    await session.execute(delete(Recipe_Image).where(Recipe_Image.recipe_id.in_(recipe_ids)))
+    await search.unindex_recipes(session,recipe_ids)
+    await session.execute(delete(Recipe).where(Recipe.recipe_id.in_(recipe_ids)))
 
 
 # delete a recipe
-def remove_recipe(recipe_id:uuid.UUID,session:Session,chef:Chef):
-    chef_id = session.execute(select(Chef.chef_id).where(Chef.username==chef)).scalar_one()
-    if chef_id is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
-                            detail=f'no chef with the name {chef} found.')
-    stmt = (delete(Recipe)
-                    # validating the the chef owns the recipes
-            .where(Recipe.recipe_id==recipe_id,Recipe.chef_id==chef_id))
-    result = session.execute(stmt)
-    if result.rowcount == 0:
+async def remove_recipe(recipe_id:uuid.UUID,session:AsyncSession,chef_id:uuid.UUID):
+    owned = await session.scalar(select(Recipe.recipe_id)
+                                 # validating the the chef owns the recipes
+                                 .where(Recipe.recipe_id==recipe_id,Recipe.chef_id==chef_id))
+    if owned is None:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, 
                             detail=f'No allowed to remove this recipe.')
+    await delete_recipes(session,[recipe_id])
+    await session.commit()
+    await cache.invalidate_recipes(recipe_id)
+    await trending.remove_recipes(recipe_id)
     return {'success':'recipe removed'}
 
- 
\ No newline at end of file
+
+# the best scored recipes of the trending set, one ZREVRANGE for the ids
+# and one SELECT ... IN for the recipes. Recipes deleted since they were
+# scored are skipped
+async def trending_recipes(cusine:str|None,count:int,session:AsyncSession)->list:
+    try:
+        ranked = await trending.top(cusine,count)
+    except redis.RedisError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail='trending recipes are not available right now.')
+    if not ranked:
+        return []
+    stmt = (select(Recipe)
+            .where(Recipe.recipe_id.in_([recipe_id for recipe_id,_ in ranked]))
+            .options(joinedload(Recipe.images)))
+    recipes = {recipe.recipe_id:recipe for recipe in (await session.execute(stmt)).scalars().unique()}
+    trending_recipes = []
+    for recipe_id,score in ranked:
+        if recipe_id in recipes:
+            data = recipe_out(recipes[recipe_id],schema=Trending_Recipe_Schema_Out)
+            data.trending_score = round(score,4)
+            trending_recipes.append(data)
+    return trending_recipes
+
+
+
+# rows fetched from the cursor at a time by the export, the memory used
+# depends on this and not on the size of the table
+EXPORT_BATCH = 500
+EXPORT_COLUMNS = ['recipe_id','name','cusine','chef_id','ingredients','cooking_instructions',
+                  'date_of_publish','total_likes','total_dislikes','average_rating',
+                  *(column.key for column,_ in RATING_COLUMNS.values()),'images']
+
+
+def _export_row(recipe:Recipe)->list:
+    return [recipe.recipe_id,recipe.name,recipe.cusine.value,recipe.chef_id,recipe.ingredients,
+            recipe.cooking_instructions,recipe.date_of_publish.isoformat(),recipe.total_likes,
+            recipe.total_dislikes,recipe.average_rating,
+            *(getattr(recipe,column.key) for column,_ in RATING_COLUMNS.values()),
+            ' '.join(image.image_url for image in recipe.images)]
+
+
+# async generator for a StreamingResponse. It opens its own session, the
+# one from the route dependency is closed before the body is streamed.
+# Recipes are read through a server side cursor EXPORT_BATCH at a time,
+# the images of each batch with one extra SELECT ... IN, and every batch
+# is written out before the next one is fetched. The identity map only
+# holds weak references so sent recipes are garbage collected
+async def export_recipes(export_format:str,
+                         cusine:str|None,
+                         chef_id:uuid.UUID|None,
+                         published_from:datetime|None,
+                         published_to:datetime|None):
+    filters = []
+    if cusine:
+        filters.append(cuisine_filter(cusine))
+    if chef_id:
+        filters.append(Recipe.chef_id == chef_id)
+    if published_from:
+        filters.append(Recipe.date_of_publish >= published_from)
+    if published_to:
+        filters.append(Recipe.date_of_publish < published_to)
+    stmt = (select(Recipe)
+            .where(*filters)
+            .options(selectinload(Recipe.images))
+            .order_by(Recipe.date_of_publish.desc(),Recipe.recipe_id.desc())
+            .execution_options(yield_per=EXPORT_BATCH))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt)
+        async for recipes in result.scalars().partitions():
+            for recipe in recipes:
+                if export_format == 'csv':
+                    writer.writerow(_export_row(recipe))
+                else:
+                    buffer.write(responses.dumps(recipe_out(recipe)).decode())
+                    buffer.write('\n')
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
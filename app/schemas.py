@@ -1,11 +1,14 @@
 from pydantic import (BaseModel,
                       Field,
                       EmailStr,
+                      TypeAdapter,
                       field_validator,
                       model_validator)
 from fastapi import UploadFile, HTTPException, status
-from datetime import date
+from datetime import date, datetime
+from typing import Annotated, Literal, Union
 import re
+import uuid
 from enum import Enum
  
 def validate(value):
@@ -59,12 +62,12 @@ class Chef_Schema_In(BaseModel):
 
 class Chef_Schema_Out(BaseModel):
     username:str
-    password:str
     email:EmailStr
     date_of_birth:date
     chef_photo:str|None
     class Config:
         extra='forbid'
+        from_attributes=True
 
 
 class Token(BaseModel):
@@ -167,3 +170,94 @@ class VoteType(Enum):
     LIKE = "Like"
     DISLIKE = "Dislike"
 
+
+
+# response models, validated straight from the ORM rows (from_attributes)
+# and encoded by responses.dumps
+
+class Image_Schema_Out(BaseModel):
+    image_url:str|None
+    class Config:
+        from_attributes=True
+
+
+class Review_Schema_Out(BaseModel):
+    review_id:uuid.UUID
+    comment_description:str
+    vote_type:VoteType
+    ratings:Ratings
+    date_of_publish:datetime
+    chef_id:uuid.UUID
+    recipe_id:uuid.UUID
+    class Config:
+        from_attributes=True
+
+
+# latest_reviews is only set (and only in the output, which leaves unset
+# fields out) when they were asked for
+class Recipe_Schema_Out(BaseModel):
+    name:str
+    cusine:Cuisine
+    cooking_instructions:str
+    chef_id:uuid.UUID
+    recipe_id:uuid.UUID
+    ingredients:str
+    date_of_publish:datetime
+    images:list[Image_Schema_Out]
+    total_likes:int
+    total_dislikes:int
+    total_reviews:int
+    average_rating:float
+    ratings_histogram:dict[str,int]
+    latest_reviews:list[Review_Schema_Out]|None=None
+    class Config:
+        from_attributes=True
+
+
+class Trending_Recipe_Schema_Out(Recipe_Schema_Out):
+    trending_score:float=0.0
+
+
+class Recipe_Page_Out(BaseModel):
+    recipes:list[Recipe_Schema_Out]
+    next_cursor:str|None
+
+
+class Review_Page_Out(BaseModel):
+    reviews:list[Review_Schema_Out]
+    next_cursor:str|None
+
+
+# bulk import rows, one json object per ndjson line. chef (a username) is
+# only honoured by the command line import, over http every row belongs to
+# the authenticated chef. Ids are optional, giving them makes a re-run of
+# the same file skip what was already imported
+
+class ImportRecipe(BaseModel):
+    type:Literal['recipe']
+    recipe_id:uuid.UUID|None=None
+    chef:str|None=None
+    name:str=Field(...,max_length=100)
+    cusine:Cuisine
+    ingredients:str=Field(...,max_length=1000)
+    cooking_instructions:str=Field(...,max_length=2000)
+    date_of_publish:datetime|None=None
+    images:list[str]=Field(default_factory=list,max_length=6)
+    class Config:
+        extra = 'forbid'
+
+
+class ImportReview(BaseModel):
+    type:Literal['review']
+    review_id:uuid.UUID|None=None
+    recipe_id:uuid.UUID
+    chef:str|None=None
+    comment_description:str=Field(...,max_length=300)
+    ratings:Ratings
+    vote_type:VoteType
+    date_of_publish:datetime|None=None
+    class Config:
+        extra = 'forbid'
+
+
+ImportRow = TypeAdapter(Annotated[Union[ImportRecipe,ImportReview],Field(discriminator='type')])
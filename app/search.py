@@ -0,0 +1,126 @@
+from fastapi import HTTPException, status
+from sqlalchemy import text, table, column, func, literal_column, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+import re, uuid
+
+
+# SQLite FTS5 index over the searchable recipe columns. recipe_id is stored
+# in the same 32 char hex form SQLAlchemy uses for Uuid columns on SQLite so
+# it can be joined straight onto recipe.recipe_id
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipe_fts USING fts5("
+    "recipe_id UNINDEXED, name, ingredients, cooking_instructions, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+# an UNINDEXED column can only be filtered by scanning the whole index, so
+# every entry gets its rowid from this table and is deleted by rowid.
+# fts_rowid is an INTEGER PRIMARY KEY and keeps its value across VACUUM
+KEY_DDL = (
+    "CREATE TABLE IF NOT EXISTS recipe_fts_key("
+    "fts_rowid INTEGER PRIMARY KEY, recipe_id CHAR(32) NOT NULL UNIQUE)"
+)
+
+recipe_fts = table('recipe_fts',
+                   column('recipe_id'),
+                   column('name'),
+                   column('ingredients'),
+                   column('cooking_instructions'))
+
+# bm25 weights, one per fts column: a hit in the name counts more than one
+# in the ingredients, which counts more than one in the instructions
+rank = func.bm25(literal_column('recipe_fts'), 0.0, 10.0, 5.0, 1.0)
+
+MAX_TERMS = 16
+_term = re.compile(r'\w+', re.UNICODE)
+
+
+def create_index(connection):
+    connection.exec_driver_sql(FTS_DDL)
+    connection.exec_driver_sql(KEY_DDL)
+
+
+async def index_recipe(session:AsyncSession,
+                       recipe_id:uuid.UUID,
+                       name:str,
+                       ingredients:str,
+                       cooking_instructions:str):
+    await index_recipes(session,[{'recipe_id':recipe_id,
+                                  'name':name,
+                                  'ingredients':ingredients,
+                                  'cooking_instructions':cooking_instructions}])
+
+
+# rows are dicts with the recipe_id, name, ingredients and
+# cooking_instructions of recipes inserted in bulk. The key rows are
+# written first and the index entries take their fts_rowid
+async def index_recipes(session:AsyncSession,rows:list[dict]):
+    if not rows:
+        return
+    rows = [{**row,'recipe_id':row['recipe_id'].hex} for row in rows]
+    await session.execute(text("INSERT INTO recipe_fts_key(recipe_id) VALUES (:recipe_id)"),
+                          [{'recipe_id':row['recipe_id']} for row in rows])
+    await session.execute(
+        text("INSERT INTO recipe_fts(rowid, recipe_id, name, ingredients, cooking_instructions) "
+             "SELECT fts_rowid, :recipe_id, :name, :ingredients, :cooking_instructions "
+             "FROM recipe_fts_key WHERE recipe_id = :recipe_id"),
+        rows)
+
+
+# deletes by rowid, which FTS5 looks up directly instead of scanning
+async def unindex_recipes(session:AsyncSession,recipe_ids:list[uuid.UUID]):
+    if not recipe_ids:
+        return
+    keys = {'recipe_ids':[recipe_id.hex for recipe_id in recipe_ids]}
+    await session.execute(
+        text("DELETE FROM recipe_fts WHERE rowid IN "
+             "(SELECT fts_rowid FROM recipe_fts_key WHERE recipe_id IN :recipe_ids)")
+        .bindparams(bindparam('recipe_ids',expanding=True)),
+        keys)
+    await session.execute(
+        text("DELETE FROM recipe_fts_key WHERE recipe_id IN :recipe_ids")
+        .bindparams(bindparam('recipe_ids',expanding=True)),
+        keys)
+
+
+# turn the user query into an FTS5 MATCH expression.
+# Words are ANDed, OR (or |) separates alternatives and a trailing * makes
+# a word a prefix, e.g. 'tomato bas* OR pesto' becomes
+# ("tomato" AND "bas"*) OR ("pesto"). Every word is quoted so FTS5 syntax
+# in the input is never interpreted
+def build_match(q:str)->str:
+    groups = [[]]
+    terms = 0
+    for token in q.split():
+        if token in ('OR','|'):
+            if groups[-1]:
+                groups.append([])
+            continue
+        prefix = token.endswith('*')
+        for word in _term.findall(token):
+            terms += 1
+            groups[-1].append(f'"{word}"')
+        if prefix and groups[-1]:
+            groups[-1][-1] += '*'
+    groups = [group for group in groups if group]
+    if not groups:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail='The search query has no searchable words.')
+    if terms > MAX_TERMS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f'The search query can have at most {MAX_TERMS} words.')
+    return ' OR '.join('(' + ' AND '.join(group) + ')' for group in groups)
+
+
+# restrict a match expression to one column, every word is a prefix so
+# the ingredients filter keeps matching partial words like the old ilike
+def build_column_match(column_name:str,value:str)->str:
+    words = _term.findall(value)[:MAX_TERMS]
+    if not words:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f'The {column_name} filter has no searchable words.')
+    return f'{column_name} : (' + ' AND '.join(f'"{word}"*' for word in words) + ')'
+
+
+def match(expression:str):
+    return literal_column('recipe_fts').op('MATCH')(expression)
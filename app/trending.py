@@ -0,0 +1,278 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from redis_client import get_redis, Script
+from schemas import Cuisine, Ratings, VoteType
+from config import settings
+from datetime import datetime
+import redis
+import argparse, asyncio, json, logging, sys, time, uuid
+
+logger = logging.getLogger(__name__)
+
+# Trending recipes, a Redis sorted set per cuisine plus one over all of
+# them, scored with forward decay: a review published at t adds
+#   points * 2 ** ((t - epoch) / half_life)
+# to its recipe. Dividing every score by 2 ** ((now - epoch) / half_life)
+# gives each review's points halved for every half life since it was
+# written, but since that factor is the same for all recipes the order
+# never has to be recomputed, a review is a single ZINCRBY and the top N a
+# single ZREVRANGE.
+#
+# key layout
+#   trending:epoch               the epoch (unix seconds) the live sets use
+#   trending:<epoch>:all         recipe_id -> score
+#   trending:<epoch>:<Cuisine>   recipe_id -> score, one cuisine
+#   trending:next                epoch of the sets a rebuild is filling
+#   trending:queue               reviews added or removed while it runs
+#
+# The scores grow by 2 every half life and would overflow a double after
+# about a thousand of them, running the rebuild (python trending.py) daily
+# or weekly moves the epoch to the present. It recounts every review, so
+# it also catches increments lost to a Redis error. While it runs the
+# reviews added and removed still go to the live sets and are queued as
+# well. The rebuild counts the reviews of one database snapshot and then
+# settles the queue against that same snapshot: an added review it did
+# not see and a removed one it did count are applied to the new sets. So
+# no review is counted twice or missed, however its commit and its
+# increment interleave with the rebuild.
+
+KEY_PREFIX = 'trending:'
+SUFFIXES = ['all', *(cuisine.value for cuisine in Cuisine)]
+
+# a review is worth between -1 and 3 points, writing one at all counts
+REVIEW_POINTS = 1.0
+VOTE_POINTS = {VoteType.LIKE:1.0, VoteType.DISLIKE:-1.0}
+RATING_POINTS = {Ratings.EXCELLENT:1.0,
+                 Ratings.VERY_GOOD:0.5,
+                 Ratings.SATISFACTORY:0.0,
+                 Ratings.DISAPPOINTING:-0.5,
+                 Ratings.UNPALATABLE:-1.0}
+
+REBUILD_BATCH = 1000
+
+
+def review_points(ratings:Ratings, vote_type:VoteType)->float:
+    return REVIEW_POINTS + VOTE_POINTS[vote_type] + RATING_POINTS[ratings]
+
+
+def _half_life()->float:
+    return settings.TRENDING_HALF_LIFE_HOURS * 3600
+
+
+# ARGV half life, 1 to add or -1 to remove, then review_id, recipe_id,
+# cuisine, points, published at for every review
+_add = Script("""
+local half_life = tonumber(ARGV[1])
+local sign = tonumber(ARGV[2])
+local epoch = redis.call('GET', 'trending:epoch')
+if not epoch then
+    epoch = tostring(math.floor(tonumber(ARGV[7])))
+    redis.call('SET', 'trending:epoch', epoch)
+end
+local rebuilding = redis.call('EXISTS', 'trending:next') == 1
+for i = 3, #ARGV, 5 do
+    local points = sign * tonumber(ARGV[i + 3]) * 2 ^ ((tonumber(ARGV[i + 4]) - tonumber(epoch)) / half_life)
+    redis.call('ZINCRBY', 'trending:' .. epoch .. ':all', points, ARGV[i + 1])
+    redis.call('ZINCRBY', 'trending:' .. epoch .. ':' .. ARGV[i + 2], points, ARGV[i + 1])
+    if rebuilding then
+        redis.call('RPUSH', 'trending:queue',
+                   cjson.encode({ARGV[2], ARGV[i], ARGV[i + 1], ARGV[i + 2], ARGV[i + 3], ARGV[i + 4]}))
+    end
+end
+""")
+
+# ARGV suffix, count; returns the epoch followed by member, score pairs
+_top = Script("""
+local epoch = redis.call('GET', 'trending:epoch')
+if not epoch then
+    return {}
+end
+local top = redis.call('ZREVRANGE', 'trending:' .. epoch .. ':' .. ARGV[1], 0, tonumber(ARGV[2]) - 1, 'WITHSCORES')
+table.insert(top, 1, epoch)
+return top
+""")
+
+# ARGV suffixes..., '--', recipe_ids...
+_remove = Script("""
+local split = 1
+while ARGV[split] ~= '--' do
+    split = split + 1
+end
+for _, epoch in ipairs({redis.call('GET', 'trending:epoch'), redis.call('GET', 'trending:next')}) do
+    if epoch then
+        for i = 1, split - 1 do
+            for j = split + 1, #ARGV do
+                redis.call('ZREM', 'trending:' .. epoch .. ':' .. ARGV[i], ARGV[j])
+            end
+        end
+    end
+end
+""")
+
+# ARGV new epoch, ttl of the old sets, suffixes...; returns the queue
+_finish = Script("""
+if redis.call('GET', 'trending:next') ~= ARGV[1] then
+    return redis.error_reply('the rebuild of epoch ' .. ARGV[1] .. ' is no longer running')
+end
+local old = redis.call('GET', 'trending:epoch')
+redis.call('SET', 'trending:epoch', ARGV[1])
+redis.call('DEL', 'trending:next')
+if old and old ~= ARGV[1] then
+    for i = 3, #ARGV do
+        redis.call('EXPIRE', 'trending:' .. old .. ':' .. ARGV[i], ARGV[2])
+    end
+end
+local queued = redis.call('LRANGE', 'trending:queue', 0, -1)
+redis.call('DEL', 'trending:queue')
+return queued
+""")
+
+
+# reviews are (review_id, recipe_id, cuisine, ratings, vote_type,
+# date_of_publish) as stored. Called after the reviews have committed, a
+# failure only costs the recipes these reviews' points until the next rebuild
+async def record_reviews(reviews:list[tuple], sign:int = 1):
+    args = [_half_life(), sign]
+    for review_id, recipe_id, cuisine, ratings, vote_type, published in reviews:
+        args += [str(review_id), str(recipe_id), cuisine.value,
+                 review_points(ratings, vote_type), published.timestamp()]
+    if len(args) == 2:
+        return
+    try:
+        await _add(keys=[], args=args)
+    except redis.RedisError:
+        logger.error('could not update the trending sets for %s reviews', len(reviews), exc_info=True)
+
+
+async def record_review(review_id:uuid.UUID, recipe_id:uuid.UUID, cuisine:Cuisine, ratings:Ratings,
+                        vote_type:VoteType, published:datetime):
+    await record_reviews([(review_id, recipe_id, cuisine, ratings, vote_type, published)])
+
+
+# takes back exactly the decayed points record_reviews added for them
+async def remove_reviews(reviews:list[tuple]):
+    await record_reviews(reviews, sign=-1)
+
+
+async def remove_recipes(*recipe_ids:uuid.UUID):
+    if not recipe_ids:
+        return
+    try:
+        await _remove(keys=[], args=[*SUFFIXES, '--', *(str(recipe_id) for recipe_id in recipe_ids)])
+    except redis.RedisError:
+        logger.error('could not remove %s from the trending sets', recipe_ids, exc_info=True)
+
+
+# [(recipe_id, score now), ...] best first, raises redis.RedisError
+async def top(cuisine:str|None, count:int)->list[tuple[uuid.UUID, float]]:
+    reply = await _top(keys=[], args=[cuisine or 'all', count])
+    if not reply:
+        return []
+    decay = 2 ** ((int(reply[0]) - time.time()) / _half_life())
+    pairs = zip(reply[1::2], reply[2::2])
+    return [(uuid.UUID(member), float(score) * decay) for member, score in pairs]
+
+
+# settle the reviews queued while the rebuild ran against its snapshot,
+# still open in session. Returns the points to add to the new sets
+async def _settle(session:AsyncSession, queued:list[str], epoch:int)->dict:
+    from models import Recipe_Review
+    entries = [json.loads(entry) for entry in queued]
+    review_ids = list({uuid.UUID(entry[1]) for entry in entries})
+    counted = set()
+    for start in range(0, len(review_ids), REBUILD_BATCH):
+        counted.update((await session.execute(
+            select(Recipe_Review.review_id)
+            .where(Recipe_Review.review_id.in_(review_ids[start:start + REBUILD_BATCH])))).scalars())
+    half_life = _half_life()
+    added = set()
+    scores:dict[tuple[str, str], float] = {}
+    for sign, review_id, recipe_id, cuisine, points, published in entries:
+        review_id = uuid.UUID(review_id)
+        if int(sign) > 0:
+            # committed before the snapshot was taken, it is counted already
+            if review_id in counted:
+                continue
+            added.add(review_id)
+        elif review_id not in counted and review_id not in added:
+            # removed before the snapshot was taken, it was never counted
+            continue
+        key = (recipe_id, cuisine)
+        scores[key] = scores.get(key, 0.0) + int(sign) * float(points) * 2 ** ((float(published) - epoch) / half_life)
+    return scores
+
+
+async def _add_scores(client, epoch:int, scores:dict):
+    items = list(scores.items())
+    for start in range(0, len(items), REBUILD_BATCH):
+        async with client.pipeline(transaction=False) as pipe:
+            for (recipe_id, cuisine), score in items[start:start + REBUILD_BATCH]:
+                pipe.zincrby(f'{KEY_PREFIX}{epoch}:all', score, recipe_id)
+                pipe.zincrby(f'{KEY_PREFIX}{epoch}:{cuisine}', score, recipe_id)
+            await pipe.execute()
+
+
+# recount every review into sets for a new epoch and switch to them. The
+# session must not have read anything yet, its snapshot has to start
+# after trending:next is set
+async def rebuild(session:AsyncSession, force:bool=False)->int:
+    from models import Recipe, Recipe_Review
+    client = get_redis()
+    running = await client.get(f'{KEY_PREFIX}next')
+    if running and not force:
+        raise RuntimeError(f'a rebuild of epoch {running} is running, --force takes over')
+    if running:
+        await client.delete(*(f'{KEY_PREFIX}{running}:{suffix}' for suffix in SUFFIXES))
+    # from here on new reviews are queued, whatever was queued before
+    # is either in the snapshot or was removed before it
+    epoch = max(int(time.time()), int(await client.get(f'{KEY_PREFIX}epoch') or 0) + 1)
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.delete(f'{KEY_PREFIX}queue')
+        pipe.set(f'{KEY_PREFIX}next', epoch)
+        await pipe.execute()
+    half_life = _half_life()
+    stmt = (select(Recipe_Review.recipe_id, Recipe.cusine, Recipe_Review.ratings,
+                   Recipe_Review.vote_type, Recipe_Review.date_of_publish)
+            .join(Recipe, Recipe.recipe_id == Recipe_Review.recipe_id)
+            .execution_options(yield_per=REBUILD_BATCH))
+    scores:dict[tuple[str, str], float] = {}
+    reviews = 0
+    try:
+        result = await session.stream(stmt)
+        async for rows in result.partitions():
+            for recipe_id, cuisine, ratings, vote_type, published in rows:
+                points = review_points(ratings, vote_type)
+                key = (str(recipe_id), cuisine.value)
+                scores[key] = scores.get(key, 0.0) + points * 2 ** ((published.timestamp() - epoch) / half_life)
+            reviews += len(rows)
+        await _add_scores(client, epoch, scores)
+        queued = await _finish(keys=[], args=[epoch, 60, *SUFFIXES])
+    except BaseException:
+        if await client.get(f'{KEY_PREFIX}next') == str(epoch):
+            await client.delete(f'{KEY_PREFIX}next', f'{KEY_PREFIX}queue',
+                                *(f'{KEY_PREFIX}{epoch}:{suffix}' for suffix in SUFFIXES))
+        raise
+    # the new sets are live, the settled queue is added to them
+    await _add_scores(client, epoch, await _settle(session, queued, epoch))
+    logger.info('trending rebuilt from %s reviews of %s recipes, epoch %s', reviews, len(scores), epoch)
+    return reviews
+
+
+# python trending.py [--force], run from the app directory
+async def _main(args):
+    from db import db_connection
+    import redis_client
+    await redis_client.open_redis()
+    try:
+        async with db_connection.AsyncSessionLocal() as session:
+            await rebuild(session, force=args.force)
+    finally:
+        await redis_client.close_redis()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Rebuild the trending recipe sets from the reviews')
+    parser.add_argument('--force', action='store_true', help='take over from a rebuild that did not finish')
+    sys.exit(asyncio.run(_main(parser.parse_args())))
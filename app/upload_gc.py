@@ -0,0 +1,49 @@
+from sqlalchemy import select, union
+from models import Chef, Recipe_Image
+import uploads
+import argparse, asyncio, json, os, sys
+
+
+# removes the uploaded files no recipe image or chef photo points at. A
+# failed commit leaves the images it published behind (see uploads.ingest),
+# run this periodically from the app's working directory, e.g. from cron:
+#   python app/upload_gc.py
+UPLOAD_DIRS = ('uploads/recipes', 'uploads/chefs')
+MIN_AGE = 3600
+
+
+async def referenced_paths(session)->set[str]:
+    stmt = union(select(Recipe_Image.image_url).where(Recipe_Image.image_url.is_not(None)),
+                 select(Chef.chef_photo).where(Chef.chef_photo.is_not(None)))
+    return set((await session.execute(stmt)).scalars())
+
+
+async def collect(session, directories=UPLOAD_DIRS, min_age:float=MIN_AGE, dry_run:bool=False)->list[str]:
+    referenced = await referenced_paths(session)
+    removed = []
+    for directory in directories:
+        for path in uploads.find_orphans(directory, referenced, min_age):
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            removed.append(path)
+    return removed
+
+
+async def _main(args):
+    from db import db_connection
+    async with db_connection.AsyncSessionLocal() as session:
+        removed = await collect(session, min_age=args.min_age, dry_run=args.dry_run)
+    await db_connection.async_engine.dispose()
+    print(json.dumps({'removed' if not args.dry_run else 'orphans':removed}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove uploaded files no row references')
+    parser.add_argument('--min-age', type=float, default=MIN_AGE,
+                        help='only remove files not published within this many seconds')
+    parser.add_argument('--dry-run', action='store_true', help='list the orphans without removing them')
+    sys.exit(asyncio.run(_main(parser.parse_args())))
@@ -0,0 +1,194 @@
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from config import settings
+import asyncio, hashlib, os, tempfile, time
+
+
+CHUNK_SIZE = 256 * 1024
+
+
+@dataclass
+class StagedFile:
+    temp_path:str
+    final_path:str
+
+
+def _open_temp(directory:str):
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.part')
+    return os.fdopen(fd, 'wb'), temp_path
+
+
+def _finish(buffer):
+    buffer.flush()
+    os.fsync(buffer.fileno())
+    buffer.close()
+
+
+def _unlink(path:str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# copy one upload in chunks into a temp file next to its final location,
+# giving up as soon as it grows past max_size. The file is named after the
+# sha256 of its content so the same image is only stored once per directory
+async def stage_upload(upload:UploadFile, directory:str, max_size:int)->StagedFile:
+    ext = upload.filename.lower().rsplit('.', 1)[-1]
+    buffer, temp_path = await run_in_threadpool(_open_temp, directory)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while chunk := await upload.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f'{upload.filename} exceeds the {max_size / (1024 * 1024):g} MB limit')
+            digest.update(chunk)
+            await run_in_threadpool(buffer.write, chunk)
+        await run_in_threadpool(_finish, buffer)
+    except BaseException:
+        buffer.close()
+        await run_in_threadpool(_unlink, temp_path)
+        raise
+    return StagedFile(temp_path=temp_path,
+                      final_path=os.path.join(directory, f'{digest.hexdigest()}.{ext}'))
+
+
+# link() creates the final path atomically or fails if it is there. The
+# file already on disk holds the same bytes and is left as it is, only its
+# mtime is refreshed so upload_gc sees it as recently published
+def _publish(staged:list[StagedFile]):
+    for item in staged:
+        try:
+            os.link(item.temp_path, item.final_path)
+        except FileExistsError:
+            os.utime(item.final_path)
+        _unlink(item.temp_path)
+
+
+def _rollback(staged:list[StagedFile]):
+    for item in staged:
+        _unlink(item.temp_path)
+
+
+# write every upload concurrently, then move them into place with an atomic
+# link and hand the final paths to the caller, so no row can ever point at
+# a half written file. A failure only removes the temp files: once
+# published a content addressed file may already be stored by another
+# request that linked the same bytes, so a failed commit leaves it behind
+# for upload_gc
+@asynccontextmanager
+async def ingest(uploads:list[UploadFile], directory:str, max_size:int):
+    tasks = [asyncio.ensure_future(stage_upload(upload, directory, max_size))
+             for upload in uploads]
+    try:
+        staged = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        await run_in_threadpool(_rollback, [item for item in results
+                                            if isinstance(item, StagedFile)])
+        raise
+
+    # the same image twice in one request stages two temp files for one path
+    unique = {}
+    for item in staged:
+        if item.final_path in unique:
+            await run_in_threadpool(_unlink, item.temp_path)
+        else:
+            unique[item.final_path] = item
+    staged = list(unique.values())
+
+    try:
+        await run_in_threadpool(_publish, staged)
+        yield [item.final_path for item in staged]
+    except BaseException:
+        await run_in_threadpool(_rollback, staged)
+        raise
+
+
+# files under directory (recursively) that no row references and that were
+# not published or re-published within min_age seconds. The references are
+# read before the files are looked at, a request still between publishing
+# and committing has touched its file and is younger than min_age
+def find_orphans(directory:str, referenced:set[str], min_age:float)->list[str]:
+    cutoff = time.time() - min_age
+    orphans = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                if path not in referenced and os.stat(path).st_mtime < cutoff:
+                    orphans.append(path)
+            except FileNotFoundError:
+                pass
+    return orphans
+
+
+# ASGI middleware rejecting upload requests whose body is larger than the
+# configured limit while it is still being received, instead of after
+# the whole multipart body has been spooled
+class UploadLimitMiddleware:
+    def __init__(self, app, limits:dict[str,int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope['path']) if scope['type'] == 'http' else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope['headers']:
+            if name == b'content-length' and value.isdigit() and int(value) > limit:
+                return await self._reject(send, limit)
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    exceeded = True
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            return message
+
+        rejected = False
+
+        async def limited_send(message):
+            nonlocal rejected
+            # whatever error the body parser turned the abort into,
+            # the client gets a 413
+            if exceeded and message['type'] == 'http.response.start':
+                rejected = True
+                return await self._reject(send, limit)
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, limited_send)
+
+    async def _reject(self, send, limit:int):
+        body = (b'{"detail":"Request body exceeds the %d bytes upload limit"}' % limit)
+        await send({'type':'http.response.start',
+                    'status':status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    'headers':[(b'content-type', b'application/json'),
+                               (b'content-length', str(len(body)).encode()),
+                               (b'connection', b'close')]})
+        await send({'type':'http.response.body','body':body})
+
+
+# largest body accepted on each upload route: the images plus room for
+# the other form fields
+UPLOAD_LIMITS = {
+    '/recipe/create':settings.MAX_RECIPE_IMAGES * settings.MAX_IMAGE_SIZE + 64 * 1024,
+    '/chef/update_photo':settings.MAX_IMAGE_SIZE + 16 * 1024,
+}
@@ -0,0 +1,58 @@
+"""Login hashing throughput: inline bcrypt vs the hashing pool.
+
+Runs N concurrent verifications the way a burst of /chef/sign_in calls
+would, once with bcrypt inline on the event loop (the old code path) and
+once through app/hashing.py, and reports verifies per second overall and
+per core.
+
+    python benchmarks/bench_hashing.py --logins 64 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('SECRET', 'bench')
+os.environ.setdefault('REFRESH_SECRET', 'bench')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+    args = parser.parse_args()
+
+    os.environ['BCRYPT_ROUNDS'] = str(args.rounds)
+    os.environ['HASH_POOL_WORKERS'] = str(args.workers)
+    os.environ['HASH_POOL_KIND'] = args.pool
+    import hashing
+
+    hashed = hashing.pwd_context.hash('password1')
+    cores = os.cpu_count()
+
+    async def inline():
+        async def one():
+            return hashing.pwd_context.verify('password1', hashed)
+        await asyncio.gather(*(one() for _ in range(args.logins)))
+
+    async def pooled():
+        await asyncio.gather(*(hashing.verify_and_update('password1', hashed)
+                               for _ in range(args.logins)))
+
+    for name, run in (('inline', inline), (f'{args.pool} pool', pooled)):
+        start = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        rate = args.logins / elapsed
+        print(f'{name:>14}: {rate:8.1f} logins/s  {rate / cores:7.1f} logins/s/core  '
+              f'({args.logins} logins in {elapsed:.2f}s, {cores} cores)')
+    hashing.shutdown_executor()
+
+
+if __name__ == '__main__':
+    main()
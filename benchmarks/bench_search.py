@@ -0,0 +1,111 @@
+"""Recipe search latency: ilike table scan vs the FTS5 index.
+
+Seeds a throwaway SQLite database with --recipes synthetic recipes, builds
+the recipe_fts index from app/search.py and times the old
+lower(ingredients) LIKE '%x%' filter against FTS5 MATCH queries ranked with
+bm25, both returning the first page of 10.
+
+    python benchmarks/bench_search.py --recipes 100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+from search import FTS_DDL, build_match, build_column_match  # noqa: E402
+
+BASE = ('tomato basil garlic onion pepper rice egg flour butter cream cheese '
+        'chicken beef pork tofu ginger soy lime chili cumin coriander potato '
+        'carrot celery mushroom spinach lemon honey vinegar olive pasta noodle '
+        'bean lentil yogurt mint parsley thyme rosemary saffron paprika').split()
+# ingredient vocabulary with a Zipf distribution, so like in a real
+# catalogue a few words are in many recipes and most are in few
+VOCABULARY = BASE + [f'{i}{word}' for i in range(120) for word in BASE[:40]]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+STEPS = ('chop stir simmer bake roast whisk fold season serve heat boil fry '
+         'drain mix knead rest grill slice dice mash blend pour cover cool').split()
+CUISINES = ('Italian', 'Chinese', 'Indian', 'Mexican', 'French')
+
+
+def seed(path, count):
+    random.seed(7)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE recipe (recipe_id CHAR(32) PRIMARY KEY, name VARCHAR(100), '
+                 'cusine VARCHAR, ingredients VARCHAR(1000), cooking_instructions VARCHAR(2000), '
+                 'date_of_publish DATETIME)')
+    conn.execute(FTS_DDL)
+    batch = []
+    for i in range(count):
+        ingredients = random.choices(VOCABULARY, WEIGHTS, k=8)
+        instructions = random.choices(STEPS, k=100) + ingredients[:3]
+        random.shuffle(instructions)
+        batch.append((uuid.uuid4().hex,
+                      f'{ingredients[0].title()} {random.choice(STEPS)} {i}',
+                      random.choice(CUISINES),
+                      ', '.join(ingredients),
+                      ' '.join(instructions),
+                      f'2025-01-01 00:00:{i % 60:02d}'))
+        if len(batch) == 5000:
+            conn.executemany('INSERT INTO recipe VALUES (?,?,?,?,?,?)', batch)
+            batch.clear()
+    conn.executemany('INSERT INTO recipe VALUES (?,?,?,?,?,?)', batch)
+    conn.execute('INSERT INTO recipe_fts(recipe_id, name, ingredients, cooking_instructions) '
+                 'SELECT recipe_id, name, ingredients, cooking_instructions FROM recipe')
+    conn.commit()
+    return conn
+
+
+def timed(conn, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        conn = seed(os.path.join(tmp, 'search.db'), args.recipes)
+        print(f'seeded {args.recipes} recipes in {time.perf_counter() - start:.1f}s')
+
+        scan = ("SELECT recipe_id FROM recipe WHERE lower(ingredients) LIKE ? "
+                "ORDER BY date_of_publish DESC, recipe_id DESC LIMIT 10")
+        ingredient_fts = ("SELECT recipe_id FROM recipe WHERE recipe_id IN "
+                          "(SELECT recipe_id FROM recipe_fts WHERE recipe_fts MATCH ?) "
+                          "ORDER BY date_of_publish DESC, recipe_id DESC LIMIT 10")
+        ranked = ("SELECT recipe.recipe_id, bm25(recipe_fts, 0.0, 10.0, 5.0, 1.0) AS rank "
+                  "FROM recipe JOIN recipe_fts ON recipe_fts.recipe_id = recipe.recipe_id "
+                  "WHERE recipe_fts MATCH ? ORDER BY rank, recipe.recipe_id LIMIT 10")
+        cases = []
+        # a common, a mid frequency and a rare ingredient
+        for word in ('tomato', 'saffron', '37mint'):
+            cases += [
+                (f'ilike scan      {word}', scan, (f'%{word}%',)),
+                (f'fts ingredient  {word}', ingredient_fts, (build_column_match('ingredients', word),)),
+                (f'fts ranked      {word}', ranked, (build_match(word),)),
+            ]
+        cases += [
+            ('fts ranked      saffron mint', ranked, (build_match('saffron mint'),)),
+            ('fts ranked      saff* OR lent*', ranked, (build_match('saff* OR lent*'),)),
+        ]
+        for name, sql, params in cases:
+            p50, p95 = timed(conn, sql, params, args.repeat)
+            print(f'{name:<32} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Serialization cost of a recipe page, per 1000 recipes.
+
+Builds recipes (with their images and, optionally, latest reviews) as ORM
+objects in memory and times turning them into a response body:
+  dicts + jsonable_encoder   the old path, recipes converted to dicts by
+                             hand, walked by jsonable_encoder and encoded
+                             with json.dumps the way JSONResponse does
+  models + orjson            schemas.Recipe_Schema_Out from the ORM rows,
+                             encoded by responses.dumps (cached routes)
+  models + response_model    the same models serialized by pydantic in json
+                             mode and encoded by ORJSONResponse (routes that
+                             return the models to FastAPI)
+No database is involved, only the conversion and the encoding.
+
+    python benchmarks/bench_serialization.py --recipes 1000 --latest-reviews 3
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('SECRET', 'bench')
+os.environ.setdefault('REFRESH_SECRET', 'bench')
+
+WORDS = ('tomato basil garlic onion pepper rice egg flour butter cream cheese '
+         'chicken beef pork tofu ginger soy lime chili cumin coriander potato').split()
+
+
+def make_recipes(count, images, reviews):
+    from models import Recipe, Recipe_Image, Recipe_Review
+    from schemas import Cuisine, Ratings, VoteType
+    random.seed(3)
+    now = datetime.now()
+    recipes, latest = [], {}
+    for i in range(count):
+        counts = [random.randrange(50) for _ in range(5)]
+        recipe = Recipe(recipe_id=uuid.uuid4(), chef_id=uuid.uuid4(),
+                        name=f'{random.choice(WORDS).title()} {i}',
+                        cusine=random.choice(list(Cuisine)),
+                        ingredients=', '.join(random.sample(WORDS, 8)),
+                        cooking_instructions=' '.join(random.choices(WORDS, k=60)),
+                        date_of_publish=now - timedelta(minutes=i),
+                        total_likes=random.randrange(100), total_dislikes=random.randrange(100),
+                        ratings_excellent=counts[0], ratings_very_good=counts[1],
+                        ratings_satisfactory=counts[2], ratings_disappointing=counts[3],
+                        ratings_unpalatable=counts[4], average_rating=random.uniform(1, 5))
+        recipe.images = [Recipe_Image(image_id=uuid.uuid4(), image_url=f'uploads/recipes/{uuid.uuid4().hex}.png')
+                         for _ in range(images)]
+        latest[recipe.recipe_id] = [
+            Recipe_Review(review_id=uuid.uuid4(), recipe_id=recipe.recipe_id, chef_id=uuid.uuid4(),
+                          comment_description='seeded review', date_of_publish=now,
+                          ratings=random.choice(list(Ratings)), vote_type=random.choice(list(VoteType)))
+            for _ in range(reviews)]
+        recipes.append(recipe)
+    return recipes, (latest if reviews else None)
+
+
+# the conversion recipe_logic did before the response models
+def old_recipe_dict(recipe, latest_reviews):
+    data = {
+        'name': recipe.name,
+        'cusine': recipe.cusine.value,
+        'cooking_instructions': recipe.cooking_instructions,
+        'chef_id': recipe.chef_id,
+        'recipe_id': recipe.recipe_id,
+        'ingredients': recipe.ingredients,
+        'date_of_publish': recipe.date_of_publish,
+        'images': [{'image_url': image.image_url} for image in recipe.images],
+        'total_likes': recipe.total_likes,
+        'total_dislikes': recipe.total_dislikes,
+        'total_reviews': recipe.total_reviews,
+        'average_rating': recipe.average_rating,
+        'ratings_histogram': recipe.ratings_histogram,
+    }
+    if latest_reviews is not None:
+        data['latest_reviews'] = [{'review_id': review.review_id,
+                                   'comment_description': review.comment_description,
+                                   'vote_type': review.vote_type.value,
+                                   'ratings': review.ratings.value,
+                                   'date_of_publish': review.date_of_publish,
+                                   'chef_id': review.chef_id,
+                                   'recipe_id': review.recipe_id}
+                                  for review in latest_reviews]
+    return data
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(function())
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), min(samples), size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type=int, default=1000)
+    parser.add_argument('--images', type=int, default=2, help='images per recipe')
+    parser.add_argument('--latest-reviews', type=int, default=0, help='latest reviews per recipe')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import ORJSONResponse
+    from pydantic import TypeAdapter
+    from routes.recipe_logic import recipe_out
+    from schemas import Recipe_Page_Out
+    import responses
+
+    recipes, latest = make_recipes(args.recipes, args.images, args.latest_reviews)
+
+    def reviews_of(recipe):
+        return latest[recipe.recipe_id] if latest else None
+
+    def old_path():
+        page = {'recipes': [old_recipe_dict(recipe, reviews_of(recipe)) for recipe in recipes],
+                'next_cursor': None}
+        return json.dumps(jsonable_encoder(page), ensure_ascii=False, allow_nan=False,
+                          indent=None, separators=(',', ':')).encode()
+
+    def cached_path():
+        page = Recipe_Page_Out(recipes=[recipe_out(recipe, reviews_of(recipe)) for recipe in recipes],
+                               next_cursor=None)
+        return responses.dumps(page)
+
+    adapter = TypeAdapter(Recipe_Page_Out)
+
+    def response_model_path():
+        page = Recipe_Page_Out(recipes=[recipe_out(recipe, reviews_of(recipe)) for recipe in recipes],
+                               next_cursor=None)
+        return ORJSONResponse(adapter.dump_python(page, mode='json', exclude_unset=True)).body
+
+    assert json.loads(old_path()) == json.loads(cached_path()) == json.loads(response_model_path())
+    per = 1000 / args.recipes
+    print(f'{args.recipes} recipes, {args.images} images and {args.latest_reviews} latest reviews each')
+    for name, function in (('dicts + jsonable_encoder', old_path),
+                           ('models + orjson', cached_path),
+                           ('models + response_model', response_model_path)):
+        median, best, size = timed(function, args.repeat)
+        print(f'{name:<26} {median * per:8.2f} ms per 1k recipes (best {best * per:.2f})  '
+              f'{size / 1024:.0f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Mixed read/write throughput of SQLite with and without the tuned mode.
+
+Runs the same workload twice on a freshly seeded database, once with
+SQLITE_TUNED=false (rollback journal, pysqlite defaults, one shared pool)
+and once with SQLITE_TUNED=true (WAL, pragmas, read pool plus a single
+writer connection). Readers page through /recipe/all's query, writers post
+reviews the way /recipe/review does. Each mode runs in its own process
+since the engines are built from the settings at import time. The reviews
+also go to the trending sets in REDIS_URL, without a Redis that step fails
+fast and is logged.
+
+    python benchmarks/bench_sqlite.py --readers 16 --writers 4 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'app'))
+sys.path.insert(0, HERE)
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))], 2)
+
+
+async def workload(seeded, args):
+    from sqlalchemy import select
+    from sqlalchemy.exc import OperationalError
+    from db import db_connection
+    from models import Chef
+    from schemas import Ratings, VoteType
+    from routes import recipe_logic
+    import redis_client
+
+    await redis_client.open_redis()
+    async with db_connection.AsyncSessionLocal() as session:
+        chef_ids = list((await session.execute(
+            select(Chef.chef_id).where(Chef.username.in_(seeded['reviewers'])))).scalars())
+    recipe_ids = [uuid.UUID(recipe_id) for recipe_id in seeded['recipe_ids']]
+    stats = {'read': [], 'write': [], 'errors': {}}
+    deadline = time.perf_counter() + args.seconds
+    slots = iter(range(10**9))
+
+    async def run(kind, operation):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                await operation()
+                stats[kind].append((time.perf_counter() - start) * 1000)
+            except OperationalError as e:
+                message = str(e.orig)
+                stats['errors'][message] = stats['errors'].get(message, 0) + 1
+
+    async def read():
+        async with db_connection.AsyncSessionLocal() as session:
+            await recipe_logic.list_all_recipes(random.choice((None, 'Italian', 'French')),
+                                                None, None, None, 20, recipe_logic.Fieldset(), session)
+
+    async def write():
+        slot = next(slots)
+        async with db_connection.WriteSessionLocal() as session:
+            await recipe_logic.recipe_review(recipe_ids[slot % len(recipe_ids)], 'bench',
+                                             random.choice(list(Ratings)), random.choice(list(VoteType)),
+                                             session, chef_ids[slot // len(recipe_ids) % len(chef_ids)])
+
+    await asyncio.gather(*(run('read', read) for _ in range(args.readers)),
+                         *(run('write', write) for _ in range(args.writers)))
+    await db_connection.write_engine.dispose()
+    await db_connection.async_engine.dispose()
+    await redis_client.close_redis()
+    return {kind: {'ops_per_s': round(len(stats[kind]) / args.seconds, 1),
+                   'p50_ms': percentile(stats[kind], 0.50),
+                   'p99_ms': percentile(stats[kind], 0.99)}
+            for kind in ('read', 'write')} | {'errors': stats['errors']}
+
+
+def child(args):
+    from seed import seed
+    seeded = seed(os.environ['BENCH_DB'], 50, args.recipes, 1, args.recipes * 2, 20)
+    print(json.dumps(asyncio.run(workload(seeded, args))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    results = {}
+    for tuned in ('false', 'true'):
+        workdir = tempfile.mkdtemp(prefix='food-app-sqlite-')
+        db_path = os.path.join(workdir, 'bench.db')
+        env = dict(os.environ,
+                   BENCH_DB=db_path,
+                   DB_URL=f'sqlite:///{db_path}',
+                   ASYNC_DB_URL=f'sqlite+aiosqlite:///{db_path}',
+                   SQLITE_TUNED=tuned,
+                   CACHE_ENABLED='false',
+                   DB_POOL_SIZE=str(args.readers + args.writers),
+                   ALGORITHM='HS256', SECRET='bench-secret', REFRESH_SECRET='bench-refresh-secret')
+        output = subprocess.run([sys.executable, __file__, '--child', *sys.argv[1:]],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        results[tuned] = json.loads(output.strip().splitlines()[-1])
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:.0f}s, {args.recipes} recipes')
+    for tuned, label in (('false', 'default'), ('true', 'tuned')):
+        result = results[tuned]
+        for kind in ('read', 'write'):
+            r = result[kind]
+            print(f'{label:<8} {kind:<6} {r["ops_per_s"]:>8} ops/s  p50 {r["p50_ms"] or 0:8.2f} ms  '
+                  f'p99 {r["p99_ms"] or 0:8.2f} ms')
+        print(f'{label:<8} errors {result["errors"] or "-"}')
+
+
+if __name__ == '__main__':
+    main()
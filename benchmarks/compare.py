@@ -0,0 +1,41 @@
+"""Compare two load_test.py result files route by route.
+
+    python benchmarks/compare.py benchmarks/results/abc1234-inprocess.json benchmarks/results/def5678-inprocess.json
+"""
+import json
+import sys
+
+METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return '     -'
+    return f'{(new - old) / old * 100:+6.1f}%'
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    with open(sys.argv[1]) as file:
+        old = json.load(file)
+    with open(sys.argv[2]) as file:
+        new = json.load(file)
+    print(f'{old["revision"]} ({old["mode"]}) -> {new["revision"]} ({new["mode"]})')
+    print(f'{"route":<20}' + ''.join(f'{metric:>26}' for metric in METRICS))
+    for route in new['routes']:
+        if route not in old['routes']:
+            continue
+        before, after = old['routes'][route], new['routes'][route]
+        cells = ''
+        for metric in METRICS:
+            a, b = before.get(metric), after.get(metric)
+            if a is None or b is None:
+                cells += f'{"-":>26}'
+            else:
+                cells += f'{a:>9.1f} -> {b:>7.1f} {change(a, b)}'
+        print(f'{route:<20}{cells}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""HTTP load test for the chef and recipe endpoints.
+
+Seeds a fresh SQLite database (see seed.py), then drives the app with a
+concurrent httpx client, either in-process through the ASGI transport or
+over a real uvicorn server, and reports throughput and p50/p95/p99 latency
+per route. Results are written as JSON so two commits can be compared
+with compare.py.
+
+    python benchmarks/load_test.py --mode inprocess
+    python benchmarks/load_test.py --mode uvicorn --workers 2 --concurrency 64
+    python benchmarks/compare.py benchmarks/results/<old>.json benchmarks/results/<new>.json
+
+Set BCRYPT_ROUNDS, DB_MODE, CACHE_ENABLED, ... in the environment to
+benchmark other settings; Redis is expected on localhost:6379 unless
+CACHE_ENABLED=false.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, '..', 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+import httpx  # noqa: E402
+
+ROUTES = ('chef_sign_in', 'chef_all', 'recipe_all', 'recipe_all_cuisine',
+          'recipe_search', 'recipe_one', 'recipe_review', 'recipe_chef_recipes')
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    index = min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))
+    return samples[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Scenario:
+    """Builds the requests for every route from the seeded data."""
+
+    def __init__(self, seeded, tokens):
+        self.seeded = seeded
+        self.tokens = tokens
+        self.review_slot = 0
+
+    def request(self, route):
+        recipe_ids = self.seeded['recipe_ids']
+        reviewer = random.choice(self.seeded['reviewers'])
+        auth = {'Authorization': f'Bearer {self.tokens[reviewer]}'}
+        if route == 'chef_sign_in':
+            from seed import BENCH_PASSWORD
+            return ('POST', '/chef/sign_in',
+                    {'data': {'username': random.choice(self.seeded['chefs']), 'password': BENCH_PASSWORD}})
+        if route == 'chef_all':
+            return ('GET', '/chef/all', {'headers': auth})
+        if route == 'recipe_all':
+            return ('GET', '/recipe/all', {'params': {'page_size': 20}})
+        if route == 'recipe_all_cuisine':
+            return ('GET', '/recipe/all', {'params': {'cusine': random.choice(('italian', 'french', 'indian')),
+                                                      'page_size': 20}})
+        if route == 'recipe_search':
+            return ('GET', '/recipe/all', {'params': {'q': random.choice(('tomato basil', 'rice OR noodle', 'chick*'))}})
+        if route == 'recipe_one':
+            return ('GET', f'/recipe/one/{random.choice(recipe_ids)}', {})
+        if route == 'recipe_review':
+            # walk (reviewer, recipe) pairs so every review is a new one
+            slot = self.review_slot
+            self.review_slot += 1
+            reviewer = self.seeded['reviewers'][slot // len(recipe_ids) % len(self.seeded['reviewers'])]
+            return ('POST', f'/recipe/review/{recipe_ids[slot % len(recipe_ids)]}',
+                    {'headers': {'Authorization': f'Bearer {self.tokens[reviewer]}'},
+                     'json': {'comment_description': 'load test', 'ratings': 'Very Good', 'vote_type': 'Like'}})
+        if route == 'recipe_chef_recipes':
+            return ('GET', '/recipe/chef_recipes', {'headers': auth})
+        raise ValueError(route)
+
+
+async def run_route(client, scenario, route, requests, concurrency):
+    latencies = []
+    errors = {}
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(scenario.request(route))
+
+    async def worker():
+        while True:
+            try:
+                method, url, kwargs = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            if status == 200:
+                latencies.append(elapsed * 1000)
+            else:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {'requests': requests,
+            'ok': len(latencies),
+            'errors': errors,
+            'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': max(latencies) if latencies else None}
+
+
+async def login_all(client, usernames):
+    from seed import BENCH_PASSWORD
+    tokens = {}
+    for username in usernames:
+        response = await client.post('/chef/sign_in', data={'username': username, 'password': BENCH_PASSWORD})
+        response.raise_for_status()
+        tokens[username] = response.json()['access_token']
+    return tokens
+
+
+async def drive(client, seeded, args):
+    tokens = await login_all(client, seeded['reviewers'])
+    scenario = Scenario(seeded, tokens)
+    results = {}
+    for route in args.routes:
+        # warm up pools and caches, then measure
+        await run_route(client, scenario, route, min(args.requests, 20), args.concurrency)
+        results[route] = await run_route(client, scenario, route, args.requests, args.concurrency)
+        summary = results[route]
+        print(f'{route:<20} {summary["throughput_rps"]!s:>8} req/s  p50 {fmt(summary["p50_ms"])}  '
+              f'p95 {fmt(summary["p95_ms"])}  p99 {fmt(summary["p99_ms"])}  errors {summary["errors"] or "-"}')
+    return results
+
+
+def fmt(value):
+    return f'{value:8.2f} ms' if value is not None else '       - ms'
+
+
+async def run_inprocess(seeded, args):
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            return await drive(client, seeded, args)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(seeded, args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(args.workers), '--log-level', 'warning', '--no-access-log'],
+        cwd=APP_DIR, env=os.environ.copy(), stdout=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            for _ in range(100):
+                try:
+                    await client.get('/docs')
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError('uvicorn did not start')
+            return await drive(client, seeded, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=('inprocess', 'uvicorn'), default='inprocess')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--chefs', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--images', type=int, default=2)
+    parser.add_argument('--reviews', type=int, default=20000)
+    parser.add_argument('--reviewers', type=int, default=20)
+    parser.add_argument('--output', help='defaults to benchmarks/results/<git rev>-<mode>.json')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='food-app-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    os.environ['DB_URL'] = f'sqlite:///{db_path}'
+    os.environ['ASYNC_DB_URL'] = f'sqlite+aiosqlite:///{db_path}'
+    os.environ.setdefault('ALGORITHM', 'HS256')
+    os.environ.setdefault('SECRET', 'bench-secret')
+    os.environ.setdefault('REFRESH_SECRET', 'bench-refresh-secret')
+    os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+    from seed import seed
+    start = time.perf_counter()
+    seeded = seed(db_path, args.chefs, args.recipes, args.images, args.reviews, args.reviewers,
+                  rounds=int(os.environ['BCRYPT_ROUNDS']))
+    print(f'seeded {args.recipes} recipes, {args.reviews} reviews in {time.perf_counter() - start:.1f}s')
+
+    runner = run_inprocess if args.mode == 'inprocess' else run_uvicorn
+    results = asyncio.run(runner(seeded, args))
+
+    revision = git_revision()
+    report = {'revision': revision,
+              'mode': args.mode,
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'cpus': os.cpu_count(),
+              'settings': {key: os.environ.get(key) for key in
+                           ('DB_MODE', 'BCRYPT_ROUNDS', 'CACHE_ENABLED', 'HASH_POOL_KIND')},
+              'params': {key: getattr(args, key) for key in
+                         ('workers', 'concurrency', 'requests', 'chefs', 'recipes', 'images', 'reviews')},
+              'routes': results}
+    output = args.output or os.path.join(HERE, 'results', f'{revision}-{args.mode}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'wrote {output}')
+
+
+if __name__ == '__main__':
+    main()
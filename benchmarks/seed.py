@@ -0,0 +1,139 @@
+"""Seed a SQLite database for the load tests.
+
+Creates the schema from app/models.py (plus the FTS index) and bulk inserts
+chefs, recipes, recipe images and reviews with their aggregates already
+computed. Every chef gets the password BENCH_PASSWORD. The first
+--reviewers chefs write no seeded reviews so the load test can post new
+ones without hitting an existing (chef, recipe) pair.
+
+    python benchmarks/seed.py /tmp/bench.db --chefs 200 --recipes 20000 --reviews 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('SECRET', 'bench-secret')
+os.environ.setdefault('REFRESH_SECRET', 'bench-refresh-secret')
+
+BENCH_PASSWORD = 'bench123'
+CUISINES = ('Italian', 'Chinese', 'Indian', 'Mexican', 'French')
+RATINGS = (('Excellent', 5), ('Very Good', 4), ('Satisfactory', 3),
+           ('Disappointing', 2), ('Unpalatable', 1))
+WORDS = ('tomato basil garlic onion pepper rice egg flour butter cream cheese '
+         'chicken beef pork tofu ginger soy lime chili cumin coriander potato '
+         'carrot celery mushroom spinach lemon honey vinegar olive pasta noodle').split()
+BATCH = 5000
+
+
+def _batched(connection, table, rows):
+    for start in range(0, len(rows), BATCH):
+        connection.execute(table.insert(), rows[start:start + BATCH])
+
+
+def seed(path, chefs, recipes, images, reviews, reviewers, rounds=4):
+    from sqlalchemy import create_engine
+    from passlib.hash import bcrypt
+    from models import Base, Chef, Recipe, Recipe_Image, Recipe_Review
+    import search
+
+    if os.path.exists(path):
+        os.remove(path)
+    random.seed(42)
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    password = bcrypt.using(rounds=rounds).hash(BENCH_PASSWORD)
+    now = datetime.now()
+
+    chef_rows = [{'chef_id': uuid.uuid4(), 'username': f'chef{i}', 'password': password,
+                  'email': f'chef{i}@example.com', 'date_of_birth': date(1990, 1, 1)}
+                 for i in range(chefs)]
+    recipe_rows = []
+    for i in range(recipes):
+        recipe_rows.append({
+            'recipe_id': uuid.uuid4(),
+            'name': f'{random.choice(WORDS).title()} {random.choice(WORDS)} {i}',
+            'cusine': random.choice(CUISINES),
+            'ingredients': ', '.join(random.sample(WORDS, 8)),
+            'cooking_instructions': ' '.join(random.choices(WORDS, k=150)),
+            'date_of_publish': now - timedelta(minutes=i),
+            'chef_id': random.choice(chef_rows)['chef_id'],
+        })
+    image_rows = [{'image_id': uuid.uuid4(),
+                   'image_url': f'uploads/recipes/{recipe["chef_id"]}/{uuid.uuid4().hex}.png',
+                   'recipe_id': recipe['recipe_id']}
+                  for recipe in recipe_rows for _ in range(images)]
+
+    # every (chef, recipe) pair is reviewed at most once
+    review_rows = []
+    pairs = set()
+    authors = chef_rows[reviewers:] or chef_rows
+    aggregates = {recipe['recipe_id']: {'likes': 0, 'dislikes': 0, 'ratings': [0] * 5}
+                  for recipe in recipe_rows}
+    while len(review_rows) < min(reviews, len(authors) * recipes):
+        chef = random.choice(authors)['chef_id']
+        recipe = random.choice(recipe_rows)['recipe_id']
+        if (chef, recipe) in pairs:
+            continue
+        pairs.add((chef, recipe))
+        rating = random.randrange(5)
+        vote = random.choice(('Like', 'Dislike'))
+        review_rows.append({'review_id': uuid.uuid4(), 'recipe_id': recipe, 'chef_id': chef,
+                            'comment_description': 'seeded review', 'date_of_publish': now,
+                            'ratings': RATINGS[rating][0], 'vote_type': vote})
+        aggregate = aggregates[recipe]
+        aggregate['likes' if vote == 'Like' else 'dislikes'] += 1
+        aggregate['ratings'][rating] += 1
+
+    for recipe in recipe_rows:
+        aggregate = aggregates[recipe['recipe_id']]
+        counts = aggregate['ratings']
+        total = sum(counts)
+        recipe.update(total_likes=aggregate['likes'],
+                      total_dislikes=aggregate['dislikes'],
+                      ratings_excellent=counts[0],
+                      ratings_very_good=counts[1],
+                      ratings_satisfactory=counts[2],
+                      ratings_disappointing=counts[3],
+                      ratings_unpalatable=counts[4],
+                      average_rating=(sum(count * score for count, (_, score) in zip(counts, RATINGS)) / total
+                                      if total else 0.0))
+
+    with engine.begin() as connection:
+        search.create_index(connection)
+        _batched(connection, Chef.__table__, chef_rows)
+        _batched(connection, Recipe.__table__, recipe_rows)
+        _batched(connection, Recipe_Image.__table__, image_rows)
+        _batched(connection, Recipe_Review.__table__, review_rows)
+        connection.exec_driver_sql('INSERT INTO recipe_fts_key(recipe_id) SELECT recipe_id FROM recipe')
+        connection.exec_driver_sql(
+            'INSERT INTO recipe_fts(rowid, recipe_id, name, ingredients, cooking_instructions) '
+            'SELECT fts_rowid, recipe.recipe_id, name, ingredients, cooking_instructions '
+            'FROM recipe JOIN recipe_fts_key ON recipe_fts_key.recipe_id = recipe.recipe_id')
+    engine.dispose()
+    return {'chefs': [chef['username'] for chef in chef_rows],
+            'reviewers': [chef['username'] for chef in chef_rows[:reviewers]],
+            'recipe_ids': [str(recipe['recipe_id']) for recipe in recipe_rows]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument('--chefs', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--images', type=int, default=2, help='images per recipe')
+    parser.add_argument('--reviews', type=int, default=20000)
+    parser.add_argument('--reviewers', type=int, default=20)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    seed(args.path, args.chefs, args.recipes, args.images, args.reviews, args.reviewers)
+    print(f'seeded {args.path} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import fakeredis
+import pytest
+from sqlalchemy import create_engine
+
+# the app imports its modules from the app directory, as when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('SECRET', 'test')
+os.environ.setdefault('REFRESH_SECRET', 'test')
+# the lowest bcrypt cost keeps signing up and in fast
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+# the engines are created when db_connection is imported, point them at a
+# throwaway database before any test gets there
+TEST_DIR = tempfile.mkdtemp(prefix='food-app-tests-')
+TEST_DB = os.path.join(TEST_DIR, 'test.db')
+os.environ.update(DB_URL=f'sqlite:///{TEST_DB}',
+                  ASYNC_DB_URL=f'sqlite+aiosqlite:///{TEST_DB}',
+                  CACHE_ENABLED='false')
+os.environ.pop('DB_REPLICA_URLS', None)
+
+
+
+# an empty schema in TEST_DB. Whatever an earlier test left, e.g. the
+# seeded query plan database, is dropped first
+@pytest.fixture
+def database():
+    from models import Base
+    import search
+    engine = create_engine(os.environ['DB_URL'])
+    try:
+        with engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS recipe_fts')
+            connection.exec_driver_sql('DROP TABLE IF EXISTS recipe_fts_key')
+            Base.metadata.drop_all(connection)
+            Base.metadata.create_all(connection)
+            search.create_index(connection)
+    finally:
+        engine.dispose()
+
+
+def _reset_process_state():
+    import revocation
+    revocation.principal_cache.clear()
+
+
+# run(coroutine) on one event loop for the whole test, with the app's
+# engines on the empty schema and Redis replaced by a fresh fakeredis
+@pytest.fixture
+def run(database):
+    from db import db_connection
+    import redis_client
+    loop = asyncio.new_event_loop()
+    redis_client._client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    try:
+        yield loop.run_until_complete
+    finally:
+        for engine in {db_connection.async_engine, db_connection.write_engine}:
+            loop.run_until_complete(engine.dispose())
+        loop.run_until_complete(redis_client.close_redis())
+        loop.close()
+        _reset_process_state()
+
+
+# the app behind a TestClient, its lifespan opens the fakeredis client.
+# Uploads land in tmp_path
+@pytest.fixture
+def client(database, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from db import db_connection
+    from main import app
+    import redis_client
+
+    async def open_redis():
+        if redis_client._client is None:
+            redis_client._client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(),
+                                                            decode_responses=True)
+
+    monkeypatch.setattr(redis_client, 'open_redis', open_redis)
+    monkeypatch.chdir(tmp_path)
+    try:
+        with TestClient(app) as client:
+            yield client
+            for engine in {db_connection.async_engine, db_connection.write_engine}:
+                client.portal.call(engine.dispose)
+    finally:
+        _reset_process_state()
+
+
+# signs up and signs in a chef, returns the Authorization header
+def sign_in(client, username, password='secret1'):
+    response = client.post('/chef/sign_up', json={'username':username,
+                                                 'password':password,
+                                                 'confirm_password':password,
+                                                 'email':f'{username}@example.com',
+                                                 'date_of_birth':'1990-01-01'})
+    assert response.status_code == 200, response.text
+    response = client.post('/chef/sign_in', data={'username':username, 'password':password})
+    assert response.status_code == 200, response.text
+    return {'Authorization':f"Bearer {response.json()['access_token']}"}
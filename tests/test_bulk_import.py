@@ -0,0 +1,130 @@
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+import bulk_import
+from db import db_connection
+from models import Recipe, Recipe_Image
+from conftest import sign_in
+
+
+def ndjson(*rows):
+    return '\n'.join(row if isinstance(row, str) else json.dumps(row) for row in rows).encode()
+
+
+def recipe(**fields):
+    return {'type':'recipe', 'name':'Risotto', 'cusine':'Italian', 'ingredients':'rice, saffron',
+            'cooking_instructions':'stir', **fields}
+
+
+def review(recipe_id, **fields):
+    return {'type':'review', 'recipe_id':str(recipe_id), 'comment_description':'great',
+            'ratings':'Excellent', 'vote_type':'Like', **fields}
+
+
+async def chunks(body):
+    yield body
+
+
+def post(client, headers, body, **params):
+    response = client.post('/recipe/import', headers=headers, content=body, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_rows_are_told_apart_by_type():
+    row = bulk_import._parse(json.dumps(review(uuid.uuid4())).encode())
+    assert isinstance(row, bulk_import.ImportReview)
+
+    with pytest.raises(ValueError) as error:
+        bulk_import._parse(json.dumps(review(uuid.uuid4(), name='Risotto')).encode())
+    assert 'review.name' in str(error.value)
+
+    with pytest.raises(ValueError) as error:
+        bulk_import._parse(b'{"type": "menu"}')
+    assert "'recipe', 'review'" in str(error.value)
+
+
+def test_http_import_rejects_images_and_publish_dates(client):
+    headers = sign_in(client, 'amy')
+    recipe_id = uuid.uuid4()
+
+    report = post(client, headers, ndjson(
+        recipe(recipe_id=str(recipe_id)),
+        recipe(images=['/etc/passwd']),
+        recipe(date_of_publish='2001-01-01T00:00:00'),
+        review(recipe_id, date_of_publish='2001-01-01T00:00:00')))
+
+    assert report['recipes'] == 1
+    assert report['reviews'] == 0
+    assert report['errors'] == [
+        {'line':2, 'error':'images can only be set by the command line import'},
+        {'line':3, 'error':'date_of_publish can only be set by the command line import'},
+        {'line':4, 'error':'date_of_publish can only be set by the command line import'}]
+
+
+def test_report_lists_errors_and_resumes_after_the_last_committed_line(client):
+    headers = sign_in(client, 'amy')
+    recipe_id = uuid.uuid4()
+    body = ndjson(recipe(recipe_id=str(recipe_id)),
+                  '{bad json',
+                  recipe(cusine='Klingon'),
+                  '',
+                  review(uuid.uuid4()),
+                  review(recipe_id, chef='bob'))
+
+    report = post(client, headers, body, batch_size=2)
+
+    assert report['recipes'] == 1
+    assert report['last_committed_line'] == 6
+    assert [entry['line'] for entry in report['errors']] == [2, 3, 5, 6]
+    assert report['errors'][3]['error'] == 'chef can only be set by the command line import'
+
+    again = post(client, headers, body)
+    assert again['recipes'] == 0
+    assert again['skipped'] == 1
+
+    resumed = post(client, headers, body, start_line=5)
+    assert resumed['start_line'] == 5
+    assert resumed['lines'] == 2
+    assert [entry['line'] for entry in resumed['errors']] == [5, 6]
+
+
+def test_imported_reviews_are_trending(client):
+    headers = sign_in(client, 'amy')
+    recipe_id = uuid.uuid4()
+
+    post(client, headers, ndjson(recipe(recipe_id=str(recipe_id)), review(recipe_id)))
+    # a review that is already stored is skipped and not counted again
+    post(client, headers, ndjson(review(recipe_id)))
+
+    (entry,) = client.get('/recipe/trending').json()
+    assert entry['recipe_id'] == str(recipe_id)
+    assert entry['trending_score'] == pytest.approx(3.0, rel=1e-3)
+
+
+def test_cli_import_keeps_images_and_publish_dates(client):
+    sign_in(client, 'amy')
+    recipe_id = uuid.uuid4()
+    published = datetime(2024, 5, 1, 12, 0)
+    body = ndjson(recipe(recipe_id=str(recipe_id), chef='amy', images=['uploads/risotto.png'],
+                         date_of_publish=published.isoformat()),
+                  recipe(name='Orphan'))
+
+    async def run_import():
+        async with db_connection.WriteSessionLocal() as session:
+            report = await bulk_import.run_import(session, chunks(body))
+            stored = await session.scalar(select(Recipe).where(Recipe.recipe_id == recipe_id))
+            images = (await session.execute(select(Recipe_Image.image_url)
+                                            .where(Recipe_Image.recipe_id == recipe_id))).scalars().all()
+            return report, stored.date_of_publish, images
+
+    report, date_of_publish, images = client.portal.call(run_import)
+
+    assert report.recipes == 1
+    assert report.errors == [{'line':2, 'error':'chef: field required'}]
+    assert date_of_publish == published
+    assert images == ['uploads/risotto.png']
@@ -0,0 +1,133 @@
+import uuid
+from dataclasses import dataclass
+
+import fakeredis
+import pytest
+from prometheus_client import REGISTRY
+
+import cache
+import redis_client
+from config import settings
+
+
+@dataclass
+class Recipe:
+    recipe_id:uuid.UUID
+    name:str
+
+
+@dataclass
+class Page:
+    recipes:list
+
+
+@pytest.fixture(autouse=True)
+def cache_enabled(monkeypatch):
+    monkeypatch.setattr(settings, 'CACHE_ENABLED', True)
+
+
+def lookups(name, result):
+    return REGISTRY.get_sample_value('recipe_cache_lookups_total', {'cache':name, 'result':result}) or 0
+
+
+# a load that counts its calls and returns the next version of the recipe
+def loader(recipe_id, during=None):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        if during:
+            await during()
+        return f'W/"{len(calls)}"', Recipe(recipe_id, f'version {len(calls)}')
+    return load, calls
+
+
+def test_second_read_is_a_hit(run):
+    recipe_id = uuid.uuid4()
+    load, calls = loader(recipe_id)
+    hits, misses = lookups('one', 'hit'), lookups('one', 'miss')
+
+    first = run(cache.get_recipe(recipe_id, 0, load))
+    second = run(cache.get_recipe(recipe_id, 0, load))
+
+    assert first == second == ('W/"1"', b'{"recipe_id":"%s","name":"version 1"}' % str(recipe_id).encode())
+    assert len(calls) == 1
+    assert lookups('one', 'miss') == misses + 1
+    assert lookups('one', 'hit') == hits + 1
+
+
+def test_write_invalidates_the_recipe_and_the_lists_holding_it(run):
+    recipe_id, other_id = uuid.uuid4(), uuid.uuid4()
+    load, calls = loader(recipe_id)
+    pages = []
+
+    async def load_page():
+        pages.append(1)
+        return f'W/"page-{len(pages)}"', Page([Recipe(recipe_id, 'risotto')])
+
+    async def scenario():
+        await cache.get_recipe(recipe_id, 0, load)
+        await cache.get_recipe_list({'cusine':None}, load_page)
+        await cache.invalidate_recipes(other_id)
+        await cache.get_recipe(recipe_id, 0, load)
+        await cache.get_recipe_list({'cusine':None}, load_page)
+        await cache.invalidate_recipes(recipe_id)
+        return (await cache.get_recipe(recipe_id, 0, load),
+                await cache.get_recipe_list({'cusine':None}, load_page))
+
+    (etag, _), (page_etag, _) = run(scenario())
+
+    assert (len(calls), len(pages)) == (2, 2)
+    assert (etag, page_etag) == ('W/"2"', 'W/"page-2"')
+
+
+def test_new_recipe_starts_a_new_list_generation(run):
+    pages = []
+
+    async def load_page():
+        pages.append(1)
+        return f'W/"page-{len(pages)}"', Page([])
+
+    async def scenario():
+        await cache.get_recipe_list({'q':'risotto'}, load_page)
+        await cache.invalidate_lists()
+        return await cache.get_recipe_list({'q':'risotto'}, load_page)
+
+    etag, body = run(scenario())
+
+    assert etag == 'W/"page-2"'
+    assert body == b'{"recipes":[]}'
+
+
+# the recipe changed after the read noted the write sequence, what it
+# loaded may be the old version and is not cached
+def test_fill_is_refused_when_the_recipe_changed_during_the_load(run):
+    recipe_id = uuid.uuid4()
+    load, calls = loader(recipe_id, during=lambda: cache.invalidate_recipes(recipe_id))
+
+    async def scenario():
+        await cache.get_recipe(recipe_id, 0, load)
+        return await redis_client.get_redis().keys('recipe:one:*')
+
+    assert run(scenario()) == []
+    assert len(calls) == 1
+
+
+def test_reads_fall_back_to_the_database_when_redis_is_down(run, monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_client, '_client', fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    server.connected = False
+    recipe_id = uuid.uuid4()
+    load, calls = loader(recipe_id)
+    errors = lookups('one', 'error')
+
+    async def scenario():
+        first = await cache.get_recipe(recipe_id, 0, load)
+        # invalidation only logs, the write it follows has committed
+        await cache.invalidate_recipes(recipe_id)
+        return first, await cache.get_recipe(recipe_id, 0, load)
+
+    first, second = run(scenario())
+
+    assert (first[0], second[0]) == ('W/"1"', 'W/"2"')
+    assert lookups('one', 'error') == errors + 2
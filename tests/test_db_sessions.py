@@ -0,0 +1,48 @@
+import uuid
+from datetime import date
+
+from sqlalchemy import insert, select
+
+from db import db_connection
+from models import Chef, Recipe
+from routes import recipe_logic
+
+
+async def add_recipe(name):
+    async with db_connection.WriteSessionLocal() as session:
+        chef_id = uuid.uuid4()
+        await session.execute(insert(Chef).values(chef_id=chef_id, username=name, password='x',
+                                                  email=f'{name}@example.com', date_of_birth=date(1990, 1, 1)))
+        session.add(Recipe(name=name, cusine='Italian', ingredients='rice', cooking_instructions='stir',
+                           chef_id=chef_id))
+        await session.commit()
+
+
+def test_routes_get_async_sessions_by_default():
+    assert db_connection.get_read_db is db_connection.get_async_db
+    assert db_connection.get_write_db is db_connection.get_async_write_db
+    assert db_connection.get_primary_db is db_connection.get_async_db
+
+
+def test_writes_are_read_back_through_the_read_pool(run):
+    async def scenario():
+        await add_recipe('risotto')
+        async with db_connection.AsyncSessionLocal() as session:
+            return (await session.execute(select(Recipe.name))).scalars().all()
+
+    assert db_connection.write_engine is not db_connection.async_engine
+    assert run(scenario()) == ['risotto']
+
+
+# DB_MODE=sync hands the same logic the blocking session behind the same
+# awaitable interface
+def test_blocking_session_runs_the_same_logic(run):
+    run(add_recipe('risotto'))
+    session = db_connection.BlockingSession(db_connection.Session())
+    try:
+        page = run(recipe_logic.list_all_recipes(None, None, None, None, 20, recipe_logic.Fieldset(), session))
+    finally:
+        run(session.close())
+        db_connection.engine.dispose()
+
+    assert [recipe.name for recipe in page.recipes] == ['risotto']
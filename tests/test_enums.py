@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import SmallInteger, select, text
+
+from db import db_connection
+from models import ENUM_CODES, Recipe, Recipe_Review
+from schemas import Cuisine, Ratings, VoteType
+from conftest import sign_in
+
+
+def test_codes_are_unique_per_enum():
+    for enum_class, codes in ENUM_CODES.items():
+        assert set(codes) == set(enum_class)
+        assert len(set(codes.values())) == len(codes)
+
+
+@pytest.mark.parametrize('column', [Recipe.cusine, Recipe_Review.ratings, Recipe_Review.vote_type])
+def test_enum_columns_are_small_integers(column):
+    assert isinstance(column.type.impl_instance, SmallInteger)
+
+
+def test_codes_are_stored_and_names_returned(client):
+    chef, reviewer = sign_in(client, 'amy'), sign_in(client, 'bob')
+    response = client.post('/recipe/create', headers=chef,
+                           data={'name':'Tacos', 'cusine':'Mexican', 'ingrediensts':'corn',
+                                 'cooking_instructions':'fold'})
+    assert response.status_code == 200, response.text
+    recipe_id = client.get('/recipe/all').json()['recipes'][0]['recipe_id']
+    response = client.post(f'/recipe/review/{recipe_id}', headers=reviewer,
+                           json={'comment_description':'good', 'ratings':'Very Good', 'vote_type':'Dislike'})
+    assert response.status_code == 200, response.text
+
+    async def stored():
+        async with db_connection.AsyncSessionLocal() as session:
+            raw = (await session.execute(text(
+                'SELECT recipe.cusine, ratings, vote_type FROM recipe_review '
+                'JOIN recipe ON recipe.recipe_id = recipe_review.recipe_id'))).one()
+            loaded = (await session.execute(select(Recipe.cusine, Recipe_Review.ratings, Recipe_Review.vote_type)
+                                            .join(Recipe_Review.recipe))).one()
+            return tuple(raw), tuple(loaded)
+
+    raw, loaded = client.portal.call(stored)
+
+    assert raw == (4, 4, 0)
+    assert loaded == (Cuisine.MEXICAN, Ratings.VERY_GOOD, VoteType.DISLIKE)
+    (review,) = client.get(f'/recipe/{recipe_id}/reviews').json()['reviews']
+    assert (review['ratings'], review['vote_type']) == ('Very Good', 'Dislike')
+    recipe = client.get(f'/recipe/one/{recipe_id}').json()
+    assert recipe['cusine'] == 'Mexican'
+
+
+def test_cuisine_filter_takes_the_label(client):
+    headers = sign_in(client, 'amy')
+    for name, cuisine in (('Tacos', 'Mexican'), ('Risotto', 'Italian')):
+        client.post('/recipe/create', headers=headers,
+                    data={'name':name, 'cusine':cuisine, 'ingrediensts':'corn', 'cooking_instructions':'cook'})
+
+    assert [recipe['name'] for recipe in client.get('/recipe/all', params={'cusine':'mexican'}).json()['recipes']] == ['Tacos']
+    assert client.get('/recipe/all', params={'cusine':'Klingon'}).json()['recipes'] == []
@@ -0,0 +1,111 @@
+import pytest
+from sqlalchemy import event
+
+from config import settings
+from db import db_connection
+from conftest import sign_in
+
+
+@pytest.fixture
+def statements():
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement)
+
+    engines = {db_connection.async_engine, db_connection.write_engine}
+    for engine in engines:
+        event.listen(engine.sync_engine, 'before_cursor_execute', record)
+    yield recorded
+    for engine in engines:
+        event.remove(engine.sync_engine, 'before_cursor_execute', record)
+
+
+def create_recipe(client, headers, name='Risotto'):
+    response = client.post('/recipe/create', headers=headers,
+                           data={'name':name, 'cusine':'Italian', 'ingrediensts':'rice, saffron',
+                                 'cooking_instructions':'stir'})
+    assert response.status_code == 200, response.text
+    recipes = client.get('/recipe/all', params={'q':name}).json()['recipes']
+    return recipes[0]['recipe_id']
+
+
+def review(client, headers, recipe_id):
+    response = client.post(f'/recipe/review/{recipe_id}', headers=headers,
+                           json={'comment_description':'great', 'ratings':'Excellent', 'vote_type':'Like'})
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.parametrize('path', ['/recipe/one/{recipe_id}', '/recipe/all'])
+def test_matching_etag_is_not_modified_until_a_review(client, path):
+    chef, reviewer = sign_in(client, 'amy'), sign_in(client, 'bob')
+    recipe_id = create_recipe(client, chef)
+    path = path.format(recipe_id=recipe_id)
+
+    first = client.get(path)
+    etag = first.headers['etag']
+    assert etag.startswith('W/"')
+
+    cached = client.get(path, headers={'If-None-Match':etag})
+    assert cached.status_code == 304
+    assert cached.headers['etag'] == etag
+    assert not cached.content
+    assert client.get(path, headers={'If-None-Match':f'W/"other", {etag}'}).status_code == 304
+
+    review(client, reviewer, recipe_id)
+    changed = client.get(path, headers={'If-None-Match':etag})
+    assert changed.status_code == 200
+    assert changed.headers['etag'] != etag
+
+
+def test_etag_depends_on_the_latest_reviews_asked_for(client):
+    recipe_id = create_recipe(client, sign_in(client, 'amy'))
+
+    plain = client.get(f'/recipe/one/{recipe_id}').headers['etag']
+    with_reviews = client.get(f'/recipe/one/{recipe_id}', params={'latest_reviews':3}).headers['etag']
+
+    assert plain != with_reviews
+    assert client.get(f'/recipe/one/{recipe_id}', params={'latest_reviews':3},
+                      headers={'If-None-Match':plain}).status_code == 200
+
+
+@pytest.mark.parametrize('path', ['/recipe/one/{recipe_id}', '/recipe/all'])
+def test_cached_etag_is_answered_without_sql(client, statements, monkeypatch, path):
+    monkeypatch.setattr(settings, 'CACHE_ENABLED', True)
+    recipe_id = create_recipe(client, sign_in(client, 'amy'))
+    path = path.format(recipe_id=recipe_id)
+    first = client.get(path)
+    etag = first.headers['etag']
+
+    statements.clear()
+    hit = client.get(path)
+    not_modified = client.get(path, headers={'If-None-Match':etag})
+
+    assert hit.content == first.content
+    assert hit.headers['etag'] == etag
+    assert not_modified.status_code == 304
+    assert statements == []
+
+
+def test_cached_recipe_gets_a_new_etag_after_a_review(client, monkeypatch):
+    monkeypatch.setattr(settings, 'CACHE_ENABLED', True)
+    chef, reviewer = sign_in(client, 'amy'), sign_in(client, 'bob')
+    recipe_id = create_recipe(client, chef)
+    etag = client.get(f'/recipe/one/{recipe_id}').headers['etag']
+
+    review(client, reviewer, recipe_id)
+    response = client.get(f'/recipe/one/{recipe_id}', headers={'If-None-Match':etag})
+
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+    assert response.json()['total_likes'] == 1
+
+
+def test_chef_list_etag_follows_profile_changes(client):
+    headers = sign_in(client, 'amy')
+    etag = client.get('/chef/all', headers=headers).headers['etag']
+
+    assert client.get('/chef/all', headers={**headers, 'If-None-Match':etag}).status_code == 304
+
+    sign_in(client, 'bob')
+    assert client.get('/chef/all', headers={**headers, 'If-None-Match':etag}).status_code == 200
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import event
+
+from config import settings
+from db import db_connection
+from conftest import sign_in
+
+
+@pytest.fixture
+def statements():
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement)
+
+    event.listen(db_connection.async_engine.sync_engine, 'before_cursor_execute', record)
+    yield recorded
+    event.remove(db_connection.async_engine.sync_engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def chef(client):
+    headers = sign_in(client, 'amy')
+    response = client.post('/recipe/create', headers=headers,
+                           data={'name':'Risotto', 'cusine':'Italian', 'ingrediensts':'rice',
+                                 'cooking_instructions':'stir'})
+    assert response.status_code == 200, response.text
+    recipe_id = client.get('/recipe/all').json()['recipes'][0]['recipe_id']
+    for username in ('bob', 'cy', 'dee', 'eve'):
+        response = client.post(f'/recipe/review/{recipe_id}', headers=sign_in(client, username),
+                               json={'comment_description':'great', 'ratings':'Excellent', 'vote_type':'Like'})
+        assert response.status_code == 200, response.text
+    return headers
+
+
+@pytest.mark.parametrize('path', ['/recipe/all', '/recipe/chef_recipes'])
+def test_only_the_fields_asked_for_are_returned(client, chef, path):
+    def listed(**params):
+        body = client.get(path, headers=chef, params=params).json()
+        return body['recipes'] if path == '/recipe/all' else body
+
+    (recipe,) = listed(fields='name, total_likes')
+    assert set(recipe) == {'recipe_id', 'name', 'total_likes', 'images'}
+    assert recipe['total_likes'] == 4
+
+    (recipe,) = listed(fields='average_rating', include='')
+    assert set(recipe) == {'recipe_id', 'average_rating'}
+
+    (recipe,) = listed(fields='name', include='reviews')
+    assert set(recipe) == {'recipe_id', 'name', 'latest_reviews'}
+    assert len(recipe['latest_reviews']) == settings.INCLUDED_REVIEWS
+
+
+def test_unknown_field_or_include_is_rejected(client, chef):
+    response = client.get('/recipe/all', params={'fields':'name,secret'})
+    assert response.status_code == 400
+    assert response.json()['detail'].startswith('unknown fields: secret; allowed: recipe_id, name')
+
+    response = client.get('/recipe/chef_recipes', headers=chef, params={'include':'chef'})
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'unknown include: chef; allowed: images, reviews'
+
+
+def test_sparse_listing_selects_only_its_columns(client, chef, statements):
+    client.get('/recipe/all', params={'fields':'name', 'include':''})
+
+    (select_recipes,) = [statement for statement in statements if 'FROM recipe' in statement]
+    assert 'recipe.name' in select_recipes
+    assert 'cooking_instructions' not in select_recipes
+    assert not any('recipe_image' in statement for statement in statements)
@@ -0,0 +1,51 @@
+import threading
+
+from passlib.context import CryptContext
+from passlib.hash import bcrypt
+from sqlalchemy import select
+
+import hashing
+from db import db_connection
+from models import Chef
+from conftest import sign_in
+
+
+def test_hashing_runs_off_the_event_loop(run, monkeypatch):
+    threads = []
+    hash_in_pool = hashing._hash
+
+    def recording_hash(password):
+        threads.append(threading.get_ident())
+        return hash_in_pool(password)
+
+    monkeypatch.setattr(hashing, '_hash', recording_hash)
+    try:
+        hashed = run(hashing.hash_password('secret1'))
+        valid = run(hashing.verify_and_update('secret1', hashed))
+        invalid = run(hashing.verify_and_update('wrong', hashed))
+    finally:
+        hashing.shutdown_executor()
+
+    assert threads and threads[0] != threading.get_ident()
+    assert valid == (True, None)
+    assert invalid == (False, None)
+
+
+def test_hash_below_the_configured_cost_is_upgraded_on_sign_in(client, monkeypatch):
+    sign_in(client, 'amy')
+
+    async def stored_hash():
+        async with db_connection.AsyncSessionLocal() as session:
+            return await session.scalar(select(Chef.password).where(Chef.username == 'amy'))
+
+    assert bcrypt.from_string(client.portal.call(stored_hash)).rounds == 4
+    monkeypatch.setattr(hashing, 'pwd_context', CryptContext(schemes=['bcrypt'], deprecated='auto',
+                                                             bcrypt__default_rounds=5,
+                                                             bcrypt__min_rounds=5))
+
+    response = client.post('/chef/sign_in', data={'username':'amy', 'password':'secret1'})
+
+    assert response.status_code == 200
+    upgraded = client.portal.call(stored_hash)
+    assert bcrypt.from_string(upgraded).rounds == 5
+    assert bcrypt.verify('secret1', upgraded)
@@ -0,0 +1,74 @@
+import uuid
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import insert
+
+from db import db_connection
+from models import Chef, Recipe
+from pagination import encode_cursor
+from conftest import sign_in
+
+
+# recipes published in pairs at the same instant, so recipe_id has to
+# break the ties
+async def add_recipes(count):
+    async with db_connection.WriteSessionLocal() as session:
+        chef_id = uuid.uuid4()
+        await session.execute(insert(Chef).values(chef_id=chef_id, username='amy', password='x',
+                                                  email='amy@example.com', date_of_birth=date(1990, 1, 1)))
+        await session.execute(insert(Recipe), [
+            {'recipe_id':uuid.uuid4(), 'name':f'Recipe {number}', 'cusine':'Italian', 'ingredients':'rice',
+             'cooking_instructions':'stir', 'chef_id':chef_id,
+             'date_of_publish':datetime(2024, 1, 1 + number // 2)}
+            for number in range(count)])
+        await session.commit()
+
+
+def pages(client, **params):
+    seen, cursor = [], None
+    while True:
+        response = client.get('/recipe/all', params={**params, **({'cursor':cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        seen.append([recipe['recipe_id'] for recipe in body['recipes']])
+        cursor = body.get('next_cursor')
+        if cursor is None:
+            return seen
+
+
+def test_pages_cover_every_recipe_once_newest_first(client):
+    client.portal.call(add_recipes, 7)
+
+    seen = pages(client, page_size=2)
+
+    assert [len(page) for page in seen] == [2, 2, 2, 1]
+    ids = [recipe_id for page in seen for recipe_id in page]
+    assert len(set(ids)) == 7
+    listed = client.get('/recipe/all', params={'page_size':7}).json()['recipes']
+    assert ids == [recipe['recipe_id'] for recipe in listed]
+    published = [recipe['date_of_publish'] for recipe in listed]
+    assert published == sorted(published, reverse=True)
+
+
+def test_search_pages_cover_every_match_once(client):
+    headers = sign_in(client, 'amy')
+    for name in ('Risotto', 'Saffron risotto', 'Mushroom risotto', 'Lasagne'):
+        response = client.post('/recipe/create', headers=headers,
+                               data={'name':name, 'cusine':'Italian', 'ingrediensts':'rice',
+                                     'cooking_instructions':'stir'})
+        assert response.status_code == 200, response.text
+
+    seen = pages(client, q='risotto', page_size=1)
+
+    assert [len(page) for page in seen] == [1, 1, 1]
+    assert len({recipe_id for page in seen for recipe_id in page}) == 3
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor', encode_cursor(['yesterday', str(uuid.uuid4())]),
+                                    encode_cursor(['2024-01-01T00:00:00'])])
+def test_bad_cursor_is_rejected(client, cursor):
+    response = client.get('/recipe/all', params={'cursor':cursor})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Invalid cursor'
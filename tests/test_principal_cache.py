@@ -0,0 +1,76 @@
+import time
+
+import revocation
+import redis_client
+from routes.chef_logic import Principal
+from conftest import sign_in
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def rename(client, headers, username):
+    return client.patch('/chef/update_data', headers=headers,
+                        json={'username':username, 'email':f'{username}@example.com',
+                              'date_of_birth':'1990-01-01'})
+
+
+def test_principal_is_cached_after_the_first_request(client):
+    headers = sign_in(client, 'amy')
+    assert revocation.principal_cache.get('amy') is None
+
+    assert client.get('/chef/all', headers=headers).status_code == 200
+
+    principal = revocation.principal_cache.get('amy')
+    assert principal.username == 'amy'
+    assert client.get('/chef/all', headers=headers).status_code == 200
+    assert revocation.principal_cache.get('amy') is principal
+
+
+def test_rename_and_removal_evict_the_principal(client):
+    headers = sign_in(client, 'amy')
+    assert client.get('/chef/all', headers=headers).status_code == 200
+
+    assert rename(client, headers, 'amelia').status_code == 200
+
+    # the old token names a chef that is gone
+    assert revocation.principal_cache.get('amy') is None
+    assert client.get('/chef/all', headers=headers).status_code == 401
+
+    headers = sign_in(client, 'bob')
+    assert client.get('/chef/all', headers=headers).status_code == 200
+    assert client.delete('/chef/remove_account', headers=headers).status_code == 200
+    assert client.get('/chef/all', headers=headers).status_code == 401
+
+
+def test_eviction_published_by_another_worker_is_applied(client):
+    headers = sign_in(client, 'amy')
+    assert client.get('/chef/all', headers=headers).status_code == 200
+
+    client.portal.call(redis_client.get_redis().publish, revocation.PRINCIPAL_CHANNEL, 'amy')
+
+    wait_for(lambda: revocation.principal_cache.get('amy') is None)
+
+
+# a lookup that started before an eviction may have read the old row
+def test_lookup_racing_an_eviction_is_not_cached():
+    seen = revocation.principal_evictions()
+    revocation._evict_principal('amy')
+
+    revocation.cache_principal('amy', Principal(username='amy', chef_id=None), seen)
+
+    assert revocation.principal_cache.get('amy') is None
+
+
+def test_cache_is_cleared_when_the_subscription_starts_again(client):
+    headers = sign_in(client, 'amy')
+    assert client.get('/chef/all', headers=headers).status_code == 200
+    client.portal.call(revocation.stop)
+
+    client.portal.call(revocation.start)
+
+    assert revocation.principal_cache.get('amy') is None
@@ -0,0 +1,159 @@
+"""The hot queries of recipe_logic and chef_logic use their indexes.
+
+Seeds a throwaway SQLite database (schema from app/models.py), runs
+ANALYZE, then calls the logic functions themselves while recording every
+statement they send. Each statement is run again under EXPLAIN QUERY PLAN
+and a check fails when
+  - a plan scans recipe, recipe_review, recipe_image or chef without an
+    index, or
+  - an index the check expects is not used by any of its statements.
+The trending and cache updates of the removals go to fakeredis.
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import sys
+from datetime import timedelta
+
+import fakeredis
+import pytest
+from sqlalchemy import event, select
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from conftest import TEST_DB, TEST_DIR
+from db import db_connection
+from models import Chef, Recipe, Recipe_Review
+from routes import chef_logic, recipe_logic
+import redis_client
+
+RECIPES = 2000
+# an fts5 scan without a MATCH or rowid constraint reads the whole index
+FULL_SCAN = re.compile(r'^SCAN (recipe|recipe_review|recipe_image|chef)\b(?!.*\bUSING\b)'
+                       r'|^SCAN recipe_fts VIRTUAL TABLE INDEX \d+:$')
+FULL = recipe_logic.Fieldset()
+
+
+def explain(statements):
+    conn = sqlite3.connect(TEST_DB)
+    try:
+        return [(statement, [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)])
+                for statement, parameters in statements]
+    finally:
+        conn.close()
+
+
+class Plans:
+    def __init__(self, loop):
+        self.loop = loop
+        self.recorded = []
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            self.recorded.append((statement, parameters))
+
+    # the statements call(self, session) sends
+    def run(self, call):
+        async def run():
+            async with db_connection.WriteSessionLocal() as session:
+                await call(self, session)
+        self.recorded.clear()
+        self.loop.run_until_complete(run())
+        return list(self.recorded)
+
+    async def load(self):
+        async with db_connection.AsyncSessionLocal() as session:
+            self.recipe = (await session.execute(
+                select(Recipe).where(Recipe.recipe_id.in_(
+                    select(Recipe_Review.recipe_id))).limit(1))).scalar()
+            self.reviewer = (await session.execute(
+                select(Chef).where(Chef.chef_id.in_(select(Recipe_Review.chef_id)),
+                                   Chef.chef_id.in_(select(Recipe.chef_id))).limit(1))).scalar()
+            self.first_page = await recipe_logic.list_all_recipes(None, None, None, None, 20, FULL, session)
+        self.token = chef_logic.create_access_token(timedelta(minutes=5), {'sub': self.reviewer.username})
+        self.principal = chef_logic.Principal(username=self.reviewer.username, chef_id=self.reviewer.chef_id)
+
+
+@pytest.fixture(scope='module')
+def plans():
+    from seed import seed
+    seed(TEST_DB, 100, RECIPES, 1, RECIPES * 4, 5)
+    conn = sqlite3.connect(TEST_DB)
+    conn.execute('ANALYZE')
+    conn.close()
+
+    # remove_account clears the chef's upload folders relative to the cwd
+    cwd = os.getcwd()
+    os.chdir(TEST_DIR)
+    loop = asyncio.new_event_loop()
+    redis_client._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    plans = Plans(loop)
+    engines = {db_connection.async_engine, db_connection.write_engine}
+    for engine in engines:
+        event.listen(engine.sync_engine, 'before_cursor_execute', plans.record)
+    try:
+        loop.run_until_complete(plans.load())
+        yield plans
+    finally:
+        for engine in engines:
+            event.remove(engine.sync_engine, 'before_cursor_execute', plans.record)
+            loop.run_until_complete(engine.dispose())
+        loop.run_until_complete(redis_client.close_redis())
+        loop.close()
+        os.chdir(cwd)
+
+
+async def export_by_chef(plans, session):
+    async for _ in recipe_logic.export_recipes('ndjson', None, plans.reviewer.chef_id, None, None):
+        pass
+
+
+# (name, call, indexes at least one statement must use). They run in this
+# order on one database, the ones that delete come last
+CHECKS = [
+    ('recipe list', lambda p, s: recipe_logic.list_all_recipes(None, None, None, None, 20, FULL, s),
+     {'ix_recipe_date_of_publish_recipe_id', 'ix_recipe_image_recipe_id'}),
+    ('recipe list, next page',
+     lambda p, s: recipe_logic.list_all_recipes(None, None, None, p.first_page.next_cursor, 20, FULL, s),
+     {'ix_recipe_date_of_publish_recipe_id'}),
+    ('recipe list by cuisine', lambda p, s: recipe_logic.list_all_recipes('Italian', None, None, None, 20, FULL, s),
+     {'ix_recipe_cusine_date_of_publish_recipe_id'}),
+    ('recipe list, sparse fields',
+     lambda p, s: recipe_logic.list_all_recipes(None, None, None, None, 20,
+                                                recipe_logic.recipe_fieldset('name,cusine', ''), s),
+     {'ix_recipe_date_of_publish_recipe_id'}),
+    ('recipe list with latest reviews',
+     lambda p, s: recipe_logic.list_all_recipes(None, None, None, None, 20, recipe_logic.Fieldset(reviews=3), s),
+     {'ix_recipe_review_recipe_id_date_of_publish_review_id'}),
+    ('chef recipes etag', lambda p, s: recipe_logic.chef_recipes_version(s, p.reviewer.chef_id),
+     {'ix_recipe_chef_id_date_of_publish_recipe_id'}),
+    ('one recipe', lambda p, s: recipe_logic.list_one_recipe(p.recipe.recipe_id, 3, s),
+     {'ix_recipe_image_recipe_id', 'ix_recipe_review_recipe_id_date_of_publish_review_id'}),
+    ('recipe reviews', lambda p, s: recipe_logic.list_recipe_reviews(p.recipe.recipe_id, 'newest', None, 20, s),
+     {'ix_recipe_review_recipe_id_date_of_publish_review_id'}),
+    ('chef recipes', lambda p, s: recipe_logic.all_recipes_of_one_chef(s, p.reviewer.chef_id),
+     {'ix_recipe_chef_id_date_of_publish_recipe_id', 'ix_recipe_image_recipe_id'}),
+    ('export by chef', export_by_chef,
+     {'ix_recipe_chef_id_date_of_publish_recipe_id', 'ix_recipe_image_recipe_id'}),
+    ('current user', lambda p, s: chef_logic.get_current_user(p.token, s), set()),
+    ('recipe removal', lambda p, s: recipe_logic.remove_recipe(p.recipe.recipe_id, s, p.recipe.chef_id),
+     {'ix_recipe_review_recipe_id_date_of_publish_review_id', 'ix_recipe_image_recipe_id'}),
+    ('account removal', lambda p, s: chef_logic.remove_account(s, p.principal),
+     {'ix_recipe_review_chef_id_recipe_id', 'ix_recipe_chef_id_date_of_publish_recipe_id'}),
+]
+
+
+@pytest.mark.parametrize('call, expected', [check[1:] for check in CHECKS],
+                         ids=[check[0] for check in CHECKS])
+def test_query_plan(plans, call, expected):
+    statements = plans.run(call)
+    assert statements, 'no statements recorded'
+    executed = explain(statements)
+    details = [detail for _, plan in executed for detail in plan]
+    shown = '\n'.join(f"{' '.join(statement.split())[:120]}\n  " + '\n  '.join(plan)
+                      for statement, plan in executed)
+    assert not [detail for detail in details if FULL_SCAN.match(detail)], f'full scan:\n{shown}'
+    unused = [index for index in sorted(expected)
+              if not any(re.search(rf'\b{index}\b', detail) for detail in details)]
+    assert not unused, f'not used: {unused}\n{shown}'
@@ -0,0 +1,116 @@
+import fakeredis
+import jwt
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+
+import redis_client
+from config import settings
+from db import db_connection, replicas
+
+
+@pytest.fixture
+def replica_set(run, tmp_path):
+    engines = {'replica-0':create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/replica-0.db'),
+               'replica-1':create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/replica-1.db'),
+               # a file in a missing directory can not be opened
+               'broken':create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/missing/broken.db')}
+    yield replicas.ReplicaSet(engines)
+    for engine in engines.values():
+        run(engine.dispose())
+
+
+@pytest.fixture(autouse=True)
+def recent_writes(monkeypatch):
+    monkeypatch.setattr(replicas, '_recent_writes', {})
+
+
+def request_of(username=None):
+    headers = []
+    if username:
+        token = jwt.encode({'sub':username}, settings.SECRET, algorithm=settings.ALGORITHM)
+        headers.append((b'authorization', f'Bearer {token}'.encode()))
+    return Request({'type':'http', 'headers':headers})
+
+
+def test_reads_take_turns_over_the_healthy_replicas(replica_set):
+    replica_set.eject('broken', 'test')
+
+    picked = [replica_set.pick()[0] for _ in range(4)]
+
+    assert sorted(picked) == ['replica-0', 'replica-0', 'replica-1', 'replica-1']
+    assert picked[0] != picked[1]
+
+
+def test_ejected_replicas_are_skipped_until_admitted(replica_set):
+    for name in ('replica-1', 'broken'):
+        replica_set.eject(name, 'test')
+    assert {replica_set.pick()[0] for _ in range(3)} == {'replica-0'}
+
+    replica_set.eject('replica-0', 'test')
+    assert replica_set.pick() is None
+
+    replica_set.admit('replica-1')
+    assert replica_set.pick()[0] == 'replica-1'
+
+
+def test_health_check_ejects_and_admits(run, replica_set):
+    replica_set.eject('replica-0', 'test')
+
+    run(replica_set.check())
+
+    assert replica_set.healthy == {'replica-0', 'replica-1'}
+
+
+def test_failing_statement_ejects_its_replica(run, replica_set):
+    async def query():
+        async with replica_set.engines['broken'].connect() as connection:
+            await connection.execute(text('SELECT 1'))
+
+    with pytest.raises(OperationalError):
+        run(query())
+
+    assert 'broken' not in replica_set.healthy
+
+
+def test_writes_are_remembered_locally_and_in_redis(run):
+    async def scenario():
+        await replicas.mark_write('amy')
+        local = await replicas.wrote_recently('amy'), await replicas.wrote_recently('bob')
+        # another worker only has the Redis mark
+        replicas._recent_writes.clear()
+        shared = await replicas.wrote_recently('amy')
+        return local, shared, await replicas.wrote_recently(None)
+
+    assert run(scenario()) == ((True, False), True, False)
+
+
+def test_without_redis_reads_stay_on_the_primary(run, monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redis_client, '_client', fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+
+    assert run(replicas.wrote_recently('amy'))
+
+
+def test_chef_who_just_wrote_reads_from_the_primary(run, replica_set, monkeypatch):
+    monkeypatch.setattr(db_connection, 'replica_set', replica_set)
+    replica_set.eject('broken', 'test')
+
+    async def bind_of(request):
+        async for session in db_connection.get_routed_read_db(request):
+            return session.bind
+
+    async def scenario():
+        before = await bind_of(request_of('amy'))
+        async for _ in db_connection.get_routed_write_db(request_of('amy')):
+            pass
+        return before, await bind_of(request_of('amy')), await bind_of(request_of())
+
+    before, after, anonymous = run(scenario())
+
+    assert before in (replica_set.engines['replica-0'], replica_set.engines['replica-1'])
+    assert after is db_connection.async_engine
+    assert anonymous is not db_connection.async_engine
@@ -0,0 +1,63 @@
+import uuid
+from datetime import datetime
+
+import fastapi.routing
+import orjson
+
+from responses import JSONBytesResponse, dumps
+from schemas import Cuisine, Recipe_Schema_Out
+from conftest import sign_in
+
+
+def recipe(**fields):
+    return Recipe_Schema_Out(name='Tacos', cusine=Cuisine.MEXICAN, cooking_instructions='fold',
+                             chef_id=uuid.UUID(int=1), recipe_id=uuid.UUID(int=2), ingredients='corn',
+                             date_of_publish=datetime(2024, 5, 1, 12, 30), images=[], total_likes=0,
+                             total_dislikes=0, total_reviews=0, average_rating=0.0,
+                             ratings_histogram={}, **fields)
+
+
+def test_dumps_encodes_models_in_one_pass():
+    payload = orjson.loads(dumps(recipe()))
+
+    assert payload['cusine'] == 'Mexican'
+    assert payload['recipe_id'] == str(uuid.UUID(int=2))
+    assert payload['date_of_publish'] == '2024-05-01T12:30:00'
+    # unset fields are left out
+    assert 'latest_reviews' not in payload
+    assert 'latest_reviews' in orjson.loads(dumps(recipe(latest_reviews=[])))
+
+
+def test_dumps_takes_plain_payloads():
+    assert dumps({uuid.UUID(int=3):[Cuisine.ITALIAN]}) == b'{"%s":["Italian"]}' % str(uuid.UUID(int=3)).encode()
+
+
+def test_bytes_response_is_sent_as_it_is():
+    response = JSONBytesResponse(b'{"a":1}', headers={'ETag':'W/"1"'})
+
+    assert response.body == b'{"a":1}'
+    assert response.headers['content-type'] == 'application/json'
+
+
+# a cached route's body is encoded once, by dumps, and never goes through
+# FastAPI's response model serialization
+def test_recipe_routes_skip_the_response_model(client, monkeypatch):
+    headers = sign_in(client, 'amy')
+    client.post('/recipe/create', headers=headers,
+                data={'name':'Tacos', 'cusine':'Mexican', 'ingrediensts':'corn', 'cooking_instructions':'fold'})
+    recipe_id = client.get('/recipe/all').json()['recipes'][0]['recipe_id']
+    serialized = []
+    serialize_response = fastapi.routing.serialize_response
+
+    async def recording(**kwargs):
+        serialized.append(kwargs['field'])
+        return await serialize_response(**kwargs)
+
+    monkeypatch.setattr(fastapi.routing, 'serialize_response', recording)
+    one = client.get(f'/recipe/one/{recipe_id}')
+    page = client.get('/recipe/all')
+
+    assert serialized == []
+    assert one.headers['content-type'] == 'application/json'
+    assert one.content == dumps(orjson.loads(one.content))
+    assert page.json()['recipes'][0] == one.json()
@@ -0,0 +1,86 @@
+import uuid
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import insert
+
+from db import db_connection
+from models import ENUM_CODES, Chef, Recipe, Recipe_Review
+from schemas import Ratings, VoteType
+
+RATINGS = [Ratings.EXCELLENT, Ratings.SATISFACTORY, Ratings.EXCELLENT, Ratings.UNPALATABLE,
+           Ratings.VERY_GOOD, Ratings.SATISFACTORY, Ratings.EXCELLENT]
+
+
+# one review per chef, dates and ratings repeat so review_id has to break
+# the ties
+async def add_reviews():
+    async with db_connection.WriteSessionLocal() as session:
+        chefs = [{'chef_id':uuid.uuid4(), 'username':f'chef{number}', 'password':'x',
+                  'email':f'chef{number}@example.com', 'date_of_birth':date(1990, 1, 1)}
+                 for number in range(len(RATINGS))]
+        await session.execute(insert(Chef), chefs)
+        recipe_id = uuid.uuid4()
+        await session.execute(insert(Recipe).values(recipe_id=recipe_id, name='Risotto', cusine='Italian',
+                                                    ingredients='rice', cooking_instructions='stir',
+                                                    chef_id=chefs[0]['chef_id']))
+        reviews = [{'review_id':uuid.uuid4(), 'recipe_id':recipe_id, 'chef_id':chef['chef_id'],
+                    'comment_description':'ok', 'ratings':ratings, 'vote_type':VoteType.LIKE,
+                    'date_of_publish':datetime(2024, 1, 1 + number // 2)}
+                   for number, (chef, ratings) in enumerate(zip(chefs, RATINGS))]
+        await session.execute(insert(Recipe_Review), reviews)
+        await session.commit()
+    return recipe_id, reviews
+
+
+def pages(client, recipe_id, **params):
+    seen, cursor = [], None
+    while True:
+        response = client.get(f'/recipe/{recipe_id}/reviews',
+                              params={**params, **({'cursor':cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        seen.append([review['review_id'] for review in body['reviews']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return seen
+
+
+ORDERS = {
+    'newest':(lambda review: (review['date_of_publish'], review['review_id']), True),
+    'oldest':(lambda review: (review['date_of_publish'], review['review_id']), False),
+    'highest':(lambda review: (ENUM_CODES[Ratings][review['ratings']], review['review_id']), True),
+    'lowest':(lambda review: (ENUM_CODES[Ratings][review['ratings']], review['review_id']), False),
+}
+
+
+@pytest.mark.parametrize('sort', ORDERS)
+def test_pages_follow_the_order_asked_for(client, sort):
+    recipe_id, reviews = client.portal.call(add_reviews)
+    key, descending = ORDERS[sort]
+
+    seen = pages(client, recipe_id, sort=sort, page_size=3)
+
+    assert [len(page) for page in seen] == [3, 3, 1]
+    expected = sorted(reviews, key=key, reverse=descending)
+    assert [review_id for page in seen for review_id in page] == [str(review['review_id']) for review in expected]
+
+
+def test_recipe_payload_does_not_embed_the_reviews(client):
+    recipe_id, _ = client.portal.call(add_reviews)
+
+    recipe = client.get(f'/recipe/one/{recipe_id}').json()
+    latest = client.get(f'/recipe/one/{recipe_id}', params={'latest_reviews':2}).json()
+
+    assert 'reviews' not in recipe and 'latest_reviews' not in recipe
+    assert [review['date_of_publish'] for review in latest['latest_reviews']] == ['2024-01-04T00:00:00',
+                                                                                 '2024-01-03T00:00:00']
+
+
+def test_unknown_recipe_and_bad_cursor(client):
+    recipe_id, _ = client.portal.call(add_reviews)
+
+    assert client.get(f'/recipe/{uuid.uuid4()}/reviews').status_code == 404
+    response = client.get(f'/recipe/{recipe_id}/reviews', params={'sort':'highest', 'cursor':'bm90IGEgbGlzdA'})
+    assert response.status_code == 400
+    assert client.get(f'/recipe/{recipe_id}/reviews', params={'sort':'best'}).status_code == 422
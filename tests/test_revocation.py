@@ -0,0 +1,108 @@
+import time
+
+import fakeredis
+import jwt
+
+import redis_client
+import revocation
+from conftest import sign_in
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def tokens(client, username):
+    sign_in(client, username)
+    response = client.post('/chef/sign_in', data={'username':username, 'password':'secret1'})
+    return response.json()
+
+
+def test_logout_revokes_the_refresh_token_and_its_access_tokens(client):
+    issued = tokens(client, 'amy')
+    headers = {'Authorization':f"Bearer {issued['access_token']}"}
+    refreshed = client.post('/chef/new_access_token', headers={'token':issued['refresh_token']}).json()
+    assert client.get('/chef/all', headers=headers).status_code == 200
+
+    response = client.post('/chef/logout', headers={'token':issued['refresh_token']})
+
+    assert response.status_code == 200
+    assert client.get('/chef/all', headers=headers).status_code == 401
+    assert client.get('/chef/all', headers={'Authorization':f"Bearer {refreshed['access_token']}"}).status_code == 401
+    assert client.post('/chef/new_access_token', headers={'token':issued['refresh_token']}).status_code == 401
+    jti = jwt.decode(issued['refresh_token'], options={'verify_signature':False})['jti']
+    assert client.portal.call(redis_client.get_redis().ttl, f'blacklist:{jti}') > 0
+
+
+def test_second_logout_with_the_same_token_is_refused(client):
+    issued = tokens(client, 'amy')
+
+    assert client.post('/chef/logout', headers={'token':issued['refresh_token']}).status_code == 200
+    response = client.post('/chef/logout', headers={'token':issued['refresh_token']})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Token already blacklisted'
+
+
+def test_other_sessions_stay_signed_in(client):
+    first, second = tokens(client, 'amy'), tokens(client, 'bob')
+
+    client.post('/chef/logout', headers={'token':first['refresh_token']})
+
+    assert client.get('/chef/all', headers={'Authorization':f"Bearer {second['access_token']}"}).status_code == 200
+
+
+def test_logout_fails_loudly_when_redis_is_down(client, monkeypatch):
+    issued = tokens(client, 'amy')
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redis_client, '_client', fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+
+    response = client.post('/chef/logout', headers={'token':issued['refresh_token']})
+
+    assert response.status_code == 503
+
+
+def test_revocation_published_by_another_worker_is_checked_locally(client):
+    issued = tokens(client, 'amy')
+    headers = {'Authorization':f"Bearer {issued['access_token']}"}
+    jti = jwt.decode(issued['refresh_token'], options={'verify_signature':False})['jti']
+
+    client.portal.call(redis_client.get_redis().publish, revocation.CHANNEL, f'{jti} {time.time() + 60}')
+
+    wait_for(lambda: jti in revocation.revoked)
+    assert client.get('/chef/all', headers=headers).status_code == 401
+
+
+def test_tokens_revoked_before_the_worker_started_are_loaded(run):
+    async def scenario():
+        await redis_client.get_redis().set('blacklist:earlier', 'true', ex=60)
+        await revocation.start()
+        try:
+            return 'earlier' in revocation.revoked
+        finally:
+            await revocation.stop()
+
+    assert run(scenario())
+
+
+def test_entries_expire_with_the_token():
+    revoked = revocation.RevocationSet()
+    revoked.add('kept', time.time() + 60)
+    revoked.add('expired', time.time() - 1)
+
+    assert 'kept' in revoked
+    assert 'expired' not in revoked
+    # a later add purges what has expired
+    revoked._next_purge = 0
+    revoked.add('other', time.time() + 60)
+    assert len(revoked) == 2
+
+
+def test_malformed_message_is_ignored():
+    revocation._apply('no-expiry')
+
+    assert 'no-expiry' not in revocation.revoked
@@ -0,0 +1,142 @@
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from db import db_connection
+from models import Chef, Recipe, Recipe_Review
+from routes import chef_logic, recipe_logic
+from schemas import Cuisine, Ratings, VoteType
+import trending
+
+HALF_LIFE = timedelta(hours=24)
+
+
+async def add_chef(username):
+    async with db_connection.WriteSessionLocal() as session:
+        chef_id = uuid.uuid4()
+        await session.execute(insert(Chef).values(chef_id=chef_id, username=username, password='x',
+                                                  email=f'{username}@example.com',
+                                                  date_of_birth=date(1990, 1, 1)))
+        await session.commit()
+    return chef_logic.Principal(username=username, chef_id=chef_id)
+
+
+async def add_recipe(chef, cuisine=Cuisine.ITALIAN):
+    async with db_connection.WriteSessionLocal() as session:
+        recipe_id = uuid.uuid4()
+        await session.execute(insert(Recipe).values(recipe_id=recipe_id, name='Risotto', cusine=cuisine,
+                                                    ingredients='rice', cooking_instructions='stir',
+                                                    chef_id=chef.chef_id))
+        await session.commit()
+    return recipe_id
+
+
+async def review(recipe_id, chef, ratings=Ratings.EXCELLENT, vote_type=VoteType.LIKE):
+    async with db_connection.WriteSessionLocal() as session:
+        await recipe_logic.recipe_review(recipe_id, 'good', ratings, vote_type, session, chef.chef_id)
+
+
+# a review stored without going through recipe_review, so without its increment
+async def stored_review(recipe_id, chef, published=None):
+    async with db_connection.WriteSessionLocal() as session:
+        review_id = uuid.uuid4()
+        published = published or datetime.now()
+        await session.execute(insert(Recipe_Review).values(
+            review_id=review_id, recipe_id=recipe_id, chef_id=chef.chef_id, comment_description='ok',
+            ratings=Ratings.EXCELLENT, vote_type=VoteType.LIKE, date_of_publish=published))
+        await session.commit()
+    return (review_id, recipe_id, Cuisine.ITALIAN, Ratings.EXCELLENT, VoteType.LIKE, published)
+
+
+async def rebuild():
+    async with db_connection.AsyncSessionLocal() as session:
+        return await trending.rebuild(session)
+
+
+async def scores():
+    return dict(await trending.top(None, 10))
+
+
+def test_scores_halve_every_half_life(run):
+    async def scenario():
+        chef = await add_chef('amy')
+        fresh, old = await add_recipe(chef), await add_recipe(chef)
+        now = datetime.now()
+        await trending.record_reviews([
+            (uuid.uuid4(), fresh, Cuisine.ITALIAN, Ratings.EXCELLENT, VoteType.LIKE, now),
+            (uuid.uuid4(), old, Cuisine.ITALIAN, Ratings.EXCELLENT, VoteType.LIKE, now - HALF_LIFE)])
+        return await scores(), fresh, old
+
+    ranked, fresh, old = run(scenario())
+
+    assert ranked[fresh] == pytest.approx(3.0, rel=1e-3)
+    assert ranked[old] == pytest.approx(1.5, rel=1e-3)
+
+
+def test_rebuild_recounts_the_reviews(run):
+    async def scenario():
+        chef, other = await add_chef('amy'), await add_chef('bob')
+        recipe_id = await add_recipe(chef)
+        await stored_review(recipe_id, chef, datetime.now() - 2 * HALF_LIFE)
+        await stored_review(recipe_id, other)
+        counted = await rebuild()
+        return counted, await scores(), recipe_id
+
+    counted, ranked, recipe_id = run(scenario())
+
+    assert counted == 2
+    assert ranked[recipe_id] == pytest.approx(3.0 + 0.75, rel=1e-3)
+
+
+def test_removed_account_takes_its_points_back(run):
+    async def scenario():
+        chef, reviewer = await add_chef('amy'), await add_chef('bob')
+        recipe_id = await add_recipe(chef)
+        await review(recipe_id, chef, Ratings.SATISFACTORY)
+        await review(recipe_id, reviewer)
+        before = await scores()
+        async with db_connection.WriteSessionLocal() as session:
+            await chef_logic.remove_account(session, reviewer)
+        return before, await scores(), recipe_id
+
+    before, after, recipe_id = run(scenario())
+
+    assert before[recipe_id] == pytest.approx(2.0 + 3.0, rel=1e-3)
+    assert after[recipe_id] == pytest.approx(2.0, rel=1e-3)
+
+
+# reviews recorded while the rebuild runs, committed before or after its
+# snapshot, end up counted exactly once
+def test_rebuild_counts_concurrent_reviews_once(run, monkeypatch):
+    add_scores = trending._add_scores
+
+    async def scenario():
+        chef, first, second, third = [await add_chef(name) for name in ('amy', 'bob', 'cy', 'dee')]
+        recipe_id = await add_recipe(chef)
+        # committed before the rebuild, its increment only arrives once it runs
+        late = await stored_review(recipe_id, first)
+        removed = await add_chef('eve')
+        await review(recipe_id, removed, Ratings.SATISFACTORY)
+
+        async def interleaved(client, epoch, scores):
+            monkeypatch.setattr(trending, '_add_scores', add_scores)
+            await trending.record_reviews([late])
+            # committed after the snapshot
+            await review(recipe_id, second, Ratings.VERY_GOOD)
+            async with db_connection.WriteSessionLocal() as session:
+                await chef_logic.remove_account(session, removed)
+            await add_scores(client, epoch, scores)
+
+        monkeypatch.setattr(trending, '_add_scores', interleaved)
+        await rebuild()
+        settled = await scores()
+        await review(recipe_id, third)
+        await rebuild()
+        return settled, await scores(), recipe_id
+
+    settled, recounted, recipe_id = run(scenario())
+
+    assert settled[recipe_id] == pytest.approx(3.0 + 2.5, rel=1e-3)
+    assert recounted[recipe_id] == pytest.approx(3.0 + 2.5 + 3.0, rel=1e-3)
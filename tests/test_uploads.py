@@ -0,0 +1,103 @@
+import asyncio
+import io
+import os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import uploads
+
+LIMIT = 600 * 1024
+
+
+def upload(name, data):
+    return UploadFile(file=io.BytesIO(data), filename=name)
+
+
+async def publish(directory, *files):
+    async with uploads.ingest(list(files), directory, LIMIT) as paths:
+        return paths
+
+
+def leftovers(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.part')]
+
+
+def test_rejected_upload_keeps_published_file(tmp_path):
+    directory = str(tmp_path)
+    (published,) = asyncio.run(publish(directory, upload('a.png', b'a' * 1024)))
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(publish(directory, upload('a.png', b'a' * 1024),
+                            upload('big.png', b'b' * 768 * 1024)))
+
+    assert error.value.status_code == 413
+    assert os.path.exists(published)
+    assert not leftovers(directory)
+
+
+def test_failed_commit_keeps_published_files(tmp_path):
+    directory = str(tmp_path)
+    (existing,) = asyncio.run(publish(directory, upload('a.png', b'a' * 1024)))
+
+    async def failing_commit():
+        async with uploads.ingest([upload('a.png', b'a' * 1024), upload('c.png', b'c' * 1024)],
+                                  directory, LIMIT) as paths:
+            assert all(os.path.exists(path) for path in paths)
+            raise RuntimeError('commit failed')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing_commit())
+
+    # the new file is an orphan now, left for upload_gc
+    assert len(os.listdir(directory)) == 2
+    assert os.path.exists(existing)
+    assert not leftovers(directory)
+
+
+def test_failed_first_ingest_keeps_file_committed_by_second(tmp_path):
+    directory = str(tmp_path)
+
+    async def interleaved():
+        linked = asyncio.Event()
+        committed = asyncio.Event()
+
+        async def first():
+            async with uploads.ingest([upload('a.png', b'a' * 1024)], directory, LIMIT):
+                linked.set()
+                await committed.wait()
+                raise RuntimeError('commit failed')
+
+        async def second():
+            await linked.wait()
+            async with uploads.ingest([upload('b.png', b'a' * 1024)], directory, LIMIT) as paths:
+                pass
+            committed.set()
+            return paths
+
+        return await asyncio.gather(first(), second(), return_exceptions=True)
+
+    failed, (path,) = asyncio.run(interleaved())
+
+    assert isinstance(failed, RuntimeError)
+    assert os.path.exists(path)
+    assert not leftovers(directory)
+
+
+def test_orphans_skip_referenced_and_recent_files(tmp_path):
+    directory = str(tmp_path)
+    kept, orphan, recent = asyncio.run(publish(directory, upload('a.png', b'a' * 1024),
+                                               upload('b.png', b'b' * 1024),
+                                               upload('c.png', b'c' * 1024)))
+    for path in (kept, orphan):
+        os.utime(path, (0, 0))
+
+    assert uploads.find_orphans(directory, {kept}, 60) == [orphan]
+
+
+def test_same_content_twice_is_stored_once(tmp_path):
+    directory = str(tmp_path)
+    paths = asyncio.run(publish(directory, upload('a.png', b'a' * 1024), upload('b.png', b'a' * 1024)))
+
+    assert len(set(paths)) == 1
+    assert os.listdir(directory) == [os.path.basename(paths[0])]